@@ -0,0 +1,90 @@
+"""
+Photo comment threads.
+
+Every reply records the top-level comment of its thread (PhotoComment.root),
+so a page of threads is two queries however deep or busy they are: the
+top-level comments (with their reply counts) and the first few replies of
+each, picked per thread with a window function. The reply trees are then
+assembled in memory; the rest of a thread is fetched on demand with
+``thread_replies``.
+
+Replies are ordered by id, so any prefix of a thread already contains the
+parents of everything in it and always forms a tree.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from homepage.models import PhotoComment
+
+COMMENT_PAGE_SIZE = 20
+REPLY_PREVIEW = 3
+REPLY_PAGE_SIZE = 20
+
+
+def comment_queryset():
+    return PhotoComment.objects.select_related('user__profile')
+
+
+def top_level_comments(photo_id):
+    """Top-level comments of a photo, annotated with their total reply count."""
+    counts = (
+        PhotoComment.objects.filter(root=OuterRef('pk')).order_by()
+        .values('root').annotate(n=Count('id')).values('n')
+    )
+    return (
+        comment_queryset()
+        .filter(photo_id=photo_id, parent__isnull=True)
+        .annotate(reply_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+    )
+
+
+def attach_reply_previews(roots, limit=REPLY_PREVIEW):
+    """
+    Load the first ``limit`` replies of every thread in one query and hang
+    them under their parents (``_replies``). Sets ``more_replies_after``
+    on each root: the id to pass to thread_replies, or None if all shown.
+    """
+    by_root = {}
+    if roots:
+        previews = (
+            comment_queryset()
+            .filter(root__in=roots)
+            .annotate(position=Window(RowNumber(), partition_by=F('root_id'), order_by=F('id').asc()))
+            .filter(position__lte=limit)
+            .order_by('id')
+        )
+        for reply in previews:
+            by_root.setdefault(reply.root_id, []).append(reply)
+
+    for root in roots:
+        replies = by_root.get(root.id, [])
+        build_tree(root, replies)
+        shown = len(replies)
+        root.more_replies_after = replies[-1].id if replies and root.reply_count > shown else None
+    return roots
+
+
+def build_tree(root, replies):
+    """Nest ``replies`` (ordered by id) under ``root``; returns the replies whose parent is not loaded."""
+    nodes = {root.id: root}
+    root._replies = []
+    orphans = []
+    for reply in replies:
+        reply._replies = []
+        nodes[reply.id] = reply
+        parent = nodes.get(reply.parent_id)
+        (parent._replies if parent is not None else orphans).append(reply)
+    return orphans
+
+
+def thread_replies(root, after_id=0, page_size=REPLY_PAGE_SIZE):
+    """
+    The next ``page_size`` replies of a thread after ``after_id``, in id
+    order, and the cursor for the page after (None at the end).
+    """
+    page = list(comment_queryset().filter(root=root, id__gt=after_id).order_by('id')[:page_size + 1])
+    more = len(page) > page_size
+    page = page[:page_size]
+    for reply in page:
+        reply._replies = []
+    return page, (page[-1].id if more else None)
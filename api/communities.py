@@ -0,0 +1,59 @@
+"""
+Community queries and permission checks shared by the community endpoints.
+
+Roles come from homepage.membership_cache, so a member polling a room
+costs no permission query at all; the community row is only looked up
+when the check fails, to tell a missing community (404) from a closed
+one (403).
+
+The community list is one query: membership and the admin flag are
+Exists() subqueries on the (community, user) unique index, and the member
+count is the denormalized Community.member_count column (reconciled by
+``manage.py rebuild_member_counts``).
+
+Member lists are filtered in the database (role, username prefix) and
+paged by username with api.pagination.MemberCursorPagination.
+"""
+from django.db.models import Exists, OuterRef
+from django.http import Http404
+from rest_framework.exceptions import PermissionDenied, ValidationError
+
+from homepage import membership_cache
+from homepage.models import Community, CommunityMembership
+
+NOT_MEMBER_MESSAGE = 'You are not a member of this community.'
+
+
+def require_member(user, community_id, admin=False, message=NOT_MEMBER_MESSAGE):
+    """
+    The role of ``user`` in community ``community_id``. Raises Http404 if
+    the community does not exist and PermissionDenied(``message``) if the
+    user is not a member (or, with ``admin``, not an admin).
+    """
+    role = membership_cache.role(community_id, user.pk)
+    if role == CommunityMembership.ROLE_ADMIN or (role and not admin):
+        return role
+    if not Community.objects.filter(pk=community_id).exists():
+        raise Http404('No Community matches the given query.')
+    raise PermissionDenied(message)
+
+
+def community_list(user):
+    """Communities ``user`` belongs to, annotated with ``is_admin``."""
+    memberships = CommunityMembership.objects.filter(community=OuterRef('pk'), user=user)
+    return (
+        Community.objects.filter(Exists(memberships))
+        .annotate(is_admin=Exists(memberships.filter(role=CommunityMembership.ROLE_ADMIN)))
+    )
+
+
+def member_list(community_id, role=None, prefix=None):
+    """Memberships of a community, optionally only ``role`` or usernames starting with ``prefix``."""
+    queryset = CommunityMembership.objects.filter(community_id=community_id).select_related('user__profile')
+    if role:
+        if role not in dict(CommunityMembership.ROLE_CHOICES):
+            raise ValidationError({'role': 'Must be one of: %s.' % ', '.join(dict(CommunityMembership.ROLE_CHOICES))})
+        queryset = queryset.filter(role=role)
+    if prefix:
+        queryset = queryset.filter(user__username__istartswith=prefix)
+    return queryset
@@ -0,0 +1,84 @@
+"""
+WebSocket consumers.
+
+ws/chat/                                  -> global chat events
+ws/communities/<community_id>/chat/       -> community chat events (members only;
+                                             closed with 4403 when the member is removed)
+
+Events pushed to the client look like:
+    { "event": "message.created",   "payload": { ...ChatMessageSerializer... } }
+    { "event": "message.deleted",   "payload": { "id": 12, "community_id": 3 } }
+    { "event": "reactions.updated", "payload": { "id": 12, "community_id": 3, "reactions": [...] } }
+"""
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from homepage import membership_cache
+
+from .realtime import chat_group_name
+
+# Application close codes (4000-4999 are free for application use)
+CLOSE_UNAUTHENTICATED = 4401
+CLOSE_FORBIDDEN = 4403
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.close(code=CLOSE_UNAUTHENTICATED)
+            return
+
+        self.community_id = self.scope['url_route']['kwargs'].get('community_id')
+        if self.community_id and not await self._is_member(user, self.community_id):
+            await self.close(code=CLOSE_FORBIDDEN)
+            return
+
+        self.group_name = chat_group_name(self.community_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        group_name = getattr(self, 'group_name', None)
+        if group_name:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # The socket is push-only; writes still go through the REST endpoints.
+        if content.get('type') == 'ping':
+            await self.send_json({'event': 'pong'})
+
+    async def chat_event(self, event):
+        await self.send_json({
+            'event': event['event'],
+            'payload': self._personalize(event['payload']),
+        })
+
+    async def chat_member_removed(self, event):
+        # Sent to the whole room; only the removed member's sockets go
+        if event['user_id'] == self.scope['user'].pk:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            self.group_name = None
+            await self.close(code=CLOSE_FORBIDDEN)
+
+    def _personalize(self, payload):
+        """Fill in the per-recipient ``is_me`` flags the broadcast cannot know."""
+        me = self.scope['user'].username
+        payload = dict(payload)
+        if 'username' in payload:
+            payload['is_me'] = payload['username'] == me
+        if 'reactions' in payload:
+            payload['reactions'] = [
+                {
+                    **group,
+                    'users': [{**u, 'is_me': u['username'] == me} for u in group['users']],
+                }
+                for group in payload['reactions']
+            ]
+        return payload
+
+    @database_sync_to_async
+    def _is_member(self, user, community_id):
+        # Same rule (and cache) as the REST views; a missing community has no memberships.
+        return bool(membership_cache.role(community_id, user.pk))
@@ -0,0 +1,68 @@
+"""
+DM inbox queries.
+
+The thread list needs, per conversation: the other participant, the last
+message, the viewer's unread count and the other side's read marker. All
+of it is computed by the database as correlated subqueries on the
+(conversation, id) index and the participant rows, so a page of threads
+costs one query plus one to load the other participants' profiles,
+whatever the number of threads or messages.
+"""
+from django.contrib.auth.models import User
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, When
+from django.db.models.functions import Coalesce
+
+from homepage.models import Conversation, ConversationParticipant, DirectMessage
+
+
+def inbox_queryset(user):
+    """1:1 conversations of ``user`` annotated with everything the inbox renders."""
+    messages = DirectMessage.objects.filter(conversation=OuterRef('pk')).order_by('-id')
+    members = ConversationParticipant.objects.filter(conversation=OuterRef('pk'))
+    # Unread = messages from the other side past my read marker: a range
+    # count on (conversation, id) rather than a scan of per-message flags.
+    unread = (
+        DirectMessage.objects
+        .filter(conversation=OuterRef('pk'), id__gt=OuterRef('my_last_read_id'))
+        .exclude(sender=user)
+        .order_by()
+        .values('conversation')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+
+    # DMs are found through the canonical (dm_user_low, dm_user_high) pair
+    # (migration 0020 merged older duplicates into it). A deleted account
+    # nulls its side of the pair: the thread stays listed, with no
+    # other_user_id (the serializer renders other_user as null).
+    return (
+        Conversation.objects
+        .filter(Q(dm_user_low=user) | Q(dm_user_high=user))
+        .annotate(
+            other_user_id=Case(
+                When(dm_user_low=user, then=F('dm_user_high')),
+                default=F('dm_user_low'),
+                output_field=IntegerField(),
+            ),
+            last_message_id=Subquery(messages.values('id')[:1]),
+            last_message_text=Subquery(messages.values('text')[:1]),
+            last_message_created_at=Subquery(messages.values('created_at')[:1]),
+            last_message_username=Subquery(messages.values('sender__username')[:1]),
+            my_last_read_id=Coalesce(
+                Subquery(members.filter(user=user).values('last_read_message_id')[:1]), 0
+            ),
+            other_last_read_id=Coalesce(
+                Subquery(members.exclude(user=user).values('last_read_message_id')[:1]), 0
+            ),
+        )
+        .annotate(unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), 0))
+    )
+
+
+def attach_other_users(threads):
+    """Load the other participant (with profile) of every annotated thread in one query."""
+    ids = {t.other_user_id for t in threads if t.other_user_id}
+    users = User.objects.select_related('profile').in_bulk(ids)
+    for thread in threads:
+        thread.inbox_other_user = users.get(thread.other_user_id)
+    return threads
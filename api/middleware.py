@@ -0,0 +1,35 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+
+
+@database_sync_to_async
+def get_user_from_token(raw_token):
+    """Resolve a SimpleJWT access token to a user (AnonymousUser if invalid)."""
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+    auth = JWTAuthentication()
+    try:
+        validated = auth.get_validated_token(raw_token)
+        return auth.get_user(validated)
+    except (InvalidToken, AuthenticationFailed):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    WebSocket auth using the same JWT access token as the REST API.
+
+    Browsers cannot set an Authorization header on a WebSocket handshake,
+    so the token is passed as ``?token=<access>`` in the query string.
+    """
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        token = (query.get('token') or [None])[0]
+        scope = dict(scope)
+        scope['user'] = await get_user_from_token(token) if token else AnonymousUser()
+        return await super().__call__(scope, receive, send)
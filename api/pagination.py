@@ -0,0 +1,91 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Chat-style lists are paged on the primary key rather than with OFFSET so
+that a poll for "anything newer than what I have" is a single index range
+scan, no matter how long the history is.
+"""
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+
+MESSAGE_PAGE_SIZE = 50
+
+
+def _id_param(request, name):
+    raw = request.query_params.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'Must be an integer message id.'})
+    if value < 0:
+        raise ValidationError({name: 'Must be an integer message id.'})
+    return value
+
+
+def message_keyset_page(queryset, request, page_size=MESSAGE_PAGE_SIZE):
+    """
+    Return one page of messages as a list, oldest first.
+
+    ?after_id=<id>  -> up to page_size messages newer than <id> (polling)
+    ?before_id=<id> -> up to page_size messages older than <id> (scroll back)
+    neither         -> the latest page_size messages
+
+    The queryset must already be scoped to one room/thread so the range
+    scan can use the (room, id) index.
+    """
+    after_id = _id_param(request, 'after_id')
+    before_id = _id_param(request, 'before_id')
+    if after_id is not None and before_id is not None:
+        raise ValidationError({'detail': 'Use either after_id or before_id, not both.'})
+
+    if after_id is not None:
+        return list(queryset.filter(id__gt=after_id).order_by('id')[:page_size])
+
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    page = list(queryset.order_by('-id')[:page_size])
+    page.reverse()
+    return page
+
+
+class InboxCursorPagination(CursorPagination):
+    """
+    DM thread list, most recently active first.
+
+    Keyset on (updated_at, id): the next page is "threads updated before
+    the last one shown", with an opaque ?cursor= token in ``next``.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-updated_at', '-id')
+
+
+class CommunityCursorPagination(CursorPagination):
+    """Communities of the current user, by name; keyset on (name, id)."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('name', 'id')
+
+
+class MemberCursorPagination(CursorPagination):
+    """
+    Community members by username; keyset on (username, id).
+
+    Usernames are unique, so the position is the username of the last
+    member shown and the next page is "members named after it". The
+    membership id only breaks ties in the ordering.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('user__username', 'id')
+
+    def _get_position_from_instance(self, instance, ordering):
+        value = instance
+        for attr in ordering[0].lstrip('-').split('__'):
+            value = getattr(value, attr)
+        return str(value)
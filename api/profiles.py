@@ -0,0 +1,55 @@
+"""
+Public profile bundle: everything /u/<username>/ renders in one response.
+
+The user (with profile) is looked up on every request, so renamed or
+deleted accounts never serve a stale bundle; the sections are assembled
+with one query each on a cache miss and then served from
+homepage.profile_cache until one of them changes. Like state is not part
+of the bundle (it differs per viewer): see /api/photos/likes/.
+"""
+import hashlib
+import json
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from homepage import profile_cache
+from homepage.models import Education, Experience, Skill, UserPhoto
+
+from .serializers import (
+    EducationSerializer,
+    ExperienceSerializer,
+    GalleryPhotoSerializer,
+    PublicProfileSerializer,
+    SkillSerializer,
+)
+
+
+def bundle_user(username):
+    """The user (with profile) behind ``username``, or None."""
+    return User.objects.select_related('profile').filter(username=username).first()
+
+
+def build_bundle(user):
+    """Assemble the bundle of ``user`` (one query per section)."""
+    photos = UserPhoto.objects.filter(user=user, upload_status=UserPhoto.UPLOAD_UPLOADED).order_by('-created_at')
+    data = {
+        'profile': PublicProfileSerializer(user.profile).data,
+        'education': EducationSerializer(Education.objects.filter(user=user).order_by('-start_year'), many=True).data,
+        'experience': ExperienceSerializer(Experience.objects.filter(user=user).order_by('-start_date'), many=True).data,
+        'skills': SkillSerializer(Skill.objects.filter(user=user).order_by('name'), many=True).data,
+        'photos': GalleryPhotoSerializer(photos, many=True).data,
+    }
+    # Rendered once here so the cached copy is plain JSON-safe data
+    body = JSONRenderer().render(data)
+    return {
+        'data': json.loads(body),
+        'etag': '"%s"' % hashlib.md5(body).hexdigest(),
+        'last_modified': timezone.now().replace(microsecond=0),
+    }
+
+
+def get_bundle(user):
+    """The cached bundle of ``user``, building (and caching) it on a miss."""
+    return profile_cache.get_or_build(user.id, lambda: build_bundle(user))
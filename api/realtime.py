@@ -0,0 +1,88 @@
+"""
+Real-time fan-out for global and community chat.
+
+Views call the ``broadcast_*`` helpers after a write; the helpers push an
+event to the channel layer group of the affected chat room and every
+connected ``ChatConsumer`` forwards it to its browser.
+
+Removing a member (CommunityMembership.delete) sends ``chat.member_removed``
+to the room, and that member's open sockets close themselves, so nobody
+keeps receiving a room they have left.
+
+The channel layer is configured in ``CHANNEL_LAYERS``. Without Redis the
+in-process ``InMemoryChannelLayer`` is used, which is enough for a single
+worker and for the test-suite.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def chat_group_name(community_id=None):
+    """Channel layer group for a chat room (global chat when community_id is None)."""
+    if community_id:
+        return f"chat.community.{community_id}"
+    return "chat.global"
+
+
+def _send(community_id, event_type, payload):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(
+            chat_group_name(community_id),
+            {'type': 'chat.event', 'event': event_type, 'payload': payload},
+        )
+    except Exception:
+        # Push is best-effort: clients still resync through the REST endpoints.
+        logger.exception("Failed to broadcast %s to chat room %s", event_type, community_id or 'global')
+
+
+def _send_on_commit(community_id, event_type, payload):
+    transaction.on_commit(lambda: _send(community_id, event_type, payload))
+
+
+def disconnect_member(community_id, user_id):
+    """Close the sockets ``user_id`` has open on a community room once the removal commits."""
+    def send():
+        layer = get_channel_layer()
+        if layer is None:
+            return
+        try:
+            async_to_sync(layer.group_send)(
+                chat_group_name(community_id), {'type': 'chat.member_removed', 'user_id': user_id}
+            )
+        except Exception:
+            logger.exception("Failed to disconnect user %s from chat room %s", user_id, community_id)
+    transaction.on_commit(send)
+
+
+def broadcast_message_created(message):
+    """Push a freshly created ChatMessage to everyone in its room."""
+    from .serializers import ChatMessageSerializer
+
+    payload = ChatMessageSerializer(message).data
+    _send_on_commit(message.community_id, 'message.created', payload)
+
+
+def broadcast_message_deleted(message_id, community_id=None):
+    """Tell the room that a message is gone."""
+    payload = {'id': message_id, 'community_id': community_id}
+    _send_on_commit(community_id, 'message.deleted', payload)
+
+
+def broadcast_reactions_changed(message):
+    """Push the full, regrouped reaction list of a message after a toggle."""
+    from .serializers import ChatMessageSerializer
+
+    payload = {
+        'id': message.id,
+        'community_id': message.community_id,
+        'reactions': ChatMessageSerializer(message).data['reactions'],
+    }
+    _send_on_commit(message.community_id, 'reactions.updated', payload)
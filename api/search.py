@@ -0,0 +1,157 @@
+"""
+User search (GET /api/search/users/?q=).
+
+Queries run against homepage.UserSearchDocument, one lowercased text per
+user (username, display name, title, skills), through the substring index
+migration 0030 builds for the database in use:
+
+* PostgreSQL: a pg_trgm GIN index. Candidates come from ILIKE (which the
+  index serves), ranked by username prefix first and word_similarity
+  after. The query runs under ``SET LOCAL statement_timeout`` so a
+  pathological pattern cannot hold a connection; on timeout the search
+  degrades to a username prefix match.
+* SQLite: an FTS5 table with the trigram tokenizer, ranked the same way
+  with bm25 in place of word_similarity.
+
+Trigram indexes cannot serve patterns shorter than three characters, so
+those only match username prefixes (a btree range scan).
+
+As-you-type pickers (@mentions, adding members, starting a DM) use
+``autocomplete_users`` instead: a prefix lookup in the in-process index
+of homepage.autocomplete, with the requester's community co-members and
+DM partners ranked first.
+
+Settings (optional):
+    USER_SEARCH_TIMEOUT_MS   statement timeout on PostgreSQL (250)
+    AUTOCOMPLETE_RELATED_TIMEOUT   seconds a user's co-member/DM partner ids are cached (60)
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+
+from homepage import autocomplete
+from homepage.models import CommunityMembership, ConversationParticipant, UserSearchDocument
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LIMIT = 10
+MIN_TRIGRAM_LENGTH = 3
+
+TABLE = UserSearchDocument._meta.db_table
+RELATED_KEY = 'autocomplete-related:{}'
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _prefix_ids(query, exclude_user_id, limit):
+    return list(
+        UserSearchDocument.objects.filter(username__startswith=query)
+        .exclude(user_id=exclude_user_id)
+        .order_by('username')
+        .values_list('user_id', flat=True)[:limit]
+    )
+
+
+def _postgres_ids(query, exclude_user_id, limit):
+    timeout = int(getattr(settings, 'USER_SEARCH_TIMEOUT_MS', 250))
+    pattern = '%%%s%%' % _escape_like(query)
+    prefix = '%s%%' % _escape_like(query)
+    sql = (
+        f"SELECT user_id FROM {TABLE} "
+        "WHERE document ILIKE %s AND user_id <> %s "
+        "ORDER BY (username LIKE %s) DESC, word_similarity(%s, document) DESC, username "
+        "LIMIT %s"
+    )
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET LOCAL statement_timeout = %s', [timeout])
+            cursor.execute(sql, [pattern, exclude_user_id, prefix, query, limit])
+            return [row[0] for row in cursor.fetchall()]
+    except OperationalError:
+        logger.warning('User search for %r timed out; falling back to username prefix', query)
+        return _prefix_ids(query, exclude_user_id, limit)
+
+
+def _sqlite_ids(query, exclude_user_id, limit):
+    # A quoted FTS5 string is matched as a substring by the trigram tokenizer
+    match = '"%s"' % query.replace('"', '""')
+    prefix = '%s%%' % _escape_like(query)
+    sql = (
+        f"SELECT d.user_id FROM homepage_usersearch_fts f JOIN {TABLE} d ON d.user_id = f.rowid "
+        "WHERE homepage_usersearch_fts MATCH %s AND d.user_id <> %s "
+        "ORDER BY (d.username LIKE %s ESCAPE '\\') DESC, bm25(homepage_usersearch_fts), d.username "
+        "LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, exclude_user_id, prefix, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_ids(query, exclude_user_id, limit):
+    return list(
+        UserSearchDocument.objects.filter(document__contains=query)
+        .exclude(user_id=exclude_user_id)
+        .order_by('username')
+        .values_list('user_id', flat=True)[:limit]
+    )
+
+
+def search_user_ids(query, exclude_user_id=None, limit=SEARCH_LIMIT):
+    """Ids of the users best matching ``query``, best first."""
+    query = query.strip().lower()
+    if not query:
+        return []
+    exclude_user_id = exclude_user_id or 0
+    if len(query) < MIN_TRIGRAM_LENGTH:
+        return _prefix_ids(query, exclude_user_id, limit)
+    if connection.vendor == 'postgresql':
+        return _postgres_ids(query, exclude_user_id, limit)
+    if connection.vendor == 'sqlite':
+        return _sqlite_ids(query, exclude_user_id, limit)
+    return _fallback_ids(query, exclude_user_id, limit)
+
+
+def search_users(query, exclude_user_id=None, limit=SEARCH_LIMIT):
+    """The users (with profile) best matching ``query``, best first."""
+    ids = search_user_ids(query, exclude_user_id, limit)
+    users = User.objects.select_related('profile').in_bulk(ids)
+    return [users[uid] for uid in ids if uid in users]
+
+
+def related_user_ids(user_id):
+    """Ids of the users sharing a community or a DM with ``user_id`` (cached briefly)."""
+    key = RELATED_KEY.format(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        co_members = CommunityMembership.objects.filter(
+            community__memberships__user_id=user_id
+        ).values_list('user_id', flat=True)
+        partners = ConversationParticipant.objects.filter(
+            conversation__memberships__user_id=user_id
+        ).values_list('user_id', flat=True)
+        ids = set(co_members.union(partners)) - {user_id}
+        cache.set(key, ids, timeout=getattr(settings, 'AUTOCOMPLETE_RELATED_TIMEOUT', 60))
+    return ids
+
+
+def autocomplete_users(prefix, user_id, limit=SEARCH_LIMIT):
+    """Users (with profile) whose username or a part of it starts with ``prefix``; related users first."""
+    ids = autocomplete.complete(prefix, limit + 1, boost=related_user_ids(user_id))
+    ids = [uid for uid in ids if uid != user_id][:limit]
+    users = User.objects.select_related('profile').in_bulk(ids)
+    return [users[uid] for uid in ids if uid in users]
+
+
+def find_user(username):
+    """The user named ``username`` (case-insensitive) through the indexed search document, or None."""
+    username = username.strip()
+    user = User.objects.filter(search_document__username=username.lower()).first()
+    if user is None:
+        # Users without a search document yet (see rebuild_search_index)
+        user = User.objects.filter(username__iexact=username).first()
+    return user
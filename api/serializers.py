@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from django.db.models import Prefetch
 from django.utils.text import slugify
 
 
@@ -20,6 +21,12 @@ from homepage.models import (
     MessageReaction,
     CommunityMessageReaction,
 )
+from homepage.reactions import reactor_usernames, summary_to_groups
+from homepage.encryption import MessageEncryption
+from homepage.images import strip_metadata, variant_urls
+from homepage import uploads
+from homepage import presence
+from homepage import membership_cache
 
 
 
@@ -28,8 +35,18 @@ import uuid
 from django.core.files.base import ContentFile
 
 class Base64ImageField(serializers.ImageField):
+    """
+    ImageField that also accepts a "data:image/...;base64," string.
+
+    Deprecated: the Base64 text is a third larger than the file and is
+    decoded in memory. Upload images as multipart/form-data instead.
+    """
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
+            # Decoded size is ~3/4 of the Base64 text; refuse before decoding
+            if len(data) * 3 // 4 > uploads.max_upload_bytes():
+                raise serializers.ValidationError('Image is too large.')
             try:
                 header, img_str = data.split(';base64,')
                 ext = header.split('/')[-1] 
@@ -41,58 +58,132 @@ class Base64ImageField(serializers.ImageField):
 
         return super().to_internal_value(data)
 
-class ChatMessageSerializer(serializers.ModelSerializer):
+def avatar_images(profile):
+    """Variant URLs of a profile's avatar: {variant: {'webp': url, 'jpeg': url}}."""
+    if not profile or not profile.avatar:
+        return {}
+    return variant_urls(profile.avatar_variants)
+
+
+class BatchListSerializer(serializers.ListSerializer):
+    """
+    Give the child serializer a look at the whole page before rendering it,
+    so per-row lookups (presence, decryption) can be done once per page.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child.prepare_batch(items)
+        return super().to_representation(items)
+
+
+class PresenceMixin:
+    """
+    is_online from the presence store, falling back to Profile.last_activity.
+    ``presence_user_field`` names the attribute of a row holding the user
+    whose presence is shown.
+    """
+    presence_user_field = 'user_id'
+
+    def prepare_batch(self, items):
+        # One cache round-trip for the whole page
+        self._last_seen = presence.last_seen_many(getattr(obj, self.presence_user_field, None) for obj in items)
+
+    def user_is_online(self, user_id, profile):
+        last_seen = getattr(self, '_last_seen', None)
+        if last_seen is None:
+            last_seen = presence.last_seen_many([user_id])
+        fallback = profile.last_activity if profile else None
+        return presence.is_online(last_seen.get(user_id), fallback)
+
+
+class ReactionSummaryMixin:
+    """
+    Render reactions from the denormalized ``reaction_summary`` column.
+
+    The only per-viewer piece is the viewer's own reaction; list views
+    prefetch it into ``my_reactions`` (see ``my_reactions_prefetch``).
+    Reactor usernames are looked up once per page (``prepare_reactors``).
+    """
+
+    @staticmethod
+    def my_reactions_prefetch(reaction_model, user):
+        return Prefetch(
+            'reactions',
+            queryset=reaction_model.objects.filter(user=user),
+            to_attr='my_reactions',
+        )
+
+    def prepare_reactors(self, items):
+        self._reactor_usernames = reactor_usernames(obj.reaction_summary for obj in items)
+
+    def get_reactions(self, obj):
+        usernames = getattr(self, '_reactor_usernames', None)
+        if usernames is None:
+            usernames = reactor_usernames([obj.reaction_summary])
+        request = self.context.get('request')
+        me = request.user if request and request.user.is_authenticated else None
+        if not me:
+            return summary_to_groups(obj.reaction_summary, usernames)
+
+        if hasattr(obj, 'my_reactions'):
+            my_emoji = obj.my_reactions[0].emoji if obj.my_reactions else None
+        else:
+            my_emoji = obj.reactions.filter(user=me).values_list('emoji', flat=True).first()
+        return summary_to_groups(obj.reaction_summary, usernames, me.id, my_emoji, me.username)
+
+class ChatMessageSerializer(PresenceMixin, ReactionSummaryMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     avatar = serializers.SerializerMethodField()
+    avatar_images = serializers.SerializerMethodField()
     is_me = serializers.SerializerMethodField()
-    community_id = serializers.IntegerField(source='community.id', read_only=True)
+    community_id = serializers.IntegerField(read_only=True)
     reactions = serializers.SerializerMethodField()
     is_online = serializers.SerializerMethodField()
 
     class Meta:
         model = ChatMessage
-        fields = ['id', 'username', 'avatar', 'text', 'created_at', 'is_me', 'community_id', 'reactions', 'is_online']
-        read_only_fields = ['id', 'username', 'avatar', 'created_at', 'is_me', 'community_id', 'reactions', 'is_online']
+        fields = ['id', 'username', 'avatar', 'avatar_images', 'text', 'created_at', 'is_me', 'community_id', 'reactions', 'is_online']
+        read_only_fields = ['id', 'username', 'avatar', 'avatar_images', 'created_at', 'is_me', 'community_id', 'reactions', 'is_online']
+        list_serializer_class = BatchListSerializer
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, user=None):
+        """Load everything the serializer touches in a constant number of queries."""
+        queryset = queryset.select_related('user__profile')
+        if user is not None and user.is_authenticated:
+            queryset = queryset.prefetch_related(cls.my_reactions_prefetch(CommunityMessageReaction, user))
+        return queryset
+
+    def prepare_batch(self, items):
+        super().prepare_batch(items)
+        self.prepare_reactors(items)
 
     def get_avatar(self, obj):
-        if hasattr(obj.user, 'profile') and obj.user.profile.avatar:
-            return obj.user.profile.avatar.url
+        if hasattr(obj.user, 'profile'):
+            return obj.user.profile.avatar_url()
         return None
 
+    def get_avatar_images(self, obj):
+        return avatar_images(getattr(obj.user, 'profile', None))
+
     def get_is_me(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.user == request.user
+            return obj.user_id == request.user.id
         return False
-    
-    def get_reactions(self, obj):
-        from collections import defaultdict
-        reaction_groups = defaultdict(list)
-        
-        for reaction in obj.reactions.all():
-            reaction_groups[reaction.emoji].append({
-                'username': reaction.user.username,
-                'is_me': reaction.user == self.context.get('request').user if self.context.get('request') else False
-            })
-        
-        return [
-            {
-                'emoji': emoji,
-                'count': len(users),
-                'users': users
-            }
-            for emoji, users in reaction_groups.items()
-        ]
-    
+
+
     def get_is_online(self, obj):
-        from datetime import timedelta
-        from django.utils import timezone
-        if hasattr(obj.user, 'profile') and obj.user.profile.last_activity:
-            return timezone.now() - obj.user.profile.last_activity < timedelta(minutes=5)
-        return False
+        profile = obj.user.profile if hasattr(obj.user, 'profile') else None
+        return self.user_is_online(obj.user_id, profile)
 
 class CommunitySerializer(serializers.ModelSerializer):
-    member_count = serializers.SerializerMethodField()
+    """
+    member_count is the denormalized Community column; is_admin reads the
+    ``is_admin`` annotation of the community list (see
+    api.communities.community_list) and falls back to the role cache.
+    """
     is_admin = serializers.SerializerMethodField()
 
     class Meta:
@@ -100,18 +191,13 @@ class CommunitySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'is_private', 'created_at', 'member_count', 'is_admin']
         read_only_fields = ['id', 'slug', 'created_at', 'member_count', 'is_admin']
 
-    def get_member_count(self, obj):
-        return obj.memberships.count()
-
     def get_is_admin(self, obj):
+        if hasattr(obj, 'is_admin'):
+            return obj.is_admin
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
-        return CommunityMembership.objects.filter(
-            community=obj,
-            user=request.user,
-            role=CommunityMembership.ROLE_ADMIN,
-        ).exists()
+        return membership_cache.role(obj.pk, request.user.pk) == CommunityMembership.ROLE_ADMIN
 
 
 class CommunityMemberSerializer(serializers.ModelSerializer):
@@ -130,11 +216,19 @@ class CommunityMemberSerializer(serializers.ModelSerializer):
         return obj.user.username
 
     def get_avatar(self, obj):
-        if hasattr(obj.user, 'profile') and obj.user.profile.avatar:
-            return obj.user.profile.avatar.url
+        if hasattr(obj.user, 'profile'):
+            return obj.user.profile.avatar_url()
         return None
 
 
+class CompactCommunityMemberSerializer(CommunityMemberSerializer):
+    """Member rows without avatars (``?compact=1``), for long member panels."""
+
+    class Meta(CommunityMemberSerializer.Meta):
+        fields = ['username', 'display_name', 'role']
+        read_only_fields = fields
+
+
 class MessageReactionSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     
@@ -144,89 +238,105 @@ class MessageReactionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'username', 'created_at']
 
 
-class DirectMessageSerializer(serializers.ModelSerializer):
+class DirectMessageSerializer(ReactionSummaryMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='sender.username', read_only=True)
     avatar = serializers.SerializerMethodField()
     is_me = serializers.SerializerMethodField()
+    is_seen = serializers.SerializerMethodField()
     reactions = serializers.SerializerMethodField()
 
     class Meta:
         model = DirectMessage
-        fields = ['id', 'text', 'username', 'avatar', 'created_at', 'is_me', 'reactions']
-        read_only_fields = ['id', 'username', 'avatar', 'created_at', 'is_me', 'reactions']
+        fields = ['id', 'text', 'username', 'avatar', 'created_at', 'is_me', 'is_seen', 'reactions']
+        read_only_fields = ['id', 'username', 'avatar', 'created_at', 'is_me', 'is_seen', 'reactions']
+        list_serializer_class = BatchListSerializer
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, user=None):
+        """Load everything the serializer touches in a constant number of queries."""
+        queryset = queryset.select_related('sender__profile')
+        if user is not None and user.is_authenticated:
+            queryset = queryset.prefetch_related(cls.my_reactions_prefetch(MessageReaction, user))
+        return queryset
     
+    def prepare_batch(self, items):
+        # Decrypt the whole page with one cipher lookup
+        self._plaintexts = dict(zip(
+            (m.id for m in items),
+            MessageEncryption.decrypt_many(m.text for m in items),
+        ))
+        self.prepare_reactors(items)
+
     def to_representation(self, instance):
         """Override to decrypt text when reading."""
         data = super().to_representation(instance)
-        data['text'] = instance.get_decrypted_text()
+        plaintexts = getattr(self, '_plaintexts', None) or {}
+        if instance.id in plaintexts:
+            data['text'] = plaintexts[instance.id]
+        else:
+            data['text'] = instance.get_decrypted_text()
         return data
 
     def get_avatar(self, obj):
-        if hasattr(obj.sender, 'profile') and obj.sender.profile.avatar:
-            return obj.sender.profile.avatar.url
+        if hasattr(obj.sender, 'profile'):
+            return obj.sender.profile.avatar_url()
         return None
 
     def get_is_me(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.sender == request.user
+            return obj.sender_id == request.user.id
         return False
-    
-    def get_reactions(self, obj):
-        """Group reactions by emoji with list of users"""
-        from collections import defaultdict
-        reaction_groups = defaultdict(list)
-        
-        for reaction in obj.reactions.all():
-            reaction_groups[reaction.emoji].append({
-                'username': reaction.user.username,
-                'is_me': reaction.user == self.context.get('request').user if self.context.get('request') else False
-            })
-        
-        # Convert to list format
-        return [
-            {
-                'emoji': emoji,
-                'count': len(users),
-                'users': users
-            }
-            for emoji, users in reaction_groups.items()
-        ]
+
+    def get_is_seen(self, obj):
+        """Read receipt: the other participant's read marker has reached this message."""
+        return obj.id <= self.context.get('other_last_read_id', 0)
 
 
-class DirectThreadSerializer(serializers.ModelSerializer):
+class DirectThreadSerializer(PresenceMixin, serializers.ModelSerializer):
+    presence_user_field = 'other_user_id'  # annotated by api.inbox
+
     other_user = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
+    other_last_read_id = serializers.SerializerMethodField()
 
     class Meta:
         model = Conversation
-        fields = ['id', 'other_user', 'last_message', 'unread_count', 'updated_at', 'created_at']
+        fields = ['id', 'other_user', 'last_message', 'unread_count', 'other_last_read_id', 'updated_at', 'created_at']
         read_only_fields = ['id', 'updated_at', 'created_at']
+        list_serializer_class = BatchListSerializer
+
+    def prepare_batch(self, items):
+        super().prepare_batch(items)
+        annotated = [t for t in items if getattr(t, 'last_message_id', None)]
+        self._last_texts = dict(zip(
+            (t.id for t in annotated),
+            MessageEncryption.decrypt_many(t.last_message_text for t in annotated),
+        ))
 
     def get_other_user(self, obj):
         request = self.context.get('request')
         if not request:
             return None
-        other = obj.other_user(request.user)
+        # Threads from api.inbox come with the other participant preloaded
+        if hasattr(obj, 'inbox_other_user'):
+            other = obj.inbox_other_user
+        else:
+            other = obj.other_user(request.user)
         if not other:
             return None
         
         # Safely get profile data
         display_name = other.username
         avatar_url = None
-        is_online = False
+        profile = other.profile if hasattr(other, 'profile') else None
         
-        if hasattr(other, 'profile') and other.profile:
-            if hasattr(other.profile, 'display_name'):
-                display_name = other.profile.display_name
-            if other.profile.avatar:
-                avatar_url = other.profile.avatar.url
-            # Check online status (active within 5 minutes)
-            if hasattr(other.profile, 'last_activity') and other.profile.last_activity:
-                from datetime import timedelta
-                from django.utils import timezone
-                is_online = timezone.now() - other.profile.last_activity < timedelta(minutes=5)
+        if profile:
+            display_name = profile.display_name
+            avatar_url = profile.avatar_url()
+        # Online = heartbeat within the presence window
+        is_online = self.user_is_online(other.id, profile)
         
         return {
             'username': other.username,
@@ -237,6 +347,19 @@ class DirectThreadSerializer(serializers.ModelSerializer):
         }
 
     def get_last_message(self, obj):
+        if hasattr(obj, 'last_message_id'):
+            if not obj.last_message_id:
+                return None
+            last_texts = getattr(self, '_last_texts', None) or {}
+            text = last_texts.get(obj.id)
+            if text is None:
+                text = MessageEncryption.decrypt(obj.last_message_text)
+            return {
+                'text': text,
+                'created_at': obj.last_message_created_at,
+                'username': obj.last_message_username,
+            }
+
         last = obj.messages.order_by('-created_at').first()
         if not last:
             return None
@@ -246,18 +369,31 @@ class DirectThreadSerializer(serializers.ModelSerializer):
             'username': last.sender.username,
         }
     
+    def _read_markers(self, obj):
+        if not hasattr(obj, '_read_markers'):
+            obj._read_markers = dict(obj.memberships.values_list('user_id', 'last_read_message_id'))
+        return obj._read_markers
+
     def get_unread_count(self, obj):
         """Count unread messages in this conversation for the current user."""
+        if hasattr(obj, 'unread_count'):
+            return obj.unread_count
+
         request = self.context.get('request')
         if not request or not request.user:
             return 0
         
-        # Count messages sent by other user that haven't been read
-        return obj.messages.filter(
-            is_read=False
-        ).exclude(
-            sender=request.user
-        ).count()
+        # Messages sent by the other user after my read marker
+        return obj.count_unread(request.user, self._read_markers(obj).get(request.user.pk, 0))
+
+    def get_other_last_read_id(self, obj):
+        """How far the other participant has read (for read receipts)."""
+        if hasattr(obj, 'other_last_read_id'):
+            return obj.other_last_read_id
+
+        request = self.context.get('request')
+        me = request.user.pk if request else None
+        return max((m for uid, m in self._read_markers(obj).items() if uid != me), default=0)
 
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -268,6 +404,50 @@ class ProfileSerializer(serializers.ModelSerializer):
         model = Profile
         fields = ['username', 'email', 'title', 'description', 'avatar', 'instagram', 'linkedin', 'github', 'gmail', 'gender']
 
+    def validate_avatar(self, value):
+        # Avatars are public: drop EXIF (GPS, camera) before storing the original
+        if value:
+            value.seek(0)
+            value = ContentFile(strip_metadata(value.read()), name=value.name)
+        return value
+
+    def update(self, instance, validated_data):
+        avatar_bytes = None
+        if 'avatar' in validated_data:
+            instance.avatar_variants = {}
+            if validated_data['avatar']:
+                validated_data['avatar'].seek(0)
+                avatar_bytes = validated_data['avatar'].read()
+                validated_data['avatar'].seek(0)
+        profile = super().update(instance, validated_data)
+        if avatar_bytes:
+            # Thumbnail/medium/full renditions are built off the request path
+            uploads.stage_bytes(profile.avatar.name, avatar_bytes)
+            uploads.enqueue_avatar_variants(profile.pk, profile.avatar.name)
+        return profile
+
+class PublicProfileSerializer(serializers.ModelSerializer):
+    """The header of /u/<username>/ (no email or other private fields)."""
+    username = serializers.CharField(source='user.username', read_only=True)
+    display_name = serializers.CharField(read_only=True)
+    pronouns = serializers.CharField(read_only=True)
+    avatar = serializers.SerializerMethodField()
+    avatar_images = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Profile
+        fields = [
+            'username', 'display_name', 'pronouns', 'title', 'description', 'avatar', 'avatar_images',
+            'instagram', 'linkedin', 'github', 'gmail',
+        ]
+        read_only_fields = fields
+
+    def get_avatar(self, obj):
+        return obj.avatar_url()
+
+    def get_avatar_images(self, obj):
+        return avatar_images(obj)
+
 class EducationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Education
@@ -296,59 +476,82 @@ class CommentSerializer(serializers.ModelSerializer):
 
     username = serializers.CharField(source='user.username', read_only=True)
     avatar = serializers.SerializerMethodField()
-    parent_id = serializers.IntegerField(source='parent.id', read_only=True)
+    parent_id = serializers.IntegerField(read_only=True)
     replies = serializers.SerializerMethodField()
+    reply_count = serializers.SerializerMethodField()
+    more_replies_after = serializers.SerializerMethodField()
 
     class Meta:
         model = PhotoComment
-        fields = ['id', 'username', 'avatar', 'text', 'created_at', 'parent_id', 'replies']
-        read_only_fields = ['id', 'username', 'avatar', 'created_at', 'parent_id', 'replies']
+        fields = ['id', 'username', 'avatar', 'text', 'created_at', 'parent_id', 'replies', 'reply_count', 'more_replies_after']
+        read_only_fields = ['id', 'username', 'avatar', 'created_at', 'parent_id', 'replies', 'reply_count', 'more_replies_after']
 
     def get_avatar(self, obj):
-        if obj.user.profile.avatar:
-            return obj.user.profile.avatar.url
-        return None
+        return obj.user.profile.avatar_url()
 
     def get_replies(self, obj):
-        if obj.replies.exists():
-            return CommentSerializer(obj.replies.all(), many=True).data
-        return []
+        # Trees are assembled by api.comments; never queried per comment
+        replies = getattr(obj, '_replies', None) or []
+        return CommentSerializer(replies, many=True, context=self.context).data
+
+    def get_reply_count(self, obj):
+        return getattr(obj, 'reply_count', None)
+
+    def get_more_replies_after(self, obj):
+        return getattr(obj, 'more_replies_after', None)
 
 class UserPhotoSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    images = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
-    like_count = serializers.SerializerMethodField()
+    like_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = UserPhoto
-        fields = ['id', 'image', 'caption', 'created_at', 'is_liked', 'like_count']
-        read_only_fields = ['created_at', 'is_liked', 'like_count']
+        fields = ['id', 'image', 'images', 'caption', 'created_at', 'upload_status', 'is_liked', 'like_count']
+        read_only_fields = ['created_at', 'images', 'upload_status', 'is_liked', 'like_count']
+
+    def get_images(self, obj):
+        """{variant: {'webp': url, 'jpeg': url}} for thumb/medium/full ({} until built)."""
+        return variant_urls(obj.variants)
 
     def get_is_liked(self, obj):
+        # Annotated by list views (see api.views.with_like_state)
+        annotated = getattr(obj, 'liked_by_me', None)
+        if annotated is not None:
+            return annotated
         user = self.context.get('request').user
         if user.is_authenticated:
             return PhotoLike.objects.filter(user=user, photo=obj).exists()
         return False
 
-    def get_like_count(self, obj):
-        return obj.likes.count()
+class GalleryPhotoSerializer(UserPhotoSerializer):
+    """A photo in a public bundle: the same for every viewer, so no like state."""
+
+    class Meta(UserPhotoSerializer.Meta):
+        fields = ['id', 'image', 'images', 'caption', 'created_at']
+        read_only_fields = fields
 
 class UserSearchSerializer(serializers.ModelSerializer):
     """Minimal serializer for user search results"""
     display_name = serializers.CharField(source='profile.display_name', read_only=True)
     avatar = serializers.SerializerMethodField()
+    avatar_images = serializers.SerializerMethodField()
     profile_url = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ['username', 'display_name', 'avatar', 'profile_url']
-        read_only_fields = ['username', 'display_name', 'avatar', 'profile_url']
+        fields = ['username', 'display_name', 'avatar', 'avatar_images', 'profile_url']
+        read_only_fields = ['username', 'display_name', 'avatar', 'avatar_images', 'profile_url']
 
     def get_avatar(self, obj):
-        if hasattr(obj, 'profile') and obj.profile.avatar:
-            return obj.profile.avatar.url
+        if hasattr(obj, 'profile'):
+            return obj.profile.avatar_url()
         return None
 
+    def get_avatar_images(self, obj):
+        return avatar_images(getattr(obj, 'profile', None))
+
     def get_profile_url(self, obj):
         return f'/u/{obj.username}/'
 
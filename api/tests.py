@@ -1,3 +1,1587 @@
-from django.test import TestCase
+import base64
+import hashlib
+import importlib
+import json
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from cryptography.fernet import Fernet
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from homepage.models import (
+    ChatMessage,
+    Community,
+    CommunityMembership,
+    CommunityMessageReaction,
+    Conversation,
+    ConversationParticipant,
+    DirectMessage,
+    Education,
+    MediaBlob,
+    PhotoComment,
+    PhotoLike,
+    Profile,
+    Skill,
+    SlugCounter,
+    UserPhoto,
+    UserSearchDocument,
+)
+from homepage import autocomplete, images, membership_cache, presence, uploads
+from homepage.encryption import MessageEncryption
+from homepage.reactions import set_reaction
+
+from .middleware import JWTAuthMiddleware
+from .routing import websocket_urlpatterns
+from .search import search_user_ids
+
+# Direct messages refuse to be stored without an encryption key
+OLD_KEY = Fernet.generate_key().decode()
+NEW_KEY = Fernet.generate_key().decode()
+
+
+def make_user(username):
+    user = User.objects.create_user(username=username, password='Secret123!')
+    Profile.objects.create(user=user)
+    return user
+
+
+class ChatSocketTests(TransactionTestCase):
+    """WebSocket push for global/community chat, on the in-memory channel layer."""
+
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.community = Community.objects.create(name='Study Group', created_by=self.alice)
+        CommunityMembership.objects.create(
+            community=self.community, user=self.alice, role=CommunityMembership.ROLE_ADMIN
+        )
+        self.app = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def _communicator(self, path, user=None):
+        if user is not None:
+            path = f"{path}?token={AccessToken.for_user(user)}"
+        return WebsocketCommunicator(self.app, path)
+
+    def _post(self, user, url, data):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(url, data, format='json')
+
+    def _delete(self, user, url, data=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.delete(url, data, format='json')
+
+    async def test_anonymous_socket_is_rejected(self):
+        communicator = self._communicator('/ws/chat/')
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_non_member_cannot_subscribe_to_community(self):
+        communicator = self._communicator(f'/ws/communities/{self.community.id}/chat/', self.bob)
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4403)
+
+    async def test_member_receives_new_community_messages(self):
+        communicator = self._communicator(f'/ws/communities/{self.community.id}/chat/', self.alice)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        response = await sync_to_async(self._post)(
+            self.alice, f'/api/communities/{self.community.id}/chat/', {'text': 'hello'}
+        )
+        self.assertEqual(response.status_code, 201)
+
+        event = await communicator.receive_json_from()
+        self.assertEqual(event['event'], 'message.created')
+        self.assertEqual(event['payload']['text'], 'hello')
+        self.assertEqual(event['payload']['community_id'], self.community.id)
+        self.assertTrue(event['payload']['is_me'])
+        await communicator.disconnect()
+
+    async def test_global_chat_pushes_reactions_and_deletes(self):
+        message = await sync_to_async(ChatMessage.objects.create)(user=self.alice, text='hi')
+        communicator = self._communicator('/ws/chat/', self.bob)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await sync_to_async(self._post)(self.bob, f'/api/chat/{message.id}/react/', {'emoji': '👍'})
+        event = await communicator.receive_json_from()
+        self.assertEqual(event['event'], 'reactions.updated')
+        self.assertEqual(event['payload']['reactions'][0]['count'], 1)
+        self.assertTrue(event['payload']['reactions'][0]['users'][0]['is_me'])
+
+        await sync_to_async(self._delete)(self.alice, f'/api/chat/{message.id}/')
+        event = await communicator.receive_json_from()
+        self.assertEqual(event, {'event': 'message.deleted', 'payload': {'id': message.id, 'community_id': None}})
+        await communicator.disconnect()
+
+    async def test_removed_member_is_disconnected(self):
+        membership = await sync_to_async(CommunityMembership.objects.create)(community=self.community, user=self.bob)
+        path = f'/ws/communities/{self.community.id}/chat/'
+        bob, alice = self._communicator(path, self.bob), self._communicator(path, self.alice)
+        self.assertTrue((await bob.connect())[0])
+        self.assertTrue((await alice.connect())[0])
+
+        await sync_to_async(membership.delete)()
+        self.assertEqual(await bob.receive_output(), {'type': 'websocket.close', 'code': 4403})
+
+        # The rest of the room stays subscribed
+        await sync_to_async(self._post)(self.alice, f'/api/communities/{self.community.id}/chat/', {'text': 'hi'})
+        self.assertEqual((await alice.receive_json_from())['event'], 'message.created')
+        await alice.disconnect()
+
+    async def test_community_events_do_not_leak_into_global_chat(self):
+        communicator = self._communicator('/ws/chat/', self.alice)
+        await communicator.connect()
+
+        await sync_to_async(self._post)(
+            self.alice, f'/api/communities/{self.community.id}/chat/', {'text': 'members only'}
+        )
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+
+@override_settings(MESSAGE_ENCRYPTION_KEY=NEW_KEY)
+class MessageCursorTests(TestCase):
+    """?after_id= / ?before_id= keyset pagination on the chat and DM lists."""
+
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_global_chat_after_and_before_id(self):
+        ids = [ChatMessage.objects.create(user=self.alice, text=f'm{i}').id for i in range(60)]
+
+        latest = self.client.get('/api/chat/').json()
+        self.assertEqual([m['id'] for m in latest], ids[-50:])
+
+        older = self.client.get(f'/api/chat/?before_id={ids[10]}').json()
+        self.assertEqual([m['id'] for m in older], ids[:10])
+
+        newer = self.client.get(f'/api/chat/?after_id={ids[-3]}').json()
+        self.assertEqual([m['id'] for m in newer], ids[-2:])
+
+        self.assertEqual(self.client.get(f'/api/chat/?after_id={ids[-1]}').json(), [])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/api/chat/?after_id=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/chat/?after_id=1&before_id=2').status_code, 400)
+
+    def test_dm_poll_only_marks_new_messages_read(self):
+        thread = Conversation.objects.create()
+        thread.participants.add(self.alice, self.bob)
+        first = DirectMessage.objects.create(conversation=thread, sender=self.bob, text='hey')
+        marker = thread.memberships.filter(user=self.alice)
+
+        url = f'/api/dm/threads/{thread.id}/messages/'
+        self.assertEqual(self.client.get(f'{url}?after_id={first.id}').json(), [])
+        self.assertEqual(marker.get().last_read_message_id, 0)
+
+        page = self.client.get(f'{url}?after_id=0').json()
+        self.assertEqual([m['id'] for m in page], [first.id])
+        self.assertEqual(marker.get().last_read_message_id, first.id)
+
+
+@override_settings(PRESENCE_FLUSH_INTERVAL=3600)
+class ChatQueryCountTests(TestCase):
+    """A chat page costs the same number of queries however busy it is."""
+
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.community = Community.objects.create(name='Busy Room', created_by=self.alice)
+        CommunityMembership.objects.create(community=self.community, user=self.alice)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def _fill(self, community, messages, reactors):
+        users = [make_user(f'user{User.objects.count()}') for _ in range(reactors)]
+        for i in range(messages):
+            message = ChatMessage.objects.create(user=users[i % reactors], community=community, text=f'm{i}')
+            for user in users:
+                set_reaction(CommunityMessageReaction, message, user, '👍')
+
+    def _assert_constant(self, url, community, expected):
+        self._fill(community, messages=2, reactors=2)
+        with self.assertNumQueries(expected):
+            self.assertEqual(len(self.client.get(url).json()), 2)
+
+        self._fill(community, messages=30, reactors=5)
+        with self.assertNumQueries(expected):
+            self.assertEqual(len(self.client.get(url).json()), 32)
+
+    # Messages, my reactions and the reactors' usernames
+    def test_global_chat_page(self):
+        self._assert_constant('/api/chat/', None, expected=3)
+
+    def test_community_chat_page(self):
+        cache.clear()
+        membership_cache.role(self.community.id, self.alice.id)  # the permission check is then a cache hit
+        self._assert_constant(f'/api/communities/{self.community.id}/chat/', self.community, expected=3)
+
+
+class ReactionSummaryTests(TestCase):
+    """reaction_summary is kept in step with the reaction rows."""
+
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.message = ChatMessage.objects.create(user=self.alice, text='hi')
+        self.url = f'/api/chat/{self.message.id}/react/'
+
+    def _react(self, user, emoji, method='post'):
+        client = APIClient()
+        client.force_authenticate(user)
+        return getattr(client, method)(self.url, {'emoji': emoji}, format='json')
+
+    def _summary(self):
+        self.message.refresh_from_db()
+        return self.message.reaction_summary
+
+    def test_toggle_switch_and_remove(self):
+        self._react(self.alice, '👍')
+        self._react(self.bob, '👍')
+        self.assertEqual(self._summary()['counts'], {'👍': 2})
+        self.assertEqual(self._summary()['recent']['👍'], [self.bob.id, self.alice.id])
+
+        self._react(self.bob, '❤️')
+        self.assertEqual(self._summary()['counts'], {'👍': 1, '❤️': 1})
+        self.assertEqual(CommunityMessageReaction.objects.filter(message=self.message).count(), 2)
+
+        response = self._react(self.alice, '👍', method='delete')
+        self.assertEqual(response.json(), {'deleted': True})
+        self.assertEqual(self._summary()['counts'], {'❤️': 1})
+        self.assertNotIn('👍', self._summary()['recent'])
+
+    def test_list_marks_my_reaction(self):
+        self._react(self.bob, '👍')
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        [message] = client.get('/api/chat/').json()
+        self.assertEqual(message['reactions'], [
+            {'emoji': '👍', 'count': 1, 'users': [{'username': 'bob', 'is_me': True}]},
+        ])
+
+    def test_rebuild_command_repairs_drift(self):
+        CommunityMessageReaction.objects.create(message=self.message, user=self.bob, emoji='😂')
+        self.assertEqual(self._summary(), {})
+
+        call_command('rebuild_reaction_summaries', stdout=StringIO())
+        self.assertEqual(self._summary()['counts'], {'😂': 1})
+
+    def test_renamed_reactors_show_their_new_name(self):
+        self._react(self.bob, '👍')
+        self.bob.username = 'robert'
+        self.bob.save()
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        [message] = client.get('/api/chat/').json()
+        self.assertEqual(message['reactions'][0]['users'], [{'username': 'robert', 'is_me': False}])
+
+    @mock.patch('homepage.reactions.RECENT_REACTORS_LIMIT', 2)
+    def test_toggles_and_rebuild_write_the_same_summary(self):
+        users = [self.alice, self.bob] + [make_user(f'user{i}') for i in range(3)]
+        for user in users:
+            self._react(user, '👍')
+        self._react(self.bob, '❤️')  # a switch is the newest reaction of its new emoji
+        self._react(self.alice, '❤️')
+        self._react(users[4], '👍', method='delete')  # one of the recent two leaves
+        toggled = self._summary()
+        self.assertEqual(toggled['recent'], {'👍': [users[3].id, users[2].id], '❤️': [self.alice.id, self.bob.id]})
+
+        call_command('rebuild_reaction_summaries', stdout=StringIO())
+        self.assertEqual(self._summary(), toggled)
+
+    def test_migration_drops_stored_usernames(self):
+        migrate = importlib.import_module('homepage.migrations.0038_reaction_summary_user_ids').recent_to_user_ids
+        old = {'counts': {'👍': 1}, 'recent': {'👍': [{'user_id': self.bob.id, 'username': 'bob'}]}}
+        ChatMessage.objects.filter(pk=self.message.pk).update(reaction_summary=old)
+        migrate(django_apps, None)
+        self.assertEqual(self._summary(), {'counts': {'👍': 1}, 'recent': {'👍': [self.bob.id]}})
+
+
+@override_settings(PRESENCE_FLUSH_INTERVAL=3600, MESSAGE_ENCRYPTION_KEY=NEW_KEY)
+class InboxTests(TestCase):
+    """The DM thread list is computed with subqueries, not per-thread queries."""
+
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def _thread_with(self, username, texts):
+        other = make_user(username)
+        thread, _ = Conversation.get_or_create_dm(self.alice, other)
+        for text in texts:
+            DirectMessage.objects.create(conversation=thread, sender=other, text=text)
+        return thread
+
+    def _legacy_duplicate(self, other):
+        # A duplicate of the pair left without the pair key by an old lookup
+        legacy = Conversation.objects.create()
+        legacy.participants.add(self.alice, other)
+        return legacy
+
+    def test_unkeyed_duplicates_are_merged(self):
+        merge = importlib.import_module('homepage.migrations.0020_conversation_dm_pair').merge_duplicate_dms
+        bob = make_user('bob')
+        legacy = self._legacy_duplicate(bob)
+        DirectMessage.objects.create(conversation=legacy, sender=bob, text='old')
+        thread, _ = Conversation.get_or_create_dm(self.alice, bob)
+        DirectMessage.objects.create(conversation=thread, sender=bob, text='new')
+
+        merge(django_apps, None)
+        self.assertFalse(Conversation.objects.filter(pk=legacy.pk).exists())
+        self.assertEqual(set(MessageEncryption.decrypt_many(thread.messages.values_list('text', flat=True))), {'old', 'new'})
+
+    def test_late_merge_translates_read_markers_by_time(self):
+        merge = importlib.import_module('homepage.migrations.0036_merge_duplicate_dms').merge_duplicate_dms
+        bob = make_user('bob')
+        thread, _ = Conversation.get_or_create_dm(self.alice, bob)
+        seen = DirectMessage.objects.create(conversation=thread, sender=bob, text='seen')
+        unseen = DirectMessage.objects.create(conversation=thread, sender=bob, text='unseen')
+        legacy = self._legacy_duplicate(bob)
+        old = DirectMessage.objects.create(conversation=legacy, sender=bob, text='old')
+        # Alice read the duplicate (up to an id above 'unseen') before 'unseen' was sent
+        read_at = timezone.now() - timedelta(hours=1)
+        DirectMessage.objects.filter(pk=seen.pk).update(created_at=read_at - timedelta(minutes=1))
+        DirectMessage.objects.filter(pk=unseen.pk).update(created_at=read_at + timedelta(minutes=1))
+        ConversationParticipant.objects.filter(conversation=legacy, user=self.alice).update(
+            last_read_message_id=old.id, last_read_at=read_at
+        )
+
+        merge(django_apps, None)
+        self.assertFalse(Conversation.objects.filter(pk=legacy.pk).exists())
+        marker = ConversationParticipant.objects.get(conversation=thread, user=self.alice).last_read_message_id
+        self.assertEqual(marker, seen.id)
+        [row] = self.client.get('/api/dm/threads/').json()['results']
+        self.assertEqual((row['id'], row['unread_count']), (thread.id, 2))  # 'unseen' and the moved 'old'
+
+    def test_thread_with_a_deleted_account_stays_listed(self):
+        thread = self._thread_with('bob', ['bye'])
+        User.objects.filter(username='bob').delete()
+        [row] = self.client.get('/api/dm/threads/').json()['results']
+        self.assertEqual((row['id'], row['other_user']), (thread.id, None))
+
+    def test_last_message_and_unread_count(self):
+        thread = self._thread_with('bob', ['one', 'two'])
+        DirectMessage.objects.create(conversation=thread, sender=self.alice, text='mine')
+
+        [row] = self.client.get('/api/dm/threads/').json()['results']
+        self.assertEqual(row['id'], thread.id)
+        self.assertEqual(row['other_user']['username'], 'bob')
+        self.assertEqual(row['last_message']['text'], 'mine')
+        self.assertEqual(row['last_message']['username'], 'alice')
+        self.assertEqual(row['unread_count'], 2)
+
+    def test_query_count_does_not_grow_with_threads(self):
+        self._thread_with('bob', ['hi'])
+        with self.assertNumQueries(2):
+            self.client.get('/api/dm/threads/')
+
+        for i in range(10):
+            self._thread_with(f'user{i}', ['hello'] * 3)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.client.get('/api/dm/threads/').json()['results']), 11)
+
+    def test_open_chat_reuses_the_canonical_thread(self):
+        bob = make_user('bob')
+        first = self.client.post('/api/dm/threads/', {'username': 'bob'}, format='json').json()
+
+        client = APIClient()
+        client.force_authenticate(bob)
+        second = client.post('/api/dm/threads/', {'username': 'ALICE'}, format='json').json()
+
+        self.assertEqual(first['id'], second['id'])
+        thread = Conversation.objects.get()
+        self.assertEqual((thread.dm_user_low_id, thread.dm_user_high_id), (self.alice.id, bob.id))
+        self.assertEqual(thread.participants.count(), 2)
+
+    def test_read_marker_and_receipts(self):
+        thread = self._thread_with('bob', ['one', 'two'])
+        bob = User.objects.get(username='bob')
+        [row] = self.client.get('/api/dm/threads/').json()['results']
+        self.assertEqual((row['unread_count'], row['other_last_read_id']), (2, 0))
+
+        # Bob has not read Alice's reply yet; Alice has now read both of his
+        reply = self.client.post(f'/api/dm/threads/{thread.id}/messages/', {'text': 'hi bob'}).json()
+        self.assertFalse(reply['is_seen'])
+        [row] = self.client.get('/api/dm/threads/').json()['results']
+        self.assertEqual(row['unread_count'], 0)
+
+        bob_client = APIClient()
+        bob_client.force_authenticate(bob)
+        url = f'/api/dm/threads/{thread.id}/messages/'
+        [row] = bob_client.get('/api/dm/threads/').json()['results']
+        self.assertEqual((row['unread_count'], row['other_last_read_id']), (1, reply['id']))
+        bob_client.get(url)
+
+        messages = self.client.get(url).json()
+        self.assertTrue(messages[-1]['is_seen'])
+        # Polling with nothing new writes nothing
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'{url}?after_id={reply["id"]}')
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')])
+
+    def test_threads_are_cursor_paginated(self):
+        for i in range(3):
+            self._thread_with(f'user{i}', ['hi'])
+        first = self.client.get('/api/dm/threads/?page_size=2').json()
+        self.assertEqual(len(first['results']), 2)
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next'])
+
+
+class PresenceTests(TestCase):
+    """Heartbeats go to the cache and reach Profile.last_activity in one batched UPDATE."""
+
+    def setUp(self):
+        presence.reset()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        Profile.objects.update(last_activity=timezone.now() - timedelta(days=1))
+
+    def test_heartbeat_marks_user_online_without_db_write(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        ChatMessage.objects.create(user=self.bob, text='hi')
+        client.get('/api/chat/')  # the heartbeat is recorded after this response
+
+        with override_settings(PRESENCE_FLUSH_INTERVAL=3600), self.assertNumQueries(2):
+            [message] = client.get('/api/chat/').json()
+        self.assertTrue(message['is_online'])
+        self.assertLess(Profile.objects.get(user=self.bob).last_activity, timezone.now() - timedelta(hours=1))
+
+    def test_flush_updates_all_pending_users_at_once(self):
+        presence.record_heartbeat(self.alice.id)
+        presence.record_heartbeat(self.bob.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(presence.flush(), 2)
+        recent = timezone.now() - timedelta(minutes=1)
+        self.assertEqual(Profile.objects.filter(last_activity__gte=recent).count(), 2)
+
+
+@override_settings(MESSAGE_ENCRYPTION_KEY=NEW_KEY, MESSAGE_ENCRYPTION_OLD_KEYS='')
+class EncryptionTests(TestCase):
+    """Cached cipher, key rotation and batch decryption of direct messages."""
+
+    def setUp(self):
+        MessageEncryption.reset_cipher()
+
+    def test_cipher_is_cached_until_keys_change(self):
+        cipher = MessageEncryption.get_cipher()
+        self.assertIs(MessageEncryption.get_cipher(), cipher)
+        with override_settings(MESSAGE_ENCRYPTION_OLD_KEYS=OLD_KEY):
+            self.assertIsNot(MessageEncryption.get_cipher(), cipher)
+
+    def test_old_keys_still_decrypt_and_rotate(self):
+        legacy = Fernet(OLD_KEY.encode()).encrypt(b'from before').decode()
+        self.assertEqual(MessageEncryption.decrypt(legacy), legacy)  # unknown key: returned as-is
+
+        with override_settings(MESSAGE_ENCRYPTION_OLD_KEYS=OLD_KEY):
+            self.assertEqual(MessageEncryption.decrypt(legacy), 'from before')
+            rotated = MessageEncryption.rotate(legacy)
+        self.assertEqual(MessageEncryption.decrypt(rotated), 'from before')
+
+    def test_decrypt_many_keeps_order_and_plaintext(self):
+        texts = [MessageEncryption.encrypt('one'), 'legacy plaintext', '', MessageEncryption.encrypt('two')]
+        self.assertEqual(
+            MessageEncryption.decrypt_many(texts), ['one', 'legacy plaintext', '', 'two']
+        )
+
+    def test_decrypt_many_logs_failures_without_printing(self):
+        foreign = Fernet(OLD_KEY.encode()).encrypt(b'hidden').decode()
+        with mock.patch('sys.stdout', new_callable=StringIO) as stdout:
+            with self.assertLogs('homepage.encryption', 'WARNING') as logs:
+                self.assertEqual(MessageEncryption.decrypt_many([foreign, 'plain']), [foreign, 'plain'])
+            with override_settings(MESSAGE_ENCRYPTION_KEY='not-a-fernet-key'):
+                with self.assertLogs('homepage.encryption', 'WARNING'):
+                    MessageEncryption.decrypt_many([foreign])
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn('1 of 2', logs.output[0])
+
+    def test_dm_list_and_inbox_show_plaintext(self):
+        alice, bob = make_user('alice'), make_user('bob')
+        thread, _ = Conversation.get_or_create_dm(alice, bob)
+        for text in ['hello', 'there']:
+            DirectMessage.objects.create(
+                conversation=thread, sender=bob, text=MessageEncryption.encrypt(text)
+            )
+        client = APIClient()
+        client.force_authenticate(alice)
+
+        messages = client.get(f'/api/dm/threads/{thread.id}/messages/').json()
+        self.assertEqual([m['text'] for m in messages], ['hello', 'there'])
+        [row] = client.get('/api/dm/threads/').json()['results']
+        self.assertEqual(row['last_message']['text'], 'there')
+
+    def test_messages_are_encrypted_on_save(self):
+        alice, bob = make_user('alice'), make_user('bob')
+        thread, _ = Conversation.get_or_create_dm(alice, bob)
+        client = APIClient()
+        client.force_authenticate(alice)
+        self.assertEqual(client.post(f'/api/dm/threads/{thread.id}/messages/', {'text': 'secret'}).status_code, 201)
+
+        stored = DirectMessage.objects.get().text
+        self.assertTrue(MessageEncryption.is_encrypted(stored))
+        self.assertEqual(MessageEncryption.decrypt(stored), 'secret')
+        self.assertEqual([m['text'] for m in client.get(f'/api/dm/threads/{thread.id}/messages/').json()], ['secret'])
+
+    def test_missing_or_bad_key_refuses_to_store_plaintext(self):
+        alice, bob = make_user('alice'), make_user('bob')
+        thread, _ = Conversation.get_or_create_dm(alice, bob)
+        for key in ['', 'not-a-fernet-key']:
+            with override_settings(MESSAGE_ENCRYPTION_KEY=key):
+                with self.assertRaises(ImproperlyConfigured):
+                    DirectMessage.objects.create(conversation=thread, sender=alice, text='secret')
+        self.assertFalse(DirectMessage.objects.exists())
+
+    def test_undecryptable_text_is_logged_not_printed(self):
+        foreign = Fernet(OLD_KEY.encode()).encrypt(b'hidden').decode()
+        with self.assertLogs('homepage.encryption', 'WARNING') as logs:
+            self.assertEqual(MessageEncryption.decrypt(foreign), foreign)
+        self.assertNotIn(NEW_KEY, ''.join(logs.output))
+
+
+@override_settings(MESSAGE_ENCRYPTION_KEY=NEW_KEY, MESSAGE_ENCRYPTION_OLD_KEYS=OLD_KEY)
+class ReencryptCommandTests(TestCase):
+    """manage.py reencrypt_direct_messages: encrypts plaintext, rotates old keys, resumes."""
+
+    def setUp(self):
+        MessageEncryption.reset_cipher()
+        alice, bob = make_user('alice'), make_user('bob')
+        self.thread, _ = Conversation.get_or_create_dm(alice, bob)
+        self.sender = alice
+        self.checkpoint = Path(tempfile.mkdtemp()) / 'checkpoint.json'
+
+    def _message(self, text):
+        return DirectMessage.objects.create(conversation=self.thread, sender=self.sender, text=text)
+
+    def _run(self, *args):
+        call_command(
+            'reencrypt_direct_messages', '--batch-size=2', '--sleep=0',
+            f'--checkpoint={self.checkpoint}', *args, stdout=StringIO(),
+        )
+
+    def test_encrypts_plaintext_and_rotates_old_tokens(self):
+        plain = self._message('plain')
+        old = self._message(Fernet(OLD_KEY.encode()).encrypt(b'old').decode())
+        current = self._message(Fernet(NEW_KEY.encode()).encrypt(b'new').decode())
+        unchanged = DirectMessage.objects.get(pk=current.pk).text
+
+        self._run()
+
+        rows = {m.pk: m.text for m in DirectMessage.objects.all()}
+        new_cipher = Fernet(NEW_KEY.encode())
+        self.assertEqual(new_cipher.decrypt(rows[plain.pk].encode()), b'plain')
+        self.assertEqual(new_cipher.decrypt(rows[old.pk].encode()), b'old')
+        self.assertEqual(rows[current.pk], unchanged)
+
+    def test_resumes_from_checkpoint(self):
+        first = self._message('first')
+        self._run()
+        self.assertEqual(json.loads(self.checkpoint.read_text()), {'last_id': first.pk})
+
+        # Rows at or below the checkpoint are not looked at again
+        DirectMessage.objects.filter(pk=first.pk).update(text='reset behind the checkpoint')
+        second = self._message('second')
+        self._run()
+        self.assertEqual(DirectMessage.objects.get(pk=first.pk).text, 'reset behind the checkpoint')
+        self.assertTrue(MessageEncryption.is_encrypted(DirectMessage.objects.get(pk=second.pk).text))
+
+        self._run('--restart')
+        self.assertTrue(MessageEncryption.is_encrypted(DirectMessage.objects.get(pk=first.pk).text))
+
+
+def png_data_uri(size=(4, 4)):
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buf, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode()
+
+
+def jpeg_with_exif(size=(2000, 1000)):
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[0x010F] = 'Test Camera'  # Make
+    exif[0x0112] = 6              # Orientation: rotate 90 degrees when displayed
+    buf = BytesIO()
+    Image.new('RGB', size, (30, 200, 30)).save(buf, format='JPEG', exif=exif)
+    return buf.getvalue()
+
+
+class ImageVariantTests(TestCase):
+    """Resized WebP/JPEG renditions without EXIF."""
+
+    def test_variants_are_resized_oriented_and_stripped(self):
+        from PIL import Image
+
+        manifest, files = images.build_variants(jpeg_with_exif(), 'gallery/abc.jpg')
+        self.assertEqual(manifest['thumb'], {
+            'webp': 'gallery/variants/abc_thumb.webp',
+            'jpeg': 'gallery/variants/abc_thumb.jpg',
+        })
+        self.assertEqual(set(files), {key for formats in manifest.values() for key in formats.values()})
+        for variant, longest in images.VARIANT_SIZES.items():
+            for fmt in ('webp', 'jpeg'):
+                rendered = Image.open(BytesIO(files[manifest[variant][fmt]]))
+                # Portrait after applying the orientation tag, capped at the variant size
+                self.assertEqual(rendered.size, (longest // 2, longest))
+                self.assertFalse(rendered.getexif())
+
+    def test_strip_metadata_keeps_clean_images_untouched(self):
+        from PIL import Image
+
+        stripped = images.strip_metadata(jpeg_with_exif())
+        self.assertFalse(Image.open(BytesIO(stripped)).getexif())
+        self.assertEqual(images.strip_metadata(stripped), stripped)
+
+
+def png_bytes(size=(64, 64)):
+    return base64.b64decode(png_data_uri(size).split(',', 1)[1])
+
+
+class GalleryLikeTests(TestCase):
+    """Like state is annotated on gallery lists and like_count is kept in step."""
+
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def _add_photos(self, n):
+        for i in range(n):
+            photo = UserPhoto.objects.create(user=self.alice, image=f'gallery/{UserPhoto.objects.count()}.jpg')
+            if i % 2:
+                PhotoLike.objects.create(user=self.alice, photo=photo)
+                PhotoLike.objects.create(user=self.bob, photo=photo)
+                UserPhoto.objects.filter(pk=photo.pk).update(like_count=2)
+
+    def test_gallery_list_query_count_is_constant(self):
+        self._add_photos(2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/photos/')
+        self._add_photos(100)
+        with CaptureQueriesContext(connection) as large:
+            photos = self.client.get('/api/photos/').json()
+        self.assertEqual(len(large), len(small))
+
+        liked = [p for p in photos if p['is_liked']]
+        self.assertEqual(len(liked), 51)
+        self.assertTrue(all(p['like_count'] == 2 for p in liked))
+        self.assertTrue(all(p['like_count'] == 0 for p in photos if not p['is_liked']))
+
+    def test_toggle_like_updates_the_count(self):
+        photo = UserPhoto.objects.create(user=self.alice, image='gallery/a.jpg')
+        url = f'/api/photos/{photo.id}/like/'
+        self.assertEqual(self.client.post(url).json(), {'is_liked': True, 'like_count': 1})
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.client.post(url).json(), {'is_liked': True, 'like_count': 2})
+        self.assertEqual(self.client.post(url).json(), {'is_liked': False, 'like_count': 1})
+        self.assertEqual(self.client.get(url).json(), {'is_liked': False, 'like_count': 1})
+        photo.refresh_from_db()
+        self.assertEqual(photo.like_count, photo.likes.count())
+
+    def test_rebuild_like_counts(self):
+        self._add_photos(2)
+        # Likes removed in bulk (a deleted user's cascade) leave the count behind
+        self.bob.delete()
+        out = StringIO()
+        call_command('rebuild_like_counts', stdout=out)
+        self.assertIn('1 like counts updated', out.getvalue())
+        self.assertEqual(sorted(UserPhoto.objects.values_list('like_count', flat=True)), [0, 1])
+
+    def test_bulk_like_states_with_etag(self):
+        self._add_photos(4)
+        ids = list(UserPhoto.objects.order_by('id').values_list('id', flat=True))
+        url = f"/api/photos/likes/?ids={','.join(map(str, ids))}"
+        with self.assertNumQueries(1):
+            res = self.client.get(url)
+        self.assertEqual(res.json()['photos'][str(ids[1])], {'is_liked': True, 'like_count': 2})
+        self.assertEqual(res.json()['photos'][str(ids[0])], {'is_liked': False, 'like_count': 0})
+        self.assertEqual(self.client.get('/api/photos/likes/?username=alice').json(), res.json())
+
+        # Unchanged: 304 without a body
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+        # A like changes the ETag
+        self.client.post(f'/api/photos/{ids[0]}/like/')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertTrue(changed.json()['photos'][str(ids[0])]['is_liked'])
+
+        # Anonymous visitors get counts only, and their own ETag
+        anonymous = APIClient().get(url)
+        self.assertFalse(any(p['is_liked'] for p in anonymous.json()['photos'].values()))
+        self.assertNotEqual(anonymous['ETag'], changed['ETag'])
+
+    def test_like_states_hide_unfinished_uploads(self):
+        self._add_photos(1)
+        pending = UserPhoto.objects.create(
+            user=self.alice, image='gallery/pending.jpg', upload_status=UserPhoto.UPLOAD_PENDING
+        )
+        ids = ','.join(str(pk) for pk in UserPhoto.objects.values_list('id', flat=True))
+        for url in [f'/api/photos/likes/?ids={ids}', '/api/photos/likes/?username=alice']:
+            self.assertNotIn(str(pending.id), self.client.get(url).json()['photos'])
+
+
+class CommentThreadTests(TestCase):
+    """Comment threads load in a fixed number of queries, paged and with lazy replies."""
+
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.photo = UserPhoto.objects.create(user=self.alice, image='gallery/a.jpg')
+        self.client = APIClient()
+
+    def _comment(self, parent=None, text='hi'):
+        return PhotoComment.objects.create(user=self.alice, photo=self.photo, parent=parent, text=text)
+
+    def _thread(self, depth):
+        """A top-level comment with a chain of ``depth`` nested replies."""
+        root = parent = self._comment()
+        for _ in range(depth):
+            parent = self._comment(parent)
+        return root
+
+    def test_query_count_does_not_grow_with_the_thread(self):
+        url = f'/api/photos/{self.photo.id}/comments/'
+        self._thread(1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for _ in range(10):
+            self._thread(8)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+        self.assertEqual(len(large), len(small))
+
+    def test_threads_are_paged_with_reply_previews(self):
+        first = self._thread(5)
+        reply = first.replies.get()
+        self.assertEqual(reply.replies.get().root_id, first.id)
+        for _ in range(24):
+            self._comment()
+        url = f'/api/photos/{self.photo.id}/comments/'
+
+        page = self.client.get(url).json()
+        self.assertEqual(len(page['results']), 20)
+        self.assertTrue(page['has_older'])
+        older = self.client.get(f"{url}?before_id={page['results'][0]['id']}").json()
+        self.assertFalse(older['has_older'])
+        [thread] = [c for c in older['results'] if c['id'] == first.id]
+
+        # First REPLY_PREVIEW replies, nested under their parents
+        self.assertEqual(thread['reply_count'], 5)
+        self.assertEqual(thread['replies'][0]['replies'][0]['replies'][0]['replies'], [])
+        cursor = thread['more_replies_after']
+        self.assertIsNotNone(cursor)
+
+        rest = self.client.get(f'{url}{first.id}/replies/?after_id={cursor}').json()
+        self.assertEqual(len(rest['results']), 2)
+        self.assertIsNone(rest['next_after_id'])
+        self.assertEqual(rest['results'][0]['parent_id'], cursor)
+
+
+class ProfileBundleTests(TestCase):
+    """The public profile bundle is cached, invalidated on writes and revalidated with 304s."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice')
+        Profile.objects.filter(user=self.alice).update(title='Counsellor')
+        Skill.objects.create(user=self.alice, name='Listening')
+        Education.objects.create(user=self.alice, organization='Uni', start_year=2015)
+        UserPhoto.objects.create(user=self.alice, image='gallery/a.jpg')
+        UserPhoto.objects.create(user=self.alice, image='gallery/b.jpg', upload_status=UserPhoto.UPLOAD_PENDING)
+        self.url = '/api/profiles/alice/bundle/'
+        self.client = APIClient()
+
+    def test_bundle_is_assembled_once_then_cached(self):
+        with self.assertNumQueries(5):
+            bundle = self.client.get(self.url).json()
+        self.assertEqual(bundle['profile']['title'], 'Counsellor')
+        self.assertNotIn('email', bundle['profile'])
+        self.assertEqual([s['name'] for s in bundle['skills']], ['Listening'])
+        self.assertEqual(len(bundle['education']), 1)
+        self.assertEqual(len(bundle['photos']), 1)  # pending uploads are not shown
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).json(), bundle)
+        self.assertEqual(self.client.get('/api/profiles/nobody/bundle/').status_code, 404)
+
+    def test_writes_invalidate_the_bundle(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            skill = Skill.objects.create(user=self.alice, name='Coaching')
+        self.assertEqual(len(self.client.get(self.url).json()['skills']), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            skill.delete()
+            Education.objects.get().delete()
+        bundle = self.client.get(self.url).json()
+        self.assertEqual((len(bundle['skills']), bundle['education']), (1, []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.get(user=self.alice)
+            profile.title = 'Mentor'
+            profile.save()
+        self.assertEqual(self.client.get(self.url).json()['profile']['title'], 'Mentor')
+
+    def test_stale_build_is_not_served_after_invalidation(self):
+        self.client.get(self.url)
+        # A bundle built from rows read before a change, cached after it
+        stale_version = cache.get(f'profile-bundle-version:{self.alice.id}')
+        with self.captureOnCommitCallbacks(execute=True):
+            Skill.objects.create(user=self.alice, name='Coaching')
+        cache.set(f'profile-bundle:{self.alice.id}:{stale_version}', {'data': 'stale'})
+        self.assertEqual(len(self.client.get(self.url).json()['skills']), 2)
+
+    def test_conditional_requests(self):
+        first = self.client.get(self.url)
+        self.assertIn('Last-Modified', first)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Skill.objects.create(user=self.alice, name='Coaching')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+
+class CommunityPermissionTests(TestCase):
+    """Community permission checks are served from the role cache and never outlive a removal."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.community = Community.objects.create(name='Study Group', created_by=self.alice)
+        CommunityMembership.objects.create(
+            community=self.community, user=self.alice, role=CommunityMembership.ROLE_ADMIN
+        )
+        self.membership = CommunityMembership.objects.create(community=self.community, user=self.bob)
+        self.url = f'/api/communities/{self.community.id}/chat/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def test_cached_checks(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if 'communitymembership' in q['sql']])
+
+        # Members cannot add members; missing communities are still 404s
+        res = self.client.post(f'/api/communities/{self.community.id}/members/', {'username': 'alice'})
+        self.assertEqual((res.status_code, res.json()['detail']), (403, 'Only community admins can add members.'))
+        self.assertEqual(self.client.get('/api/communities/999/chat/').status_code, 404)
+
+    def test_removal_is_immediate(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.membership.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CommunityMembership.objects.create(community=self.community, user=self.bob)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_stale_lookup_cannot_outlive_removal(self):
+        real_add = cache.add
+
+        def add_after_removal(key, value, timeout=None):
+            # The removal commits between the lookup's query and its cache write
+            with self.captureOnCommitCallbacks(execute=True):
+                self.membership.delete()
+            return real_add(key, value, timeout=timeout)
+
+        with mock.patch.object(cache, 'add', add_after_removal):
+            self.assertEqual(membership_cache.role(self.community.id, self.bob.id), CommunityMembership.ROLE_MEMBER)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_queryset_and_cascade_removals_are_immediate(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            CommunityMembership.objects.filter(community=self.community, user=self.bob).delete()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        self.assertEqual(membership_cache.role(self.community.id, self.alice.id), CommunityMembership.ROLE_ADMIN)
+        with self.captureOnCommitCallbacks(execute=True):
+            Community.objects.filter(pk=self.community.pk).delete()
+        self.assertEqual(membership_cache.role(self.community.id, self.alice.id), membership_cache.NOT_MEMBER)
+
+    @override_settings(COMMUNITY_ROLE_CACHE=None)
+    def test_per_process_cache_is_trusted_briefly(self):
+        # LocMemCache (the test backend) is per-process: removals made by other
+        # processes never reach it, so roles are only kept for a few seconds
+        self.assertTrue(membership_cache.enabled())
+        self.assertEqual(membership_cache.timeout(), 5)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            self.assertEqual(membership_cache.timeout(), 300)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertFalse(membership_cache.enabled())
+
+
+class CommunityListTests(TestCase):
+    """The community list is one annotated query over maintained member counts, paginated by name."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        for name in ('Gamma', 'Alpha', 'Beta'):
+            self.assertEqual(self.client.post('/api/communities/', {'name': name}).json()['member_count'], 1)
+        self.beta = Community.objects.get(name='Beta')
+
+    def test_counts_and_admin_flag(self):
+        membership = CommunityMembership.objects.create(community=self.beta, user=self.bob)
+        other = Community.objects.create(name='Delta', created_by=self.bob)
+        CommunityMembership.objects.create(community=other, user=self.bob, role=CommunityMembership.ROLE_ADMIN)
+        CommunityMembership.objects.create(community=other, user=self.alice)
+
+        with self.assertNumQueries(1):
+            rows = self.client.get('/api/communities/').json()['results']
+        self.assertEqual(
+            [(c['name'], c['member_count'], c['is_admin']) for c in rows],
+            [('Alpha', 1, True), ('Beta', 2, True), ('Delta', 2, False), ('Gamma', 1, True)],
+        )
+
+        stale = CommunityMembership.objects.get(pk=membership.pk)
+        membership.delete()
+        self.assertEqual(Community.objects.get(pk=self.beta.pk).member_count, 1)
+        # Deleting the row again through another instance does not count twice
+        stale.delete()
+        self.assertEqual(Community.objects.get(pk=self.beta.pk).member_count, 1)
+
+    def test_queryset_and_cascade_deletes_keep_the_count(self):
+        carol, dave = make_user('carol'), make_user('dave')
+        for user in (carol, dave):
+            CommunityMembership.objects.create(community=self.beta, user=user)
+        count = Community.objects.get(pk=self.beta.pk).member_count
+
+        CommunityMembership.objects.filter(community=self.beta, user=carol).delete()
+        self.assertEqual(Community.objects.get(pk=self.beta.pk).member_count, count - 1)
+        dave.delete()  # the cascade removes his membership
+        self.assertEqual(Community.objects.get(pk=self.beta.pk).member_count, count - 2)
+
+    def test_rebuild_member_counts(self):
+        # Drifted (e.g. rows written in raw SQL) until the command fixes it
+        CommunityMembership.objects.filter(community=self.beta).delete()
+        Community.objects.filter(name='Beta').update(member_count=3)
+        Community.objects.filter(name='Alpha').update(member_count=7)
+        out = StringIO()
+        call_command('rebuild_member_counts', stdout=out)
+        self.assertIn('2 member counts updated', out.getvalue())
+        self.assertEqual(
+            dict(Community.objects.values_list('name', 'member_count')), {'Alpha': 1, 'Beta': 0, 'Gamma': 1}
+        )
+
+    def test_pagination(self):
+        res = self.client.get('/api/communities/', {'page_size': 2}).json()
+        self.assertEqual([c['name'] for c in res['results']], ['Alpha', 'Beta'])
+        res = self.client.get(res['next']).json()
+        self.assertEqual(([c['name'] for c in res['results']], res['next']), (['Gamma'], None))
+
+
+class CommunityMemberListTests(TestCase):
+    """Member lists are keyset-paged by username and filtered in the database."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice')
+        self.community = Community.objects.create(name='Study Group', created_by=self.alice)
+        CommunityMembership.objects.create(
+            community=self.community, user=self.alice, role=CommunityMembership.ROLE_ADMIN
+        )
+        for name in ('dave', 'carol', 'bob', 'bea'):
+            CommunityMembership.objects.create(community=self.community, user=make_user(name))
+        self.url = f'/api/communities/{self.community.id}/members/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def _names(self, res):
+        return [m['username'] for m in res['results']]
+
+    def test_keyset_pages(self):
+        res = self.client.get(self.url, {'page_size': 2}).json()
+        self.assertEqual(self._names(res), ['alice', 'bea'])
+        # A member joining before the cursor does not shift the next page
+        CommunityMembership.objects.create(community=self.community, user=make_user('aaron'))
+        res = self.client.get(res['next']).json()
+        self.assertEqual(self._names(res), ['bob', 'carol'])
+        with self.assertNumQueries(1):  # the page; the role check is a cache hit
+            res = self.client.get(res['next']).json()
+        self.assertEqual((self._names(res), res['next']), (['dave'], None))
+
+    def test_filters_and_compact_mode(self):
+        self.assertEqual(self._names(self.client.get(self.url, {'role': 'admin'}).json()), ['alice'])
+        self.assertEqual(self._names(self.client.get(self.url, {'q': 'B'}).json()), ['bea', 'bob'])
+        self.assertEqual(self.client.get(self.url, {'role': 'owner'}).status_code, 400)
+
+        row = self.client.get(self.url, {'compact': '1', 'q': 'alice'}).json()['results'][0]
+        self.assertEqual(row, {'username': 'alice', 'display_name': 'Alice', 'role': 'admin'})
+        self.assertIn('avatar', self.client.get(self.url).json()['results'][0])
+
+
+class CommunitySlugTests(TestCase):
+    """Slugs come from a per-name counter: constant cost, and existing slugs are skipped."""
+
+    def setUp(self):
+        self.alice = make_user('alice')
+
+    def test_slug_cost_does_not_grow(self):
+        first = Community.objects.create(name='Study Group', created_by=self.alice)
+        self.assertEqual(first.slug, 'study-group')
+        with CaptureQueriesContext(connection) as second:
+            Community.objects.create(name='Study Group', created_by=self.alice)
+        for _ in range(20):
+            Community.objects.create(name='Study Group', created_by=self.alice)
+        with CaptureQueriesContext(connection) as last:
+            community = Community.objects.create(name='Study Group', created_by=self.alice)
+        self.assertEqual(community.slug, 'study-group-22')
+        self.assertEqual(len(last.captured_queries), len(second.captured_queries))
+
+    def test_existing_and_hand_made_slugs_are_skipped(self):
+        Community.objects.create(name='Old', slug='book-club-4', created_by=self.alice)
+        self.assertEqual(Community.objects.create(name='Book Club', created_by=self.alice).slug, 'book-club-5')
+        Community.objects.create(name='Manual', slug='book-club-6', created_by=self.alice)
+        self.assertEqual(Community.objects.create(name='Book Club', created_by=self.alice).slug, 'book-club-7')
+
+    def test_taken_suffix_is_retried(self):
+        Community.objects.create(name='Book Club', created_by=self.alice)
+        # A slug changed behind the counter's back takes the suffix it hands out next
+        manual = Community.objects.create(name='Manual', slug='manual', created_by=self.alice)
+        Community.objects.filter(pk=manual.pk).update(slug='book-club-1')
+        with mock.patch.object(SlugCounter, 'next_suffix', wraps=SlugCounter.next_suffix) as next_suffix:
+            community = Community.objects.create(name='Book Club', created_by=self.alice)
+        self.assertEqual((community.slug, next_suffix.call_count), ('book-club-2', 2))
+
+    def test_falls_back_to_a_random_suffix(self):
+        Community.objects.create(name='Manual', slug='book-club-1', created_by=self.alice)
+        # Every counter suffix collides
+        with mock.patch.object(SlugCounter, 'next_suffix', return_value=1) as next_suffix:
+            community = Community.objects.create(name='Book Club', created_by=self.alice)
+            self.assertEqual(next_suffix.call_count, Community.SLUG_ATTEMPTS)
+            self.assertRegex(community.slug, r'^book-club-[a-z]{8}$')
+
+            # ... and so does the random one: the error is not swallowed
+            with mock.patch('homepage.models.get_random_string', return_value=community.slug.rsplit('-', 1)[1]):
+                failed = Community(name='Book Club', created_by=self.alice)
+                with self.assertRaises(IntegrityError):
+                    failed.save()
+        self.assertEqual((failed.slug, failed.pk), ('', None))
+
+    def test_counters_are_seeded_from_existing_slugs(self):
+        seed = importlib.import_module('homepage.migrations.0037_seed_slugcounters').seed_slug_counters
+        for slug in ['study-group', 'study-group-12', 'study-group-3', 'chess']:
+            Community.objects.create(name='Old', slug=slug, created_by=self.alice)
+        SlugCounter.objects.all().delete()  # as before the counters existed
+
+        seed(django_apps, None)
+        self.assertEqual(dict(SlugCounter.objects.values_list('base', 'last')), {'study-group': 12, 'chess': 0})
+        community = Community.objects.create(name='Study Group', created_by=self.alice)
+        self.assertEqual(community.slug, 'study-group-13')
+        self.assertEqual(Community.objects.create(name='Chess', created_by=self.alice).slug, 'chess-1')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs row locks that wait (SQLite fails fast with "locked")')
+class CommunitySlugLoadTests(TransactionTestCase):
+    """Many same-named communities created in parallel all get distinct slugs."""
+
+    def test_parallel_creates(self):
+        alice = make_user('alice')
+
+        def create(_):
+            try:
+                return Community.objects.create(name='Study Group', created_by=alice).slug
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            slugs = list(pool.map(create, range(40)))
+        self.assertEqual(len(set(slugs)), 40)
+        self.assertEqual(Community.objects.filter(slug__startswith='study-group').count(), 40)
+
+
+class UserSearchTests(TestCase):
+    """User search matches names, titles and skills through the search index, prefix matches first."""
+
+    def setUp(self):
+        self.me = make_user('searcher')
+        self.anna = make_user('anna_k')
+        self.joanna = make_user('joanna')
+        self.bob = make_user('bob')
+        profile = self.bob.profile
+        profile.title = 'Career Counsellor'
+        profile.save()
+        Skill.objects.create(user=self.joanna, name='Mindfulness')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def _search(self, q):
+        res = self.client.get('/api/search/users/', {'q': q})
+        self.assertEqual(res.status_code, 200)
+        return [u['username'] for u in res.json()]
+
+    def test_substring_title_and_skill_matches(self):
+        self.assertEqual(self._search('counsel'), ['bob'])
+        self.assertEqual(self._search('FULNESS'), ['joanna'])
+        self.assertEqual(self._search('searcher'), [])  # never yourself
+        self.assertEqual(self._search('zzz'), [])
+
+    def test_username_prefix_ranks_first(self):
+        self.assertEqual(self._search('anna'), ['anna_k', 'joanna'])
+        # Below trigram length only username prefixes match
+        self.assertEqual(self._search('an'), ['anna_k'])
+
+    def test_documents_follow_writes(self):
+        skill = Skill.objects.create(user=self.anna, name='Career planning')
+        self.assertCountEqual(self._search('career'), ['anna_k', 'bob'])
+        skill.delete()
+        self.assertEqual(self._search('career'), ['bob'])
+
+        UserSearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self._search('career'), ['bob'])
+
+
+class UserAutocompleteTests(TestCase):
+    """Autocomplete serves prefixes from the in-memory index, co-members first, and follows new users."""
+
+    def setUp(self):
+        cache.clear()
+        self.me = make_user('andrea')
+        make_user('anna_k')
+        make_user('bob_anderson')
+        self.annie = make_user('annie')
+        community = Community.objects.create(name='Study Group', created_by=self.me)
+        for user in (self.me, self.annie):
+            CommunityMembership.objects.create(community=community, user=user)
+        autocomplete.rebuild()
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def _complete(self, q):
+        res = self.client.get('/api/search/users/autocomplete/', {'q': q})
+        self.assertEqual(res.status_code, 200)
+        return [u['username'] for u in res.json()]
+
+    def test_prefix_ranking(self):
+        # Co-member first, then username matches, then name-part matches; never yourself
+        self.assertEqual(self._complete('an'), ['annie', 'anna_k', 'bob_anderson'])
+        self.assertEqual(self._complete('K'), ['anna_k'])
+        with self.assertNumQueries(1):  # the related ids are cached; only the result rows are loaded
+            self._complete('ann')
+
+    def test_index_follows_new_users(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_user('anton')
+        self.assertEqual(self._complete('ant'), ['anton'])
+
+        # Renames reindex the user
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annie.username = 'yvette'
+            self.annie.save()
+        self.assertEqual(UserSearchDocument.objects.get(user=self.annie).username, 'yvette')
+        self.assertEqual(self._complete('yv'), ['yvette'])
+        self.assertNotIn('yvette', self._complete('ann'))
+        self.assertEqual(search_user_ids('yvet'), [self.annie.pk])
+
+        # Written by another worker: picked up by the catch-up query
+        UserSearchDocument.objects.filter(user=self.annie).update(username='zora', updated_at=timezone.now())
+        with override_settings(AUTOCOMPLETE_SYNC_INTERVAL=0):
+            self.assertEqual(self._complete('zo'), ['yvette'])
+            self.assertNotIn('yvette', self._complete('yv'))
+
+
+    def test_boosted_users_past_the_scan_window(self):
+        bob = User.objects.get(username='bob_anderson')
+        # "an" matches anderson, andrea, anna_k, annie; only the first is scanned
+        with mock.patch.object(autocomplete, 'SCAN_LIMIT', 1):
+            # Fewer boosted users than unscanned keys: the boost set is checked
+            self.assertEqual(autocomplete.complete('an', boost={self.annie.pk}), [self.annie.pk, bob.pk])
+            # More boosted users than unscanned keys: the rest of the range is walked
+            boost = {self.annie.pk, -1, -2, -3}
+            self.assertEqual(autocomplete.complete('an', boost=boost), [self.annie.pk, bob.pk])
+
+    def test_stale_index_is_rebuilt_once_in_the_background(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_rebuild():
+            calls.append(threading.current_thread().name)
+            started.set()
+            release.wait(5)
+
+        with override_settings(AUTOCOMPLETE_REBUILD_INTERVAL=0), mock.patch.object(autocomplete, 'rebuild', slow_rebuild):
+            # Answered from the old index while the rebuild runs
+            self.assertEqual(self._complete('ann'), ['annie', 'anna_k'])
+            self.assertTrue(started.wait(5))
+            self._complete('ann')
+            release.set()
+            self.assertTrue(autocomplete._build_lock.acquire(timeout=5))
+            autocomplete._build_lock.release()
+        self.assertEqual(calls, ['autocomplete-rebuild'])
+
+
+class MediaBlobTests(TestCase):
+    """Blob references are counted under the row lock, whatever runs alongside."""
+
+    def test_acquire_and_release(self):
+        blob, created = MediaBlob.acquire('a' * 64, 'gallery/a.png', 10)
+        self.assertEqual((created, blob.ref_count), (True, 1))
+        blob, created = MediaBlob.acquire('a' * 64, 'gallery/a.png', 10)
+        self.assertEqual((created, blob.ref_count, MediaBlob.objects.get().ref_count), (False, 2, 2))
+
+        self.assertIsNone(MediaBlob.release(blob.id))
+        self.assertEqual(MediaBlob.release(blob.id).sha256, 'a' * 64)
+        # Released for good: the next upload of the same bytes starts a new blob
+        blob, created = MediaBlob.acquire('a' * 64, 'gallery/a.png', 10)
+        self.assertEqual((created, blob.ref_count), (True, 1))
+
+    def test_blob_created_concurrently_is_counted(self):
+        # Another upload of the same bytes inserts the blob just after this one looked for it
+        MediaBlob.objects.create(sha256='b' * 64, key='gallery/b.png', ref_count=1)
+        lookups = [MediaBlob.objects.none(), MediaBlob.objects.select_for_update()]
+        with mock.patch.object(MediaBlob.objects, 'select_for_update', side_effect=lookups):
+            blob, created = MediaBlob.acquire('b' * 64, 'gallery/b.png')
+        self.assertEqual((created, blob.ref_count, MediaBlob.objects.get().ref_count), (False, 2, 2))
+
+
+class PhotoStreamingUploadTests(TestCase):
+    """Multipart photo uploads are streamed to the staging dir with a size cap."""
+
+    def setUp(self):
+        self.staging = Path(tempfile.mkdtemp())
+        settings_override = override_settings(PHOTO_UPLOAD_STAGING_DIR=str(self.staging))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('alice'))
+
+    def _upload(self, data, name='photo.png'):
+        return self.client.post(
+            '/api/photos/', {'image': SimpleUploadedFile(name, data), 'caption': 'hi'}, format='multipart'
+        )
+
+    def test_multipart_upload_is_staged_and_hashed(self):
+        data = png_bytes()
+        res = self._upload(data)
+        self.assertEqual(res.status_code, 201)
+        self.assertNotIn('Deprecation', res)
+
+        photo = UserPhoto.objects.get()
+        self.assertEqual(photo.upload_status, UserPhoto.UPLOAD_PENDING)
+        self.assertEqual((photo.content_sha256, photo.size), (hashlib.sha256(data).hexdigest(), len(data)))
+        self.assertEqual(photo.image.name, f"gallery/{photo.content_sha256}.png")
+        self.assertEqual(uploads.staged_path(photo.image.name).read_bytes(), data)
+        self.assertEqual(len(list(self.staging.iterdir())), 1)
+
+    @override_settings(PHOTO_UPLOAD_MAX_BYTES=1000)
+    def test_oversized_upload_is_rejected_without_leftovers(self):
+        self.assertEqual(self._upload(png_bytes((200, 200)) + b'\0' * 5000).status_code, 413)
+        self.assertEqual(self._upload(b'\0' * 200_000).status_code, 413)  # refused from Content-Length
+        self.assertFalse(UserPhoto.objects.exists())
+        self.assertEqual(list(self.staging.iterdir()), [])
+
+    def test_invalid_image_is_discarded(self):
+        self.assertEqual(self._upload(b'not an image').status_code, 400)
+        self.assertEqual(list(self.staging.iterdir()), [])
+
+    def test_other_file_parts_are_discarded(self):
+        data = png_bytes()
+        res = self.client.post('/api/photos/', {
+            'image': SimpleUploadedFile('photo.png', data),
+            'extra': [SimpleUploadedFile('a.png', b'junk'), SimpleUploadedFile('b.png', b'more junk')],
+        }, format='multipart')
+        self.assertEqual(res.status_code, 201)
+        photo = UserPhoto.objects.get()
+        self.assertEqual(list(self.staging.rglob('*.*')), [uploads.staged_path(photo.image.name)])
+
+        res = self.client.post('/api/photos/', {
+            'image': SimpleUploadedFile('bad.png', b'not an image'),
+            'extra': SimpleUploadedFile('a.png', b'junk'),
+        }, format='multipart')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(list(self.staging.rglob('*.*')), [uploads.staged_path(photo.image.name)])
+
+    def test_base64_json_still_works_but_is_deprecated(self):
+        res = self.client.post('/api/photos/', {'image': png_data_uri(), 'caption': 'old'}, format='json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res['Deprecation'], 'true')
+        photo = UserPhoto.objects.get()
+        self.assertTrue(uploads.staged_path(photo.image.name).exists())
+
+
+try:
+    import boto3
+    import requests
+    from moto import mock_aws
+except ImportError:  # moto is only needed for these tests (pip install -r requirements-dev.txt)
+    mock_aws = None
+
+
+@skipUnless(mock_aws, 'moto is not installed (see requirements-dev.txt)')
+class PhotoUploadPipelineTests(TransactionTestCase):
+    """Gallery uploads are staged, then pushed to (moto's) S3 by the background pipeline."""
+
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        settings_override = override_settings(
+            AWS_ACCESS_KEY_ID='testing',
+            AWS_SECRET_ACCESS_KEY='testing',
+            AWS_S3_ENDPOINT_URL=None,
+            AWS_STORAGE_BUCKET_NAME='media',
+            PHOTO_UPLOAD_REGIONS=['us-east-1'],
+            PHOTO_UPLOAD_STAGING_DIR=tempfile.mkdtemp(),
+            PHOTO_UPLOAD_MAX_ATTEMPTS=2,
+            PHOTO_UPLOAD_BACKOFF=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        uploads.reset()
+        self.addCleanup(uploads.reset)
+
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('alice'))
+
+    def _post_photo(self):
+        res = self.client.post('/api/photos/', {'image': png_data_uri(), 'caption': 'hi'}, format='json')
+        self.assertEqual(res.status_code, 201)
+        return res.json()
+
+    def test_upload_happens_in_the_background(self):
+        self.s3.create_bucket(Bucket='media')
+        photo = self._post_photo()
+        self.assertEqual(photo['upload_status'], UserPhoto.UPLOAD_PENDING)
+
+        uploads.wait(timeout=10)
+        row = UserPhoto.objects.get(pk=photo['id'])
+        self.assertEqual((row.upload_status, row.upload_attempts), (UserPhoto.UPLOAD_UPLOADED, 1))
+        stored = self.s3.get_object(Bucket='media', Key=row.image.name)['Body'].read()
+        self.assertTrue(stored.startswith(b'\x89PNG'))
+        self.assertFalse(uploads.staged_path(row.image.name).exists())
+
+        # Variants were uploaded alongside and are exposed by the API
+        self.assertEqual(set(row.variants), set(images.VARIANT_SIZES))
+        self.s3.head_object(Bucket='media', Key=row.variants['thumb']['webp'])
+        [listed] = self.client.get('/api/photos/').json()
+        self.assertTrue(listed['images']['medium']['jpeg'].endswith(row.variants['medium']['jpeg']))
+
+    def test_identical_uploads_share_one_blob(self):
+        self.s3.create_bucket(Bucket='media')
+        first = self._post_photo()
+        uploads.wait(timeout=10)
+        self.client.force_authenticate(make_user('bob'))
+        second = self._post_photo()
+        # Already stored: live at once, nothing transferred
+        self.assertEqual(second['upload_status'], UserPhoto.UPLOAD_UPLOADED)
+
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        rows = UserPhoto.objects.filter(blob=blob)
+        self.assertEqual({r.image.name for r in rows}, {blob.key})
+        self.assertEqual(rows.get(pk=second['id']).variants, blob.variants)
+        keys = uploads.blob_keys(blob)
+        self.assertEqual(self.s3.list_objects_v2(Bucket='media')['KeyCount'], len(keys))
+
+        # Deleting one photo keeps the shared objects...
+        self.assertEqual(self.client.delete(f"/api/photos/{second['id']}/").status_code, 204)
+        uploads.wait(timeout=10)
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+        self.s3.head_object(Bucket='media', Key=blob.key)
+
+        # ...the last one garbage-collects them
+        self.client.force_authenticate(User.objects.get(username='alice'))
+        self.assertEqual(self.client.delete(f"/api/photos/{first['id']}/").status_code, 204)
+        uploads.wait(timeout=10)
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual(self.s3.list_objects_v2(Bucket='media')['KeyCount'], 0)
+
+    def _presign(self, data, content_type='image/png'):
+        res = self.client.post(
+            '/api/photos/upload-url/',
+            {'content_type': content_type, 'sha256': hashlib.sha256(data).hexdigest()},
+            format='json',
+        )
+        self.assertEqual(res.status_code, 200)
+        return res.json()
+
+    def _incoming_keys(self):
+        listed = self.s3.list_objects_v2(Bucket='media', Prefix=uploads.INCOMING_PREFIX)
+        return [o['Key'] for o in listed.get('Contents', [])]
+
+    def test_presigned_upload_flow(self):
+        self.s3.create_bucket(Bucket='media')
+        data = png_bytes()
+        target = self._presign(data)
+        user = User.objects.get(username='alice')
+        self.assertTrue(target['key'].startswith(f"gallery/incoming/{user.id}/"))
+        # Both targets carry the declared checksum
+        checksum = base64.b64encode(hashlib.sha256(data).digest()).decode()
+        self.assertEqual(target['put']['headers']['x-amz-checksum-sha256'], checksum)
+        self.assertEqual(target['post']['fields']['x-amz-checksum-sha256'], checksum)
+
+        # The browser talks to storage directly
+        put = target['put']
+        self.assertEqual(requests.put(put['url'], data=data, headers=put['headers']).status_code, 200)
+
+        res = self.client.post('/api/photos/complete/', {'key': target['key'], 'caption': 'direct'}, format='json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.json()['upload_status'], UserPhoto.UPLOAD_PENDING)
+
+        # Ingest copies the object inside the bucket; variants wait for the worker command
+        with mock.patch.object(uploads, 'get_object', side_effect=AssertionError('downloaded')):
+            uploads.wait(timeout=10)
+        row = UserPhoto.objects.get()
+        self.assertEqual(row.upload_status, UserPhoto.UPLOAD_PENDING)
+        self.assertEqual(row.image.name, f"gallery/{hashlib.sha256(data).hexdigest()}.png")
+        self.assertEqual((row.blob.ref_count, row.blob.stored, row.blob.uploaded), (1, True, False))
+        self.assertEqual(self._incoming_keys(), [])
+
+        call_command('process_direct_uploads', stdout=StringIO())
+        row.refresh_from_db()
+        self.assertEqual(row.upload_status, UserPhoto.UPLOAD_UPLOADED)
+        self.assertEqual(set(row.variants), set(images.VARIANT_SIZES))
+        self.s3.head_object(Bucket='media', Key=row.variants['thumb']['webp'])
+
+        # The same picture again is live as soon as it is ingested
+        again = self._presign(data)
+        requests.put(again['put']['url'], data=data, headers=again['put']['headers'])
+        self.client.post('/api/photos/complete/', {'key': again['key']}, format='json')
+        uploads.wait(timeout=10)
+        self.assertEqual(
+            list(UserPhoto.objects.values_list('upload_status', flat=True)), [UserPhoto.UPLOAD_UPLOADED] * 2
+        )
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+    def test_presigned_upload_is_validated(self):
+        self.s3.create_bucket(Bucket='media')
+        self.assertEqual(
+            self.client.post('/api/photos/upload-url/', {'content_type': 'text/html'}, format='json').status_code, 400
+        )
+        self.assertEqual(
+            self.client.post('/api/photos/upload-url/', {'content_type': 'image/jpeg'}, format='json').status_code, 400
+        )
+        data = b'not an image'
+        target = self._presign(data, 'image/jpeg')
+
+        # Keys are scoped to the user they were issued to
+        self.client.force_authenticate(make_user('mallory'))
+        res = self.client.post('/api/photos/complete/', {'key': target['key']}, format='json')
+        self.assertEqual(res.status_code, 400)
+        self.client.force_authenticate(User.objects.get(username='alice'))
+        # Nothing uploaded yet
+        res = self.client.post('/api/photos/complete/', {'key': target['key']}, format='json')
+        self.assertEqual(res.status_code, 400)
+
+        # A PUT of something that is not an image is rejected by the pipeline
+        put = target['put']
+        self.assertEqual(requests.put(put['url'], data=data, headers=put['headers']).status_code, 200)
+        first = self.client.post('/api/photos/complete/', {'key': target['key']}, format='json')
+        self.assertEqual(first.status_code, 201)
+        # Completing again returns the same photo
+        again = self.client.post('/api/photos/complete/', {'key': target['key']}, format='json')
+        self.assertEqual((again.status_code, again.json()['id']), (200, first.json()['id']))
+        uploads.wait(timeout=10)
+        row = UserPhoto.objects.get()
+        self.assertEqual(row.upload_status, UserPhoto.UPLOAD_FAILED)
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual(self._incoming_keys(), [])
+
+    def test_concurrent_completions_make_one_photo(self):
+        self.s3.create_bucket(Bucket='media')
+        data = png_bytes()
+        target = self._presign(data)
+        requests.put(target['put']['url'], data=data, headers=target['put']['headers'])
+        # Both requests pass the lookup before either inserts; the unique key decides
+        with mock.patch.object(UserPhoto.objects, 'filter', return_value=UserPhoto.objects.none()), \
+                mock.patch.object(uploads, 'enqueue'):
+            first = self.client.post('/api/photos/complete/', {'key': target['key']}, format='json')
+            second = self.client.post('/api/photos/complete/', {'key': target['key']}, format='json')
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(UserPhoto.objects.count(), 1)
+
+    def test_upload_without_checksum_is_rejected(self):
+        self.s3.create_bucket(Bucket='media')
+        data = png_bytes()
+        target = self._presign(data)
+        # Storage that kept no checksum (e.g. an unsigned upload): never adopted
+        self.s3.put_object(Bucket='media', Key=target['key'], Body=data, ContentType='image/png')
+        self.assertEqual(self.client.post('/api/photos/complete/', {'key': target['key']}, format='json').status_code, 201)
+        uploads.wait(timeout=10)
+        self.assertEqual(UserPhoto.objects.get().upload_status, UserPhoto.UPLOAD_FAILED)
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_failed_upload_is_retried_by_command(self):
+        photo = self._post_photo()  # no bucket yet: every attempt fails
+        uploads.wait(timeout=10)
+        row = UserPhoto.objects.get(pk=photo['id'])
+        self.assertEqual((row.upload_status, row.upload_attempts), (UserPhoto.UPLOAD_FAILED, 2))
+        self.assertIn('NoSuchBucket', row.upload_error)
+
+        self.s3.create_bucket(Bucket='media')
+        call_command('retry_photo_uploads', '--failed', stdout=StringIO())
+        self.assertEqual(UserPhoto.objects.get(pk=row.pk).upload_status, UserPhoto.UPLOAD_UPLOADED)
+
+    def test_backfill_command_builds_missing_variants(self):
+        self.s3.create_bucket(Bucket='media')
+        self.s3.put_object(Bucket='media', Key='gallery/old.jpg', Body=jpeg_with_exif())
+        self.s3.put_object(Bucket='media', Key='avatars/me.jpg', Body=jpeg_with_exif())
+        photo = UserPhoto.objects.create(user=User.objects.get(), image='gallery/old.jpg')
+        Profile.objects.update(avatar='avatars/me.jpg')
+
+        call_command('build_image_variants', stdout=StringIO())
+
+        photo.refresh_from_db()
+        self.s3.head_object(Bucket='media', Key=photo.variants['full']['jpeg'])
+        profile = Profile.objects.get()
+        self.assertTrue(profile.avatar_url().endswith('avatars/variants/me_thumb.jpg'))
+        # The public originals lost their EXIF too
+        from PIL import Image
+        original = self.s3.get_object(Bucket='media', Key='gallery/old.jpg')['Body'].read()
+        self.assertFalse(Image.open(BytesIO(original)).getexif())
+
+    def test_avatar_variants_job(self):
+        self.s3.create_bucket(Bucket='media')
+        Profile.objects.update(avatar='avatars/new.jpg')
+        profile = Profile.objects.get()
+        uploads.stage_bytes('avatars/new.jpg', jpeg_with_exif((300, 300)))
+
+        uploads.build_avatar_variants(profile.pk, 'avatars/new.jpg')
+
+        profile.refresh_from_db()
+        self.assertEqual(set(profile.avatar_variants), set(images.VARIANT_SIZES))
+        self.assertFalse(uploads.staged_path('avatars/new.jpg').exists())
@@ -2,15 +2,17 @@ from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
     RegisterView, resolve_username, me_view, 
-    ProfileDetailView, UserPhotoListCreateView, UserPhotoDetailView,
+    ProfileDetailView, profile_bundle, UserPhotoListCreateView, UserPhotoDetailView,
+    photo_upload_url, photo_upload_complete,
     EducationListCreateView, EducationDetailView,
     ExperienceListCreateView, ExperienceDetailView,
     SkillListCreateView, SkillDetailView,
-    toggle_like, PhotoCommentListView, PhotoCommentDetailView,
+    toggle_like, photo_like_states, PhotoCommentListView, PhotoCommentRepliesView, PhotoCommentDetailView,
     google_auth,
     ChatListCreateView,
     ChatDetailView,
     UserSearchView,
+    user_autocomplete,
     CommunityListCreateView,
     CommunityMembersView,
     CommunityChatListCreateView,
@@ -34,7 +36,10 @@ urlpatterns = [
     
     # Profile & Gallery
     path('profile/', ProfileDetailView.as_view(), name='api-profile'),
+    path('profiles/<str:username>/bundle/', profile_bundle, name='api-profile-bundle'),
     path('photos/', UserPhotoListCreateView.as_view(), name='api-photos-list'),
+    path('photos/upload-url/', photo_upload_url, name='api-photos-upload-url'),
+    path('photos/complete/', photo_upload_complete, name='api-photos-complete'),
     path('photos/<int:pk>/', UserPhotoDetailView.as_view(), name='api-photos-detail'),
 
     # Education
@@ -53,8 +58,10 @@ urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     # Likes & Comments
+    path('photos/likes/', photo_like_states, name='api-photo-like-states'),
     path('photos/<int:photo_id>/like/', toggle_like, name='api-photo-like'),
     path('photos/<int:photo_id>/comments/', PhotoCommentListView.as_view(), name='api-photo-comments'),
+    path('photos/<int:photo_id>/comments/<int:comment_id>/replies/', PhotoCommentRepliesView.as_view(), name='api-photo-comment-replies'),
     path('comments/<int:pk>/', PhotoCommentDetailView.as_view(), name='api-comment-delete'),
 
     # Google Auth
@@ -80,6 +87,7 @@ urlpatterns = [
 
     # User Search
     path('search/users/', UserSearchView.as_view(), name='api-user-search'),
+    path('search/users/autocomplete/', user_autocomplete, name='api-user-autocomplete'),
 
     # Calling
     path('call/token/<int:thread_id>/', get_call_token, name='api-call-token'),
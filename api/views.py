@@ -171,7 +171,18 @@ def me_view(request):
 # -------------------------------------------------------------
 # PROFILE MANAGEMENT (GET / UPDATE)
 # -------------------------------------------------------------
-from homepage.models import Profile, UserPhoto, Education, Experience, Skill
+import hashlib
+import os
+import re
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Value
+from django.db.models.functions import Greatest
+from rest_framework import serializers
+from homepage.models import Profile, UserPhoto, PhotoLike, Education, Experience, Skill
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from homepage import uploads
+from .profiles import bundle_user, get_bundle
 from .serializers import ProfileSerializer, UserPhotoSerializer, EducationSerializer, ExperienceSerializer, SkillSerializer
 
 class ProfileDetailView(generics.RetrieveUpdateAPIView):
@@ -182,88 +193,212 @@ class ProfileDetailView(generics.RetrieveUpdateAPIView):
         # Return the profile of the currently logged-in user
         return self.request.user.profile
 
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def profile_bundle(request, username):
+    """
+    GET /api/profiles/<username>/bundle/  (Public)
+    Returns: { "profile", "education", "experience", "skills", "photos" }
+
+    Served from cache (see homepage/profile_cache.py); revalidate with
+    If-None-Match / If-Modified-Since for a 304.
+    """
+    user = bundle_user(username)
+    if user is None or not hasattr(user, 'profile'):
+        return Response({"detail": "User not found"}, status=404)
+
+    bundle = get_bundle(user)
+    last_modified = bundle['last_modified'].timestamp()
+    response = (
+        get_conditional_response(request, etag=bundle['etag'], last_modified=last_modified)
+        or Response(bundle['data'])
+    )
+    response['ETag'] = bundle['etag']
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
 # -------------------------------------------------------------
 # GALLERY MANAGEMENT (UPLOAD / LIST / DELETE)
 # -------------------------------------------------------------
+def with_like_state(queryset, user):
+    """
+    Annotate photos with ``liked_by_me`` (an EXISTS subquery) so listing a
+    gallery does not query PhotoLike once per photo. Counts come from the
+    denormalized UserPhoto.like_count column.
+    """
+    if not user.is_authenticated:
+        return queryset.annotate(liked_by_me=Value(False))
+    return queryset.annotate(
+        liked_by_me=Exists(PhotoLike.objects.filter(photo=OuterRef('pk'), user=user))
+    )
+
+
 class UserPhotoListCreateView(generics.ListCreateAPIView):
     serializer_class = UserPhotoSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return UserPhoto.objects.filter(user=self.request.user).order_by('-created_at')
+        return with_like_state(
+            UserPhoto.objects.filter(user=self.request.user).order_by('-created_at'), self.request.user
+        )
 
     def create(self, request, *args, **kwargs):
+        """
+        POST /api/photos/  multipart/form-data: image=<file>, caption=<text>
+
+        The file part is streamed to the upload staging dir and hashed as it
+        arrives (homepage.uploads.StagingUploadHandler), capped at
+        PHOTO_UPLOAD_MAX_BYTES. JSON bodies with a Base64 data-URI image
+        are still accepted but deprecated.
+        """
+        multipart = request.content_type.startswith('multipart/form-data')
+        if not multipart:
+            return self._create_photo(request, multipart)
+
+        handler = uploads.StagingUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+        try:
+            request.data  # parse now, through the staging handler
+            if handler.too_large:
+                return Response(
+                    {"detail": f"Image is too large (max {uploads.max_upload_bytes() // (1024 * 1024)} MB)."},
+                    status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                )
+            return self._create_photo(request, multipart)
+        finally:
+            # No staged file outlives the request: the photo's own has been
+            # moved into place by attach_blob by now, so whatever is still
+            # here (other file parts, rejected uploads) is dropped.
+            for _, files in request.FILES.lists():
+                for f in files:
+                    if hasattr(f, 'discard'):
+                        f.discard()
+
+    def _create_photo(self, request, multipart):
         # 1. Validation
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         # 2. Extract Data
-        # Base64ImageField converts data to ContentFile, so validated_data['image'] is a file
         image_file = serializer.validated_data['image']
         caption = serializer.validated_data.get('caption', '')
         
-        # 3. Manual Boto3 Upload (Bypass Storage Backend)
-        import boto3
-        from botocore.config import Config
-        from django.conf import settings
-        
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        file_path = f"gallery/{image_file.name}" # Define path manually
-        
-        upload_success = False
-        last_error = ""
+        # 3. Stage the bytes locally; homepage.uploads pushes them to S3 in the
+        #    background (pooled client, retries) so this request does not wait on S3.
+        #    Keys are the SHA-256 of the content, so a picture that is already
+        #    stored is shared (MediaBlob) instead of uploaded again.
+        photo = UserPhoto(user=request.user, caption=caption)
+        ext = os.path.splitext(image_file.name)[1].lower()[:10] or '.jpg'
+        if getattr(image_file, 'staged_key', None):
+            # Streamed multipart upload: already staged and hashed
+            staged, data = image_file, None
+            sha256, size = image_file.sha256, image_file.size
+        else:
+            # Deprecated Base64 path: Base64ImageField decoded it into memory
+            image_file.seek(0)
+            staged, data = None, image_file.read()
+            sha256, size = hashlib.sha256(data).hexdigest(), len(data)
 
-        # S3 Client Configuration
-        # We try multiple region configurations to account for Supabase quirks
-        regions_to_try = ['ap-southeast-1', 'us-east-1']
-        
-        for region in regions_to_try:
-            try:
-                print(f"DEBUG: Attempting upload to region {region}...")
-                s3_client = boto3.client(
-                    's3',
-                    endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-                    region_name=region,
-                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID.strip() if settings.AWS_ACCESS_KEY_ID else None,
-                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY.strip() if settings.AWS_SECRET_ACCESS_KEY else None,
-                    config=Config(signature_version='s3v4')
-                )
-                
-                # Reset file pointer just in case
-                image_file.seek(0)
-                
-                s3_client.put_object(
-                    Bucket=bucket_name,
-                    Key=file_path,
-                    Body=image_file.read()
-                    # Removed ACL and ContentType to avoid Signature Mismatches if Supabase strips them
-                )
-                upload_success = True
-                print(f"DEBUG: Upload SUCCESS with region {region}")
-                break # Stop if success
-            except Exception as e:
-                print(f"DEBUG: Upload failed with region {region}: {e}")
-                last_error = str(e)
-
-        if not upload_success:
-             return Response({"detail": f"Upload Failed (S3): {last_error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # 4. Save to Database (Image path string only)
-        # We manually create the object to avoid Model.save() triggering another upload
-        photo = UserPhoto(
-            user=request.user,
-            caption=caption
-        )
-        # Manually set the name field (avoids storage backend upload)
-        photo.image.name = file_path 
-        photo.save()
-        
-        # Return standard response
-        return Response(UserPhotoSerializer(photo, context={'request': request}).data, status=status.HTTP_201_CREATED)
+        # 4. Save to Database (Image path string only) and queue the S3 upload
+        try:
+            with transaction.atomic():
+                uploads.attach_blob(photo, sha256, size, ext, staged=staged, data=data)
+                photo.save()
+                if photo.upload_status == UserPhoto.UPLOAD_PENDING:
+                    uploads.enqueue(photo.id)
+        except OSError as e:
+            return Response({"detail": f"Upload Failed: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # Return standard response (upload_status tells the client when the image is live)
+        response = Response(UserPhotoSerializer(photo, context={'request': request}).data, status=status.HTTP_201_CREATED)
+        if not multipart:
+            response['Deprecation'] = 'true'
+            response['Warning'] = '299 - "Base64 image uploads are deprecated; POST multipart/form-data instead"'
+        return response
 
     def perform_create(self, serializer):
         pass # Not used anymore since we override create()
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def photo_upload_url(request):
+    """
+    POST /api/photos/upload-url/  {"content_type": "image/jpeg", "sha256": <hex digest of the file>}
+    Returns short-lived presigned targets for uploading straight to storage:
+    { "key", "expires_in", "put": {"url", "headers"}, "post": {"url", "fields"} }
+    Upload with either (storage checks the bytes against sha256), then call
+    /api/photos/complete/ with the key.
+    """
+    content_type = request.data.get('content_type', '')
+    sha256 = str(request.data.get('sha256', '')).lower()
+    if content_type not in uploads.IMAGE_TYPES:
+        return Response(
+            {"detail": f"content_type must be one of {', '.join(uploads.IMAGE_TYPES)}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        return Response({"sha256": ["The hex SHA-256 of the file is required."]}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        target = uploads.presign_upload(request.user.id, content_type, sha256)
+    except Exception as e:
+        # Not configured (or storage unreachable): clients fall back to POST /api/photos/
+        return Response({"detail": f"Direct uploads are unavailable: {e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response(target)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def photo_upload_complete(request):
+    """
+    POST /api/photos/complete/  {"key": <key from upload-url>, "caption": <text>}
+    Checks the uploaded object and creates the photo (upload_status=pending
+    until the background pipeline has validated and stored it). Completing
+    a key again returns its photo with 200.
+    """
+    key = request.data.get('key', '')
+    caption = request.data.get('caption', '') or ''
+    if not uploads.is_incoming_key(key, request.user.id):
+        return Response({"detail": "Unknown upload key."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(caption) > UserPhoto._meta.get_field('caption').max_length:
+        return Response({"caption": ["Ensure this field has no more than 200 characters."]}, status=status.HTTP_400_BAD_REQUEST)
+    existing = UserPhoto.objects.filter(upload_key=key).first()
+    if existing is not None:
+        # Completed already (a retried request): the incoming object may be gone
+        return Response(UserPhotoSerializer(existing, context={'request': request}).data)
+
+    try:
+        head = uploads.head_object(key)
+    except Exception as e:
+        return Response({"detail": f"Storage check failed: {e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if head is None:
+        return Response({"detail": "Nothing was uploaded under this key."}, status=status.HTTP_400_BAD_REQUEST)
+    if head['ContentLength'] > uploads.max_upload_bytes() or not head.get('ContentType', '').startswith('image/'):
+        uploads.delete_keys([key])
+        return Response(
+            {"detail": f"Upload must be an image of at most {uploads.max_upload_bytes() // (1024 * 1024)} MB."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        with transaction.atomic():
+            photo = UserPhoto.objects.create(
+                user=request.user,
+                caption=caption,
+                image=key,
+                upload_key=key,
+                upload_status=UserPhoto.UPLOAD_PENDING,
+                size=head['ContentLength'],
+            )
+            uploads.enqueue(photo.id)
+    except IntegrityError:
+        # A concurrent completion of the same key won the insert
+        photo = UserPhoto.objects.get(upload_key=key)
+        return Response(UserPhotoSerializer(photo, context={'request': request}).data)
+    return Response(UserPhotoSerializer(photo, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+
 class UserPhotoDetailView(generics.DestroyAPIView):
     queryset = UserPhoto.objects.all()
     serializer_class = UserPhotoSerializer
@@ -273,6 +408,15 @@ class UserPhotoDetailView(generics.DestroyAPIView):
         # Ensure user can only delete their own photos
         return UserPhoto.objects.filter(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            if instance.blob_id:
+                # Shared storage: the objects go only with the last reference
+                uploads.release_blob(instance.blob_id)
+            elif instance.upload_status != UserPhoto.UPLOAD_UPLOADED:
+                uploads.discard_staged(instance.image.name)
+
 # -------------------------------------------------------------
 # DEBUG S3 CONNECTION
 # -------------------------------------------------------------
@@ -442,7 +586,11 @@ from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticate
 # -------------------------------------------------------------
 # LIKE FEATURE
 # -------------------------------------------------------------
+import json
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from homepage.models import PhotoLike, PhotoComment
+from .comments import COMMENT_PAGE_SIZE, attach_reply_previews, thread_replies, top_level_comments
+from .pagination import message_keyset_page
 from .serializers import CommentSerializer
 
 @api_view(['GET', 'POST'])
@@ -467,27 +615,74 @@ def toggle_like(request, photo_id):
             
         return Response({
             "is_liked": is_liked,
-            "like_count": photo.likes.count()
+            "like_count": photo.like_count
         })
 
     # POST logic (Auth required - enforced by permission class)
+    # The count is adjusted in place (F expressions) instead of recounted,
+    # and only when a like row was really added or removed.
     user = request.user
-    existing_like = PhotoLike.objects.filter(user=user, photo=photo).first()
-    
-    if existing_like:
-        # UNLIKE
-        existing_like.delete()
-        is_liked = False
-    else:
-        # LIKE
-        PhotoLike.objects.create(user=user, photo=photo)
-        is_liked = True
-    
+    likes = UserPhoto.objects.filter(pk=photo.pk)
+    with transaction.atomic():
+        removed, _ = PhotoLike.objects.filter(user=user, photo=photo).delete()
+        if removed:
+            # UNLIKE
+            likes.update(like_count=Greatest(F('like_count') - 1, 0))
+            is_liked = False
+        else:
+            # LIKE
+            _, created = PhotoLike.objects.get_or_create(user=user, photo=photo)
+            if created:
+                likes.update(like_count=F('like_count') + 1)
+            is_liked = True
+        like_count = likes.values_list('like_count', flat=True).get()
+
     return Response({
         "is_liked": is_liked,
-        "like_count": photo.likes.count()
+        "like_count": like_count
     })
 
+MAX_LIKE_STATE_IDS = 200
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def photo_like_states(request):
+    """
+    GET /api/photos/likes/?ids=1,2,3      -> like state of these photos
+    GET /api/photos/likes/?username=xyz   -> like state of xyz's gallery
+    Returns: { "photos": { "<id>": { "is_liked": bool, "like_count": int } } }
+
+    One query for the whole page. The ETag is a hash of the body, so a
+    client revalidating an unchanged gallery gets a 304 without a body.
+    """
+    username = request.query_params.get('username')
+    raw_ids = request.query_params.get('ids')
+    if username:
+        queryset = UserPhoto.objects.filter(user__username=username, upload_status=UserPhoto.UPLOAD_UPLOADED)
+    elif raw_ids:
+        try:
+            ids = {int(i) for i in raw_ids.split(',') if i.strip()}
+        except ValueError:
+            return Response({"detail": "ids must be a comma-separated list of photo ids."}, status=400)
+        if len(ids) > MAX_LIKE_STATE_IDS:
+            return Response({"detail": f"At most {MAX_LIKE_STATE_IDS} ids per request."}, status=400)
+        queryset = UserPhoto.objects.filter(id__in=ids, upload_status=UserPhoto.UPLOAD_UPLOADED)
+    else:
+        return Response({"detail": "Pass ids or username."}, status=400)
+
+    rows = with_like_state(queryset.order_by('id'), request.user).values_list('id', 'like_count', 'liked_by_me')
+    data = {"photos": {str(pk): {"is_liked": bool(liked), "like_count": count} for pk, count, liked in rows}}
+
+    etag = '"%s"' % hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    response = get_conditional_response(request, etag=etag) or Response(data)
+    response['ETag'] = etag
+    # Per-user (is_liked) and always revalidated, so hearts never go stale
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
 # -------------------------------------------------------------
 # COMMENT FEATURE
 # -------------------------------------------------------------
@@ -501,8 +696,25 @@ class PhotoCommentListView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         photo_id = self.kwargs['photo_id']
-        # Return only top-level comments (parent=None)
-        return PhotoComment.objects.filter(photo_id=photo_id, parent=None).order_by('created_at')
+        # Return only top-level comments (parent=None), with reply counts
+        return top_level_comments(photo_id)
+
+    def list(self, request, *args, **kwargs):
+        """
+        The latest COMMENT_PAGE_SIZE top-level comments, oldest first, each
+        with its first replies nested under ``replies``, ``reply_count`` and
+        ``more_replies_after`` (cursor for .../comments/<id>/replies/).
+        ?before_id=<id> pages back; ?after_id=<id> polls for newer ones.
+        Returns: { "results": [...], "has_older": bool }
+        """
+        queryset = self.get_queryset()
+        page = message_keyset_page(queryset, request, page_size=COMMENT_PAGE_SIZE)
+        attach_reply_previews(page)
+        has_older = bool(page) and queryset.filter(id__lt=page[0].id).exists()
+        return Response({
+            "results": self.get_serializer(page, many=True).data,
+            "has_older": has_older,
+        })
 
     def perform_create(self, serializer):
         photo_id = self.kwargs['photo_id']
@@ -521,6 +733,27 @@ class PhotoCommentListView(generics.ListCreateAPIView):
         except UserPhoto.DoesNotExist:
             raise serializers.ValidationError("Photo not found")
 
+class PhotoCommentRepliesView(generics.GenericAPIView):
+    """
+    GET /api/photos/<id>/comments/<comment_id>/replies/?after_id=<id>
+    The next replies of a thread (flat, oldest first, each with parent_id).
+    Returns: { "results": [...], "next_after_id": id or null }
+    """
+    serializer_class = CommentSerializer
+    permission_classes = [AllowAny]
+
+    def get(self, request, photo_id, comment_id):
+        root = get_object_or_404(PhotoComment, id=comment_id, photo_id=photo_id, parent__isnull=True)
+        try:
+            after_id = int(request.query_params.get('after_id') or 0)
+        except ValueError:
+            return Response({"after_id": "Must be an integer comment id."}, status=400)
+        replies, next_after_id = thread_replies(root, after_id)
+        return Response({
+            "results": self.get_serializer(replies, many=True).data,
+            "next_after_id": next_after_id,
+        })
+
 class PhotoCommentDetailView(generics.DestroyAPIView):
     """
     DELETE /api/comments/<id>/
@@ -616,8 +849,6 @@ def google_auth(request):
 # -------------------------------------------------------------
 # COMMUNITY CHAT (GLOBAL)
 # -------------------------------------------------------------
-from django.db.models import Count, Q
-
 from homepage.models import (
     ChatMessage,
     Community, CommunityMembership, Conversation, DirectMessage, MessageReaction, CommunityMessageReaction
@@ -626,13 +857,22 @@ from .serializers import (
     ChatMessageSerializer,
     CommunitySerializer,
     CommunityMemberSerializer,
+    CompactCommunityMemberSerializer,
     DirectThreadSerializer,
     DirectMessageSerializer,
 )
+from homepage.reactions import set_reaction, remove_reaction
+from . import realtime
+from .pagination import message_keyset_page, CommunityCursorPagination, InboxCursorPagination, MemberCursorPagination
+from .inbox import inbox_queryset, attach_other_users
+from .communities import community_list, member_list, require_member
+from .search import find_user
 
 class ChatListCreateView(generics.ListCreateAPIView):
     """
     GET /api/chat/ -> List last 50 messages
+    GET /api/chat/?after_id=<id> -> Only messages newer than <id> (polling)
+    GET /api/chat/?before_id=<id> -> 50 messages older than <id> (history)
     POST /api/chat/ -> Post new message
     """
     serializer_class = ChatMessageSerializer
@@ -640,16 +880,19 @@ class ChatListCreateView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         # Global chat = messages with no community
-        return ChatMessage.objects.filter(community__isnull=True).order_by('-created_at')[:50]
+        return ChatMessageSerializer.setup_eager_loading(
+            ChatMessage.objects.filter(community__isnull=True), self.request.user
+        )
 
     def list(self, request, *args, **kwargs):
-        # We want oldest first for chat flow, so fetch recent desc -> reverse
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(reversed(queryset), many=True)
+        # Oldest first for chat flow
+        page = message_keyset_page(self.get_queryset(), request)
+        serializer = self.get_serializer(page, many=True)
         return Response(serializer.data)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        message = serializer.save(user=self.request.user)
+        realtime.broadcast_message_created(message)
 
 class ChatDetailView(generics.DestroyAPIView):
     """
@@ -663,20 +906,27 @@ class ChatDetailView(generics.DestroyAPIView):
         # Only allow deleting own *global* messages
         return ChatMessage.objects.filter(user=self.request.user, community__isnull=True)
 
+    def perform_destroy(self, instance):
+        message_id = instance.id
+        instance.delete()
+        realtime.broadcast_message_deleted(message_id)
+
 
 # -------------------------------------------------------------
 # PRIVATE COMMUNITIES
 # -------------------------------------------------------------
 class CommunityListCreateView(generics.ListCreateAPIView):
+    """
+    GET  /api/communities/ -> the user's communities by name, 50 per page
+         ({next, previous, results}; follow ``next`` for more)
+    POST /api/communities/ -> create one (the creator becomes its admin)
+    """
     serializer_class = CommunitySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CommunityCursorPagination
 
     def get_queryset(self):
-        return (
-            Community.objects.filter(memberships__user=self.request.user)
-            .distinct()
-            .order_by('name')
-        )
+        return community_list(self.request.user)
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
@@ -691,47 +941,48 @@ class CommunityListCreateView(generics.ListCreateAPIView):
             role=CommunityMembership.ROLE_ADMIN,
             added_by=self.request.user,
         )
+        # For the response: the row's member_count was bumped by the membership
+        community.member_count, community.is_admin = 1, True
 
 
 class CommunityMembersView(generics.ListCreateAPIView):
+    """
+    GET  /api/communities/<id>/members/ -> members by username, 100 per page
+         ({next, previous, results}; follow ``next`` for more)
+         ?role=admin|member  -> only that role
+         ?q=<prefix>         -> usernames starting with <prefix>
+         ?compact=1          -> username, display_name and role only
+    POST /api/communities/<id>/members/ -> add a member (admins only)
+    """
     serializer_class = CommunityMemberSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = MemberCursorPagination
 
-    def _get_community(self):
-        return get_object_or_404(Community, pk=self.kwargs['community_id'])
-
-    def _require_member(self, community):
-        if not CommunityMembership.objects.filter(community=community, user=self.request.user).exists():
-            raise PermissionDenied('You are not a member of this community.')
-
-    def _require_admin(self, community):
-        if not CommunityMembership.objects.filter(
-            community=community,
-            user=self.request.user,
-            role=CommunityMembership.ROLE_ADMIN,
-        ).exists():
-            raise PermissionDenied('Only community admins can add members.')
+    def get_serializer_class(self):
+        if self.request.method == 'GET' and self.request.query_params.get('compact') in ('1', 'true'):
+            return CompactCommunityMemberSerializer
+        return super().get_serializer_class()
 
     def get_queryset(self):
-        community = self._get_community()
-        self._require_member(community)
-        return CommunityMembership.objects.filter(community=community).select_related('user', 'user__profile').order_by('user__username')
+        community_id = self.kwargs['community_id']
+        require_member(self.request.user, community_id)
+        params = self.request.query_params
+        return member_list(community_id, role=params.get('role'), prefix=params.get('q', '').strip())
 
     def create(self, request, *args, **kwargs):
-        community = self._get_community()
-        self._require_admin(community)
+        community_id = self.kwargs['community_id']
+        require_member(request.user, community_id, admin=True, message='Only community admins can add members.')
 
         username = (request.data.get('username') or '').strip()
         if not username:
             return Response({'detail': 'username is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(username__iexact=username)
-        except User.DoesNotExist:
+        user = find_user(username)
+        if user is None:
             return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
         membership, created = CommunityMembership.objects.get_or_create(
-            community=community,
+            community_id=community_id,
             user=user,
             defaults={'added_by': request.user, 'role': CommunityMembership.ROLE_MEMBER},
         )
@@ -747,55 +998,52 @@ class CommunityChatListCreateView(generics.ListCreateAPIView):
     serializer_class = ChatMessageSerializer
     permission_classes = [IsAuthenticated]
 
-    def _get_community(self):
-        return get_object_or_404(Community, pk=self.kwargs['community_id'])
-
-    def _require_member(self, community):
-        if not CommunityMembership.objects.filter(community=community, user=self.request.user).exists():
-            raise PermissionDenied('You are not a member of this community.')
-
     def get_queryset(self):
-        community = self._get_community()
-        self._require_member(community)
-        return ChatMessage.objects.filter(community=community).order_by('-created_at')[:50]
+        community_id = self.kwargs['community_id']
+        require_member(self.request.user, community_id)
+        return ChatMessageSerializer.setup_eager_loading(
+            ChatMessage.objects.filter(community_id=community_id), self.request.user
+        )
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(reversed(queryset), many=True)
+        # Same ?after_id= / ?before_id= cursor as the global chat
+        page = message_keyset_page(self.get_queryset(), request)
+        serializer = self.get_serializer(page, many=True)
         return Response(serializer.data)
 
     def perform_create(self, serializer):
-        community = self._get_community()
-        self._require_member(community)
-        serializer.save(user=self.request.user, community=community)
+        community_id = self.kwargs['community_id']
+        require_member(self.request.user, community_id)
+        message = serializer.save(user=self.request.user, community_id=community_id)
+        realtime.broadcast_message_created(message)
 
 
 class CommunityChatDetailView(generics.DestroyAPIView):
     serializer_class = ChatMessageSerializer
     permission_classes = [IsAuthenticated]
 
-    def _get_community(self):
-        return get_object_or_404(Community, pk=self.kwargs['community_id'])
-
-    def _require_member(self, community):
-        if not CommunityMembership.objects.filter(community=community, user=self.request.user).exists():
-            raise PermissionDenied('You are not a member of this community.')
-
     def get_queryset(self):
-        community = self._get_community()
-        self._require_member(community)
+        community_id = self.kwargs['community_id']
+        require_member(self.request.user, community_id)
         # Only allow deleting your own messages within this community
-        return ChatMessage.objects.filter(community=community, user=self.request.user)
+        return ChatMessage.objects.filter(community_id=community_id, user=self.request.user)
+
+    def perform_destroy(self, instance):
+        message_id, community_id = instance.id, instance.community_id
+        instance.delete()
+        realtime.broadcast_message_deleted(message_id, community_id)
 
 # -------------------------------------------------------------
 # USER SEARCH
 # -------------------------------------------------------------
 from .serializers import UserSearchSerializer
+from .search import autocomplete_users, search_users
 
 class UserSearchView(generics.ListAPIView):
     """
     GET /api/search/users/?q=<query>
-    Search for users by username (partial, case-insensitive)
+    Search for users by username, name, title or skill (partial,
+    case-insensitive), best matches first. See api/search.py.
     """
     serializer_class = UserSearchSerializer
     permission_classes = [IsAuthenticated]
@@ -806,13 +1054,28 @@ class UserSearchView(generics.ListAPIView):
         if not query or len(query) < 2:
             return User.objects.none()
 
-        # Search by username (case-insensitive, partial match)
         # Exclude current user from results
-        return User.objects.filter(
-            username__icontains=query
-        ).exclude(
-            id=self.request.user.id
-        ).select_related('profile')[:10]  # Limit to 10 results
+        return search_users(query, exclude_user_id=self.request.user.id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def user_autocomplete(request):
+    """
+    GET /api/search/users/autocomplete/?q=<prefix>[&limit=<n>]
+    Users whose username (or a part of it after _ . - or a space) starts
+    with the prefix, community co-members and DM partners first. Served
+    from an in-memory index; for as-you-type pickers.
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response([])
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 10)
+    except ValueError:
+        limit = 10
+    users = autocomplete_users(query, request.user.id, limit)
+    return Response(UserSearchSerializer(users, many=True, context={'request': request}).data)
 
 
 # -------------------------------------------------------------
@@ -821,29 +1084,31 @@ class UserSearchView(generics.ListAPIView):
 class DirectThreadListCreateView(generics.ListCreateAPIView):
     """
     GET  /api/dm/threads/            -> list user's threads (1:1 conversations)
+         ?cursor=<next cursor>       -> older threads (most recently active first)
     POST /api/dm/threads/ {username} -> create/get 1:1 thread with username
 
     Notes:
     - We use the existing Conversation model/table.
     - A DM thread is a Conversation with exactly 2 participants.
+    - Other participant, last message and unread count come from
+      api.inbox subqueries, not per-thread queries.
     """
 
     serializer_class = DirectThreadSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = InboxCursorPagination
 
     def get_queryset(self):
-        # Important: we must count *all* participants, not only the join rows filtered by the current user.
-        # We do this via conditional aggregates.
-        return (
-            Conversation.objects
-            .annotate(
-                pcount=Count('participants', distinct=True),
-                me_count=Count('participants', filter=Q(participants=self.request.user), distinct=True),
-            )
-            .filter(me_count=1, pcount=2)
-            .prefetch_related('participants', 'participants__profile', 'messages')
-            .order_by('-updated_at')
-        )
+        return inbox_queryset(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        attach_other_users(page)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def _inbox_thread(self, pk):
+        return attach_other_users([self.get_queryset().get(pk=pk)])[0]
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
@@ -855,40 +1120,24 @@ class DirectThreadListCreateView(generics.ListCreateAPIView):
         if not username:
             return Response({'detail': 'username is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            other = User.objects.get(username__iexact=username)
-        except User.DoesNotExist:
+        other = find_user(username)
+        if other is None:
             return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
         if other == request.user:
             return Response({'detail': 'Cannot message yourself'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Find existing 1:1 conversation (exactly two participants).
-        existing = (
-            Conversation.objects
-            .annotate(
-                pcount=Count('participants', distinct=True),
-                me_count=Count('participants', filter=Q(participants=request.user), distinct=True),
-                other_count=Count('participants', filter=Q(participants=other), distinct=True),
-            )
-            .filter(me_count=1, other_count=1, pcount=2)
-            .order_by('-updated_at')
-            .first()
-        )
-
-        if existing:
-            serializer = self.get_serializer(existing)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        convo = Conversation.objects.create()
-        convo.participants.add(request.user, other)
-        serializer = self.get_serializer(convo)
+        # One indexed lookup on the (low, high) pair; race-free via its unique constraint.
+        convo, _ = Conversation.get_or_create_dm(request.user, other)
+        serializer = self.get_serializer(self._inbox_thread(convo.pk))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 class DirectMessageListCreateView(generics.ListCreateAPIView):
     """
     GET  /api/dm/threads/<id>/messages/ -> list last 50 messages (oldest first)
+         ?after_id=<id>  -> only messages newer than <id> (polling)
+         ?before_id=<id> -> 50 messages older than <id> (history)
     POST /api/dm/threads/<id>/messages/ -> send message
     """
 
@@ -897,36 +1146,46 @@ class DirectMessageListCreateView(generics.ListCreateAPIView):
 
     def _get_thread(self):
         thread = get_object_or_404(Conversation, pk=self.kwargs['thread_id'])
-        if not thread.participants.filter(pk=self.request.user.pk).exists():
+        # Both participant rows in one query: membership check + read markers
+        thread.read_markers = dict(thread.memberships.values_list('user_id', 'last_read_message_id'))
+        if self.request.user.pk not in thread.read_markers:
             raise PermissionDenied('You are not a participant in this thread.')
         return thread
 
     def get_queryset(self):
-        thread = self._get_thread()
-        return DirectMessage.objects.filter(conversation=thread).order_by('-created_at')[:50]
+        self.thread = self._get_thread()
+        return DirectMessageSerializer.setup_eager_loading(
+            DirectMessage.objects.filter(conversation=self.thread), self.request.user
+        )
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        
-        # Mark all unread messages from other users as read
-        thread = self._get_thread()
-        thread.messages.filter(
-            is_read=False
-        ).exclude(
-            sender=request.user
-        ).update(is_read=True)
+        page = message_keyset_page(self.get_queryset(), request)
+
+        # Move my read marker to the newest message shown. Scrolling back
+        # through history cannot have revealed anything new.
+        if page and 'before_id' not in request.query_params:
+            self.thread.mark_read(request.user, page[-1].id)
         
-        serializer = self.get_serializer(reversed(queryset), many=True)
+        serializer = self.get_serializer(page, many=True)
         return Response(serializer.data)
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
         ctx['request'] = self.request
+        thread = getattr(self, 'thread', None)
+        if thread is not None:
+            # Read receipts: how far the other participant has read
+            ctx['other_last_read_id'] = max(
+                (mark for uid, mark in thread.read_markers.items() if uid != self.request.user.pk),
+                default=0,
+            )
         return ctx
 
     def perform_create(self, serializer):
-        thread = self._get_thread()
-        serializer.save(conversation=thread, sender=self.request.user)
+        self.thread = self._get_thread()
+        message = serializer.save(conversation=self.thread, sender=self.request.user)
+        # Sending implies having read everything before it
+        self.thread.mark_read(self.request.user, message.id)
 
 
 class DirectMessageDetailView(generics.DestroyAPIView):
@@ -962,18 +1221,8 @@ def message_reaction_view(request, message_id):
         if not emoji:
             return Response({'detail': 'emoji is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Delete any existing reaction from this user on this message (to enforce one reaction per user)
-        MessageReaction.objects.filter(
-            message=message,
-            user=request.user
-        ).delete()
-        
-        # Create the new reaction
-        reaction = MessageReaction.objects.create(
-            message=message,
-            user=request.user,
-            emoji=emoji
-        )
+        # One reaction per user: replaces any previous emoji and updates the summary
+        set_reaction(MessageReaction, message, request.user, emoji)
         
         return Response({
             'emoji': emoji,
@@ -985,14 +1234,10 @@ def message_reaction_view(request, message_id):
         if not emoji:
             return Response({'detail': 'emoji is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        deleted = MessageReaction.objects.filter(
-            message=message,
-            user=request.user,
-            emoji=emoji
-        ).delete()[0]
+        deleted = remove_reaction(MessageReaction, message, request.user, emoji)
         
         return Response({
-            'deleted': deleted > 0
+            'deleted': deleted
         }, status=status.HTTP_200_OK)
 # Add these two functions to the end of api/views.py
 
@@ -1011,18 +1256,9 @@ def chat_reaction_view(request, message_id):
         if not emoji:
             return Response({'detail': 'emoji is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Delete any existing reaction to enforce one reaction per user
-        CommunityMessageReaction.objects.filter(
-            message=message,
-            user=request.user
-        ).delete()
-        
-        # Create new reaction
-        CommunityMessageReaction.objects.create(
-            message=message,
-            user=request.user,
-            emoji=emoji
-        )
+        # One reaction per user: replaces any previous emoji and updates the summary
+        set_reaction(CommunityMessageReaction, message, request.user, emoji)
+        realtime.broadcast_reactions_changed(message)
         
         return Response({'emoji': emoji, 'created': True}, status=status.HTTP_201_CREATED)
     
@@ -1031,43 +1267,28 @@ def chat_reaction_view(request, message_id):
         if not emoji:
             return Response({'detail': 'emoji is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        deleted = CommunityMessageReaction.objects.filter(
-            message=message,
-            user=request.user,
-            emoji=emoji
-        ).delete()[0]
+        deleted = remove_reaction(CommunityMessageReaction, message, request.user, emoji)
+        if deleted:
+            realtime.broadcast_reactions_changed(message)
         
-        return Response({'deleted': deleted > 0}, status=status.HTTP_200_OK)
+        return Response({'deleted': deleted}, status=status.HTTP_200_OK)
 
 
 @api_view(['POST', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def community_chat_reaction_view(request, community_id, message_id):
     """Handle reactions on community chat messages"""
-    community = get_object_or_404(Community, pk=community_id)
-    message = get_object_or_404(ChatMessage, pk=message_id, community=community)
-    
-    # Check if user is a member
-    if not CommunityMembership.objects.filter(community=community, user=request.user).exists():
-        raise PermissionDenied('You are not a member of this community.')
+    require_member(request.user, community_id)
+    message = get_object_or_404(ChatMessage, pk=message_id, community_id=community_id)
     
     if request.method == 'POST':
         emoji = request.data.get('emoji', '').strip()
         if not emoji:
             return Response({'detail': 'emoji is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Delete any existing reaction to enforce one reaction per user
-        CommunityMessageReaction.objects.filter(
-            message=message,
-            user=request.user
-        ).delete()
-        
-        # Create new reaction
-        CommunityMessageReaction.objects.create(
-            message=message,
-            user=request.user,
-            emoji=emoji
-        )
+        # One reaction per user: replaces any previous emoji and updates the summary
+        set_reaction(CommunityMessageReaction, message, request.user, emoji)
+        realtime.broadcast_reactions_changed(message)
         
         return Response({'emoji': emoji, 'created': True}, status=status.HTTP_201_CREATED)
     
@@ -1076,10 +1297,8 @@ def community_chat_reaction_view(request, community_id, message_id):
         if not emoji:
             return Response({'detail': 'emoji is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        deleted = CommunityMessageReaction.objects.filter(
-            message=message,
-            user=request.user,
-            emoji=emoji
-        ).delete()[0]
+        deleted = remove_reaction(CommunityMessageReaction, message, request.user, emoji)
+        if deleted:
+            realtime.broadcast_reactions_changed(message)
         
-        return Response({'deleted': deleted > 0}, status=status.HTTP_200_OK)
+        return Response({'deleted': deleted}, status=status.HTTP_200_OK)
@@ -28,6 +28,8 @@ SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'dev-secret-key-change-this-in-
 
 # Message encryption key for DirectMessage encryption
 MESSAGE_ENCRYPTION_KEY = os.environ.get('MESSAGE_ENCRYPTION_KEY') 
+# Retired keys (comma-separated) still accepted for decryption during key rotation
+MESSAGE_ENCRYPTION_OLD_KEYS = os.environ.get('MESSAGE_ENCRYPTION_OLD_KEYS', '')
 
 # SECURITY WARNING: don't run with debug turned on in production!
 # Render sets 'RENDER' env var to 'true'
@@ -40,6 +42,7 @@ ALLOWED_HOSTS = ['*']
 # ⭐ ADD THE REQUIRED APPS HERE
 # ---------------------------------------------------------------
 INSTALLED_APPS = [
+    'daphne',       # ASGI runserver (HTTP + WebSockets)
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -51,6 +54,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework_simplejwt.token_blacklist',
     'storages',     # ⭐ ADD THIS
+    'channels',     # WebSocket chat push
     'api',          # <-- your API app
     'homepage',     # <-- your homepage/public page app
 ]
@@ -90,6 +94,54 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
+
+
+# ---------------------------------------------------------------
+# CHANNEL LAYERS (WebSocket fan-out)
+# ---------------------------------------------------------------
+# With REDIS_URL set, events are fanned out across all workers through Redis
+# (requires channels-redis). Otherwise an in-process layer is used, which
+# only reaches sockets connected to the same worker.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+
+# ---------------------------------------------------------------
+# CACHE (presence heartbeats, shared state between workers)
+# ---------------------------------------------------------------
+# Redis is shared by every worker (requires the redis package); the local
+# memory fallback is per-process, which is fine for a single worker.
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+# Presence: see homepage/presence.py
+PRESENCE_ONLINE_WINDOW = 300     # seconds since last heartbeat to count as online
+PRESENCE_HEARTBEAT_EVERY = 30    # throttle cache writes per user
+PRESENCE_FLUSH_INTERVAL = 60     # flush last_activity to the DB at most this often
 
 
 # ---------------------------------------------------------------
@@ -173,7 +225,8 @@ AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = 'media'
 AWS_S3_ENDPOINT_URL = 'https://tyeszjpfmtmftibxibwj.supabase.co/storage/v1/s3'
 AWS_S3_REGION_NAME = 'ap-southeast-1'
-AWS_S3_FILE_OVERWRITE = True
+# Never replace an existing object: storage picks a fresh name instead
+AWS_S3_FILE_OVERWRITE = False
 AWS_DEFAULT_ACL = None
 AWS_QUERYSTRING_AUTH = False
 AWS_S3_ADDRESSING_STYLE = "path"
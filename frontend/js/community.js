@@ -52,11 +52,24 @@ export function initCommunity() {
     let isAtBottom = true; // Track if user is scrolled to bottom
     let pollTimer = null;
     let searchTimer = null;
+    let currentMessages = []; // Last rendered list, patched in place by socket events
+    let currentMessagesRoom; // selectedCommunityId currentMessages belong to (undefined before the first load)
+    let pollCount = 0;
+    let socket = null;
+    let socketRetries = 0;
+    let reconnectTimer = null;
 
     function getChatListUrl() {
         return selectedCommunityId ? `/api/communities/${selectedCommunityId}/chat/` : '/api/chat/';
     }
 
+    function getChatSocketUrl() {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const path = selectedCommunityId ? `/ws/communities/${selectedCommunityId}/chat/` : '/ws/chat/';
+        const token = encodeURIComponent(localStorage.getItem('access') || '');
+        return `${scheme}://${window.location.host}${path}?token=${token}`;
+    }
+
     function getChatDeleteUrl(messageId) {
         return selectedCommunityId
             ? `/api/communities/${selectedCommunityId}/chat/${messageId}/`
@@ -78,9 +91,17 @@ export function initCommunity() {
     }
 
     async function loadCommunities() {
-        const res = await authFetch('/api/communities/');
-        if (!res.ok) return;
-        const communities = await res.json();
+        // Paginated by name: follow `next` until every community is loaded
+        const communities = [];
+        let url = '/api/communities/';
+        while (url) {
+            const res = await authFetch(url);
+            if (!res.ok) return;
+            const data = await res.json();
+            const page = Array.isArray(data) ? data : data.results;
+            communities.push(...page);
+            url = Array.isArray(data) ? null : data.next;
+        }
 
         // Rebuild select
         communitySelect.innerHTML = '';
@@ -126,50 +147,81 @@ export function initCommunity() {
         const c = (communities || []).find(x => x.id === selectedCommunityId);
         communityTitle.textContent = c ? c.name : `Community #${selectedCommunityId}`;
         communityMeta.textContent = c ? (c.is_admin ? 'Admin' : 'Member') : '';
+        membersCount.textContent = c ? `${c.member_count}` : '';
         membersGlobalHint.classList.add('hidden');
         membersPrivateUI.classList.remove('hidden');
     }
 
-    async function loadMembers() {
+    let membersNextUrl = null;
+
+    function renderMember(m) {
+        const avatar = m.avatar
+            ? `<img src="${m.avatar}" class="w-full h-full object-cover" />`
+            : `<div class="w-full h-full bg-purple-500 flex items-center justify-center text-xs font-bold text-white">${m.username[0].toUpperCase()}</div>`;
+
+        const badge = m.role === 'admin'
+            ? '<span class="text-[10px] px-2 py-0.5 rounded-full bg-cyan-500/20 text-cyan-300 border border-cyan-500/20">admin</span>'
+            : '';
+
+        return `
+            <div class="flex items-center gap-3 px-3 py-2 rounded-xl bg-white/5 border border-white/10">
+                <div class="w-8 h-8 rounded-full overflow-hidden border border-white/10 shrink-0">${avatar}</div>
+                <div class="min-w-0 flex-1">
+                    <div class="text-sm font-bold truncate">${m.display_name || m.username}</div>
+                    <div class="text-xs text-gray-500 truncate">@${m.username}</div>
+                </div>
+                ${badge}
+            </div>
+        `;
+    }
+
+    // Members come 100 at a time by username; `more` appends the next page
+    async function loadMembers(more = false) {
         if (!selectedCommunityId) {
             membersList.innerHTML = '';
             memberSearchResults.classList.add('hidden');
             return;
         }
 
-        const res = await authFetch(`/api/communities/${selectedCommunityId}/members/`);
+        const url = more && membersNextUrl ? membersNextUrl : `/api/communities/${selectedCommunityId}/members/`;
+        const res = await authFetch(url);
         if (!res.ok) {
             membersList.innerHTML = '<div class="text-sm text-gray-400">Unable to load members.</div>';
             return;
         }
 
-        const members = await res.json();
-        membersCount.textContent = `${members.length}`;
-
-        membersList.innerHTML = members.map(m => {
-            const avatar = m.avatar
-                ? `<img src="${m.avatar}" class="w-full h-full object-cover" />`
-                : `<div class="w-full h-full bg-purple-500 flex items-center justify-center text-xs font-bold text-white">${m.username[0].toUpperCase()}</div>`;
+        const data = await res.json();
+        const members = Array.isArray(data) ? data : data.results;
+        membersNextUrl = Array.isArray(data) ? null : data.next;
 
-            const badge = m.role === 'admin'
-                ? '<span class="text-[10px] px-2 py-0.5 rounded-full bg-cyan-500/20 text-cyan-300 border border-cyan-500/20">admin</span>'
-                : '';
+        const html = members.map(renderMember).join('');
+        if (more) {
+            membersList.querySelector('.members-more-btn')?.remove();
+            membersList.insertAdjacentHTML('beforeend', html);
+        } else {
+            membersList.innerHTML = html;
+        }
 
-            return `
-                <div class="flex items-center gap-3 px-3 py-2 rounded-xl bg-white/5 border border-white/10">
-                    <div class="w-8 h-8 rounded-full overflow-hidden border border-white/10 shrink-0">${avatar}</div>
-                    <div class="min-w-0 flex-1">
-                        <div class="text-sm font-bold truncate">${m.display_name || m.username}</div>
-                        <div class="text-xs text-gray-500 truncate">@${m.username}</div>
-                    </div>
-                    ${badge}
-                </div>
-            `;
-        }).join('');
+        if (membersNextUrl) {
+            membersList.insertAdjacentHTML(
+                'beforeend',
+                '<button class="members-more-btn w-full text-xs text-gray-400 hover:text-white py-2">Load more members</button>'
+            );
+            membersList.querySelector('.members-more-btn').addEventListener('click', () => loadMembers(true));
+        }
     }
 
-    async function loadMessages() {
-        const res = await authFetch(getChatListUrl());
+    async function loadMessages({ incremental = false } = {}) {
+        const room = selectedCommunityId;
+
+        // Polls only ask for messages newer than the last one we have
+        const lastId = currentMessagesRoom === room && currentMessages.length
+            ? currentMessages[currentMessages.length - 1].id
+            : null;
+        const useCursor = incremental && lastId !== null;
+        const url = useCursor ? `${getChatListUrl()}?after_id=${lastId}` : getChatListUrl();
+
+        const res = await authFetch(url);
         if (!res.ok) {
             if (res.status === 403) {
                 messagesContainer.innerHTML = '<div class="text-center mt-10"><p class="text-gray-400">You are not a member of this community.</p></div>';
@@ -178,7 +230,74 @@ export function initCommunity() {
             return;
         }
         const messages = await res.json();
-        renderMessages(messages);
+        if (room !== selectedCommunityId) return; // Room switched mid-request
+
+        if (useCursor) {
+            // Socket events may have delivered some of them already
+            const fresh = messages.filter(m => !currentMessages.some(c => c.id === m.id));
+            if (!fresh.length) return; // Nothing new, keep the DOM as-is
+            currentMessages = [...currentMessages, ...fresh];
+        } else {
+            currentMessages = messages;
+            currentMessagesRoom = room;
+        }
+        renderMessages(currentMessages);
+    }
+
+    // =============================================
+    // REAL-TIME PUSH (WebSocket, polling as fallback)
+    // =============================================
+    function handleSocketEvent(data) {
+        const payload = data.payload || {};
+        if ((payload.community_id || null) !== selectedCommunityId) return;
+
+        if (data.event === 'message.created') {
+            if (currentMessages.some(m => m.id === payload.id)) return;
+            currentMessages = [...currentMessages, payload];
+        } else if (data.event === 'message.deleted') {
+            currentMessages = currentMessages.filter(m => m.id !== payload.id);
+        } else if (data.event === 'reactions.updated') {
+            currentMessages = currentMessages.map(m => m.id === payload.id ? { ...m, reactions: payload.reactions } : m);
+        } else {
+            return;
+        }
+        renderMessages(currentMessages);
+    }
+
+    function connectSocket() {
+        clearTimeout(reconnectTimer);
+        if (socket) {
+            socket.onclose = null;
+            socket.close();
+        }
+
+        const ws = new WebSocket(getChatSocketUrl());
+        socket = ws;
+
+        ws.onopen = () => {
+            socketRetries = 0;
+            stopPolling();
+            loadMessages(); // Resync anything missed while disconnected
+        };
+
+        ws.onmessage = (e) => {
+            try {
+                handleSocketEvent(JSON.parse(e.data));
+            } catch (err) {
+                console.error('Bad chat event', err);
+            }
+        };
+
+        ws.onclose = (e) => {
+            if (socket !== ws) return;
+            socket = null;
+            startPolling();
+            // 4403: not a member of this community, retrying will not help
+            if (e.code === 4403) return;
+            const delay = Math.min(30000, 1000 * 2 ** socketRetries);
+            socketRetries += 1;
+            reconnectTimer = setTimeout(connectSocket, delay);
+        };
     }
 
     // =============================================
@@ -441,6 +560,7 @@ export function initCommunity() {
         await loadCommunities();
         await loadMembers();
         await loadMessages();
+        connectSocket();
     });
 
     openCreateBtn.addEventListener('click', () => {
@@ -475,6 +595,7 @@ export function initCommunity() {
             await loadCommunities();
             await loadMembers();
             await loadMessages();
+            connectSocket();
             showToast('Community created', 'success');
         } else {
             const data = await res.json().catch(() => ({}));
@@ -484,13 +605,13 @@ export function initCommunity() {
 
     async function performUserSearch(query) {
         if (!selectedCommunityId) return;
-        if (!query || query.trim().length < 2) {
+        if (!query || !query.trim()) {
             memberSearchResults.classList.add('hidden');
             memberSearchResults.innerHTML = '';
             return;
         }
 
-        const res = await authFetch(`/api/search/users/?q=${encodeURIComponent(query.trim())}`);
+        const res = await authFetch(`/api/search/users/autocomplete/?q=${encodeURIComponent(query.trim())}`);
         if (!res.ok) {
             memberSearchResults.classList.add('hidden');
             return;
@@ -543,6 +664,7 @@ export function initCommunity() {
             memberSearchInput.value = '';
             memberSearchResults.classList.add('hidden');
             await loadMembers();
+            await loadCommunities();
         } else {
             const data = await res.json().catch(() => ({}));
             showToast(data.detail || 'Failed to add member (are you an admin?)', 'error');
@@ -568,9 +690,19 @@ export function initCommunity() {
         isAtBottom = scrollBottom < threshold;
     });
 
-    async function startPolling() {
+    function startPolling() {
+        if (pollTimer) clearInterval(pollTimer);
+        pollTimer = setInterval(() => {
+            // Most polls only fetch new messages; every 10th does a full
+            // reload to pick up reactions and deletions.
+            pollCount += 1;
+            loadMessages({ incremental: pollCount % 10 !== 0 });
+        }, 3000);
+    }
+
+    function stopPolling() {
         if (pollTimer) clearInterval(pollTimer);
-        pollTimer = setInterval(loadMessages, 3000);
+        pollTimer = null;
     }
 
     (async () => {
@@ -584,6 +716,7 @@ export function initCommunity() {
         await loadCommunities();
         await loadMembers();
         await loadMessages();
-        await startPolling();
+        startPolling();
+        connectSocket();
     })();
 }
@@ -233,13 +233,7 @@ export function initDashboard() {
                     avatarPreview.src = URL.createObjectURL(blob);
                 } else if (cropperUploadType === 'gallery') {
                     // Upload as gallery photo
-                    formData.append('image', blob, 'cropped.jpg');
-                    formData.append('caption', galleryCaption);
-
-                    await authFetch('/api/photos/', {
-                        method: 'POST',
-                        body: formData
-                    });
+                    await uploadGalleryPhoto(blob, galleryCaption);
 
                     // Reload gallery
                     loadPhotos();
@@ -340,7 +334,43 @@ export function initDashboard() {
         document.getElementById('add-photo-btn').onclick = () => photoModal.classList.remove('hidden');
         document.getElementById('photo-cancel').onclick = () => photoModal.classList.add('hidden');
 
+        // Upload a gallery photo straight to storage (presigned PUT), so the
+        // bytes never pass through our servers. Storage checks them against
+        // the SHA-256 we declare. Falls back to a multipart POST /api/photos/
+        // when direct uploads (or WebCrypto) are unavailable.
+        async function sha256Hex(blob) {
+            const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+            return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+        }
+
+        async function uploadGalleryPhoto(blob, caption) {
+            const sha256 = window.crypto && crypto.subtle ? await sha256Hex(blob).catch(() => null) : null;
+            const target = sha256 && await authFetch('/api/photos/upload-url/', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ content_type: blob.type || 'image/jpeg', sha256 })
+            }).catch(() => null);
+
+            if (target && target.ok) {
+                const { key, put } = await target.json();
+                const stored = await fetch(put.url, { method: 'PUT', headers: put.headers, body: blob }).catch(() => null);
+                if (stored && stored.ok) {
+                    return authFetch('/api/photos/complete/', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ key, caption })
+                    });
+                }
+            }
+
+            const formData = new FormData();
+            formData.append('image', blob, 'photo.jpg');
+            formData.append('caption', caption);
+            return authFetch('/api/photos/', { method: 'POST', body: formData });
+        }
+
         // Load Photos
+        let photoUploadPoll = null;
         async function loadPhotos() {
             const res = await authFetch('/api/photos/');
             if (res.ok) {
@@ -360,9 +390,22 @@ export function initDashboard() {
                     addBtn.style.display = ''; // Reset to default
                 }
 
+                // Uploads finish in the background: show a placeholder and check back
+                const pending = photos.some(p => p.upload_status === 'pending');
+                clearTimeout(photoUploadPoll);
+                if (pending) photoUploadPoll = setTimeout(loadPhotos, 3000);
+
                 galleryGrid.innerHTML = photos.map(photo => `
                     <div class="relative group aspect-square bg-black/20 rounded-xl overflow-hidden">
-                        <img src="${photo.image}" class="w-full h-full object-cover">
+                        ${photo.upload_status === 'uploaded'
+                            ? `<picture class="block w-full h-full">
+                                   ${photo.images?.medium ? `<source srcset="${photo.images.medium.webp}" type="image/webp">` : ''}
+                                   <img src="${photo.images?.medium?.jpeg || photo.image}" loading="lazy" class="w-full h-full object-cover">
+                               </picture>`
+                            : `<div class="w-full h-full flex flex-col items-center justify-center gap-2 text-gray-400 text-xs">
+                                   <i class="fas ${photo.upload_status === 'failed' ? 'fa-exclamation-triangle text-red-400' : 'fa-spinner fa-spin'} text-2xl"></i>
+                                   ${photo.upload_status === 'failed' ? 'Upload failed' : 'Uploading...'}
+                               </div>`}
                         <div class="absolute inset-0 bg-black/60 opacity-0 group-hover:opacity-100 transition flex items-center justify-center">
                             <button onclick="deletePhoto(${photo.id})" class="text-red-400 hover:text-red-300">
                                 <i class="fas fa-trash text-2xl"></i>
@@ -447,27 +490,19 @@ export function initDashboard() {
             // Set loading state
             setButtonLoading(submitBtn, true);
 
-            // Get cropped canvas and convert to blob
-            // Get Base64 String (JPEG 80% Quality)
-            const base64Image = photoCropper.getCroppedCanvas().toDataURL('image/jpeg', 0.8);
+            // Get cropped canvas and convert to blob (JPEG 80% Quality).
+            // Sent as multipart so the server can stream it to disk.
+            const blob = await new Promise(resolve =>
+                photoCropper.getCroppedCanvas().toBlob(resolve, 'image/jpeg', 0.8));
 
             // Vercel Limit Check
-            if (base64Image.length > 5.5 * 1024 * 1024) {
+            if (!blob || blob.size > 4 * 1024 * 1024) {
                 showToast("Image is too large (Max 4MB).", 'error');
                 setButtonLoading(submitBtn, false);
                 return;
             }
 
-            const payload = {
-                image: base64Image,
-                caption: document.getElementById('caption-input').value
-            };
-
-            const res = await authFetch('/api/photos/', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(payload)
-            });
+            const res = await uploadGalleryPhoto(blob, document.getElementById('caption-input').value);
 
             if (res.ok) {
                 // Clean up
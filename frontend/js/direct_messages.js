@@ -91,6 +91,10 @@ export function initDirectMessages() {
     let isHoveringReactionMenu = false; // Track if user is hovering over reaction menu
     let selectedOtherUser = null;
     let pollTimer = null;
+    let currentMessages = []; // Messages of the open thread, oldest first
+    let currentMessagesThreadId = null;
+    let pollCount = 0;
+    let otherLastReadId = 0; // Read receipt: the other participant has read up to this message id
     let searchTimer = null;
 
     function setSelectedThreadFromStorage() {
@@ -287,7 +291,9 @@ export function initDirectMessages() {
             return;
         }
 
-        const threads = await res.json();
+        // Cursor-paginated: the first page holds the most recently active threads
+        const data = await res.json();
+        const threads = Array.isArray(data) ? data : data.results;
 
         // Fix selection
         if (selectedThreadId) {
@@ -311,6 +317,9 @@ export function initDirectMessages() {
         setHeader(selectedOtherUser);
         setComposerEnabled(!!selectedThreadId);
 
+        const selectedThread = threads.find(t => t.id === selectedThreadId);
+        otherLastReadId = selectedThread?.other_last_read_id || 0;
+
         renderThreads(threads);
 
         if (alsoLoadMessages && selectedThreadId) {
@@ -420,6 +429,10 @@ export function initDirectMessages() {
         const messagesToRender = originalMessages.filter(msg =>
             !msg.text.includes('🎥 Video call ended') && !msg.text.includes('🚫 Call ended'));
 
+        // "Seen" goes under my newest message the other participant has read
+        const seenMessage = [...messagesToRender].reverse()
+            .find(m => m.is_me && (m.is_seen || m.id <= otherLastReadId));
+
         messagesToRender.forEach(msg => {
             const isMe = msg.is_me;
             const div = document.createElement('div');
@@ -516,7 +529,7 @@ export function initDirectMessages() {
                         ${deleteBtn}
                     </div>
                     <div class="${bubbleClass} px-4 py-2 shadow-sm break-words text-sm leading-relaxed">${messageContent}</div>
-                    <span class="text-[9px] text-gray-500 mt-1 px-1">${formatMessageTime(msg.created_at)}</span>
+                    <span class="text-[9px] text-gray-500 mt-1 px-1">${formatMessageTime(msg.created_at)}${msg === seenMessage ? ' · <i class="fas fa-check-double text-cyan-400"></i> Seen' : ''}</span>
                     ${reactionsHtml}
                 </div>
             `;
@@ -577,9 +590,20 @@ export function initDirectMessages() {
         messagesEl.scrollTop = messagesEl.scrollHeight;
     }
 
-    async function loadMessages() {
+    async function loadMessages({ incremental = false } = {}) {
         if (!selectedThreadId) return;
-        const res = await authFetch(`/api/dm/threads/${selectedThreadId}/messages/`);
+        const threadId = selectedThreadId;
+
+        // Polls only ask for messages newer than the last one we have
+        const lastId = currentMessagesThreadId === threadId && currentMessages.length
+            ? currentMessages[currentMessages.length - 1].id
+            : null;
+        const useCursor = incremental && lastId !== null;
+        const url = useCursor
+            ? `/api/dm/threads/${threadId}/messages/?after_id=${lastId}`
+            : `/api/dm/threads/${threadId}/messages/`;
+
+        const res = await authFetch(url);
         if (!res.ok) {
             if (res.status === 403) {
                 messagesEl.innerHTML = '<div class="text-center mt-10"><p class="text-gray-400">You are not allowed to view this chat.</p></div>';
@@ -587,7 +611,16 @@ export function initDirectMessages() {
             return;
         }
         const messages = await res.json();
-        renderMessages(messages);
+        if (threadId !== selectedThreadId) return; // Thread switched mid-request
+
+        if (useCursor) {
+            if (!messages.length) return; // Nothing new, keep the DOM as-is
+            currentMessages = [...currentMessages, ...messages];
+        } else {
+            currentMessages = messages;
+            currentMessagesThreadId = threadId;
+        }
+        renderMessages(currentMessages);
     }
 
     async function sendMessage(text) {
@@ -650,13 +683,13 @@ export function initDirectMessages() {
     }
 
     async function performUserSearch(query) {
-        if (!query || query.trim().length < 2) {
+        if (!query || !query.trim()) {
             userSearchResults.classList.add('hidden');
             userSearchResults.innerHTML = '';
             return;
         }
 
-        const res = await authFetch(`/api/search/users/?q=${encodeURIComponent(query.trim())}`);
+        const res = await authFetch(`/api/search/users/autocomplete/?q=${encodeURIComponent(query.trim())}`);
         if (!res.ok) {
             userSearchResults.classList.add('hidden');
             return;
@@ -722,9 +755,12 @@ export function initDirectMessages() {
     async function startPolling() {
         if (pollTimer) clearInterval(pollTimer);
         pollTimer = setInterval(async () => {
-            // Refresh messages in current conversation
+            // Refresh messages in current conversation. Most polls only fetch
+            // new messages; every 10th does a full reload to pick up
+            // reactions and deletions.
             if (selectedThreadId) {
-                await loadMessages();
+                pollCount += 1;
+                await loadMessages({ incremental: pollCount % 10 !== 0 });
             }
             // Also refresh thread list to update unread counts
             await loadThreads(false);
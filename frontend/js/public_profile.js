@@ -49,6 +49,18 @@ export function initPublicProfile() {
     // Initial fetch (fire and forget)
     fetchCurrentUser();
 
+    // --- Profile Bundle (education, experience, skills, ...) ---
+    // One request for all sections instead of one per section.
+    let bundlePromise = null;
+    function loadBundle(username) {
+        if (!bundlePromise) {
+            bundlePromise = fetch(`/api/profiles/${encodeURIComponent(username)}/bundle/`)
+                .then(res => (res.ok ? res.json() : null))
+                .catch(() => null);
+        }
+        return bundlePromise;
+    }
+
     // --- Load Education Data ---
     async function loadEducation() {
         // Get username from URL path: /u/username/
@@ -58,16 +70,11 @@ export function initPublicProfile() {
         if (!username) return;
 
         try {
-            const headers = accessToken ? {
-                'Authorization': `Bearer ${accessToken}`,
-                'Content-Type': 'application/json'
-            } : { 'Content-Type': 'application/json' };
-
-            // Fetch public data filtering by username
-            const res = await fetch(`/api/education/?username=${username}`, { headers });
+            // Every section comes from the one (cached) profile bundle
+            const bundle = await loadBundle(username);
 
-            if (res.ok) {
-                const educations = await res.json();
+            if (bundle) {
+                const educations = bundle.education;
                 const educationSection = document.getElementById('education-section');
                 const educationListPublic = document.getElementById('education-list-public');
 
@@ -104,16 +111,11 @@ export function initPublicProfile() {
         if (!username) return;
 
         try {
-            const headers = accessToken ? {
-                'Authorization': `Bearer ${accessToken}`,
-                'Content-Type': 'application/json'
-            } : { 'Content-Type': 'application/json' };
-
-            // Fetch public data filtering by username
-            const res = await fetch(`/api/experience/?username=${username}`, { headers });
+            // Every section comes from the one (cached) profile bundle
+            const bundle = await loadBundle(username);
 
-            if (res.ok) {
-                const experiences = await res.json();
+            if (bundle) {
+                const experiences = bundle.experience;
                 const experienceSection = document.getElementById('experience-section');
                 const experienceListPublic = document.getElementById('experience-list-public');
 
@@ -161,16 +163,11 @@ export function initPublicProfile() {
         if (!username) return;
 
         try {
-            const headers = accessToken ? {
-                'Authorization': `Bearer ${accessToken}`,
-                'Content-Type': 'application/json'
-            } : { 'Content-Type': 'application/json' };
+            // Every section comes from the one (cached) profile bundle
+            const bundle = await loadBundle(username);
 
-            // Fetch public data filtering by username
-            const res = await fetch(`/api/skills/?username=${username}`, { headers });
-
-            if (res.ok) {
-                const skills = await res.json();
+            if (bundle) {
+                const skills = bundle.skills;
                 const skillsSection = document.getElementById('skills-section');
                 const skillsListPublic = document.getElementById('skills-list-public');
 
@@ -192,6 +189,17 @@ export function initPublicProfile() {
     // Load skills on page load
     loadSkills();
 
+    // Like state of every photo on this profile, keyed by photo id.
+    // The endpoint sends an ETag and no-cache, so the browser revalidates
+    // and unchanged galleries come back as 304 Not Modified.
+    async function fetchLikeStates(headers) {
+        const username = window.location.pathname.split('/')[2];
+        const res = await fetch(`/api/photos/likes/?username=${encodeURIComponent(username)}`, { headers });
+        if (!res.ok) return {};
+        const data = await res.json();
+        return data.photos || {};
+    }
+
     // --- 1. Load Data (Likes & Comments) ---
     async function loadPhotoData(photoId, isPolling = false) {
         // CRITICAL: Always ensure currentUser is loaded before rendering comments
@@ -203,6 +211,8 @@ export function initPublicProfile() {
         if (!isPolling) {
             // First load: Show loading state
             currentPhotoId = photoId;
+            olderComments = [];
+            extraReplies = {};
             commentsList.innerHTML = '<p class="text-xs text-gray-500 text-center">Loading interactions...</p>';
             likeCount.textContent = '...';
             likeBtn.innerHTML = '<i class="fas fa-infinity"></i>';
@@ -211,20 +221,21 @@ export function initPublicProfile() {
         }
 
         try {
-            // A. Fetch Likes Status
+            // A. Fetch Likes Status (whole gallery in one request; polls are 304s until something changes)
             const likeHeaders = accessToken ? getAuthHeaders() : { 'Content-Type': 'application/json' };
-            const likeRes = await fetch(`/api/photos/${photoId}/like/`, { headers: likeHeaders });
-
-            if (likeRes.ok) {
-                const likeData = await likeRes.json();
+            const likeStates = await fetchLikeStates(likeHeaders);
+            const likeData = likeStates[photoId];
+            if (likeData) {
                 updateLikeUI(likeData.is_liked, likeData.like_count);
             }
 
             // B. Fetch Comments
             const commentsRes = await fetch(`/api/photos/${photoId}/comments/`, { headers: likeHeaders });
             if (commentsRes.ok) {
-                const comments = await commentsRes.json();
-                renderComments(comments);
+                const page = await commentsRes.json();
+                commentsHasOlder = page.has_older;
+                latestComments = page.results;
+                renderComments(mergeCommentPages());
             }
         } catch (err) {
             console.error("Error loading photo data:", err);
@@ -260,6 +271,58 @@ export function initPublicProfile() {
     let replyingToId = null;
     let replyingToUser = null;
 
+    // Comment pages: the poll refreshes the latest page; earlier top-level
+    // comments and extra replies loaded on demand are kept and merged in.
+    let latestComments = [];
+    let olderComments = [];
+    let commentsHasOlder = false;
+    let extraReplies = {}; // root id -> { replies: [...], next: id|null }
+
+    function mergeCommentPages() {
+        const firstLatest = latestComments.length ? latestComments[0].id : Infinity;
+        const roots = olderComments.filter(c => c.id < firstLatest).concat(latestComments);
+        return roots.map(root => {
+            const extra = extraReplies[root.id];
+            if (!extra) return root;
+            // Hang the extra replies under their parents (copying the preview tree)
+            const copy = node => ({ ...node, replies: (node.replies || []).map(copy) });
+            const tree = copy(root);
+            const nodes = {};
+            const index = node => { nodes[node.id] = node; node.replies.forEach(index); };
+            index(tree);
+            extra.replies.forEach(reply => {
+                if (nodes[reply.id] || !nodes[reply.parent_id]) return;
+                const node = { ...reply, replies: [] };
+                nodes[reply.parent_id].replies.push(node);
+                nodes[reply.id] = node;
+            });
+            tree.more_replies_after = extra.next;
+            return tree;
+        });
+    }
+
+    async function loadOlderComments() {
+        const all = mergeCommentPages();
+        if (!all.length) return;
+        const headers = accessToken ? getAuthHeaders() : {};
+        const res = await fetch(`/api/photos/${currentPhotoId}/comments/?before_id=${all[0].id}`, { headers });
+        if (!res.ok) return;
+        const page = await res.json();
+        olderComments = page.results.concat(olderComments);
+        commentsHasOlder = page.has_older;
+        renderComments(mergeCommentPages());
+    }
+
+    async function loadMoreReplies(rootId, afterId) {
+        const headers = accessToken ? getAuthHeaders() : {};
+        const res = await fetch(`/api/photos/${currentPhotoId}/comments/${rootId}/replies/?after_id=${afterId}`, { headers });
+        if (!res.ok) return;
+        const page = await res.json();
+        const extra = extraReplies[rootId] || { replies: [] };
+        extraReplies[rootId] = { replies: extra.replies.concat(page.results), next: page.next_after_id };
+        renderComments(mergeCommentPages());
+    }
+
     // --- 2. Action Handlers --- 
 
     // Helper to render single comment (recursive)
@@ -315,6 +378,11 @@ export function initPublicProfile() {
             });
         }
 
+        // Rest of the thread is loaded on demand
+        if (!isNested && comment.more_replies_after) {
+            html += `<button class="more-replies-btn ml-10 text-xs text-gray-400 hover:text-white" data-root="${comment.id}" data-after="${comment.more_replies_after}">View more replies</button>`;
+        }
+
         html += `</div>`;
         return html;
     }
@@ -330,6 +398,9 @@ export function initPublicProfile() {
         } else {
             newHTML = comments.map(c => createCommentHTML(c)).join('');
         }
+        if (commentsHasOlder) {
+            newHTML = '<button class="older-comments-btn w-full text-xs text-gray-400 hover:text-white mb-3">Load earlier comments</button>' + newHTML;
+        }
 
         // OPTIMIZATION: Don't re-render if content hasn't changed
         // This prevents "flash" and keeps event listeners stable unless data actually changed
@@ -344,6 +415,15 @@ export function initPublicProfile() {
             btn.addEventListener('click', handleDeleteComment);
         });
 
+        document.querySelectorAll('.more-replies-btn').forEach(btn => {
+            btn.addEventListener('click', (e) => {
+                loadMoreReplies(e.target.getAttribute('data-root'), e.target.getAttribute('data-after'));
+            });
+        });
+
+        const olderBtn = document.querySelector('.older-comments-btn');
+        if (olderBtn) olderBtn.addEventListener('click', loadOlderComments);
+
         document.querySelectorAll('.reply-comment-btn').forEach(btn => {
             btn.addEventListener('click', (e) => {
                 const id = e.target.getAttribute('data-id');
@@ -486,7 +566,7 @@ export function initPublicProfile() {
     galleryItems.forEach(item => {
         item.addEventListener('click', (e) => {
             e.stopPropagation();
-            const imgSrc = item.getAttribute('src');
+            const imgSrc = item.getAttribute('data-full') || item.getAttribute('src');
             const caption = item.getAttribute('data-caption');
             const photoId = item.getAttribute('data-photo-id');
 
@@ -1,7 +1,13 @@
-from django.utils import timezone
-from .models import Profile
+from . import presence
 
 class ActiveUserMiddleware:
+    """
+    Record a presence heartbeat for authenticated requests.
+
+    Heartbeats go to the presence store (cache) and are flushed to
+    Profile.last_activity in bulk, instead of a get_or_create + save on
+    every request. See homepage/presence.py.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
 
@@ -9,19 +15,9 @@ class ActiveUserMiddleware:
         response = self.get_response(request)
         
         if request.user.is_authenticated:
-            # Update last_activity with minimal overhead
-            # We use update() to avoid triggering signals/other saves if possible, 
-            # but auto_now=True needs save().
-            # Let's just retrieve and save profile efficiently.
-            
             try:
-                # Get or create profile to be safe
-                profile, created = Profile.objects.get_or_create(user=request.user)
-                
-                # Only update if more than 1 minute has passed to reduce DB writes
-                # But for now, let's just save() to ensure auto_now works
-                profile.save(update_fields=['last_activity'])
-                
+                presence.record_heartbeat(request.user.id)
+                presence.maybe_flush()
             except Exception:
                 pass
                 
@@ -1,12 +1,13 @@
 from django.contrib import admin
 
-from .models import Community, CommunityMembership, ChatMessage, Profile, UserPhoto, PhotoLike, PhotoComment
+from .models import Community, CommunityMembership, ChatMessage, Profile, UserPhoto, MediaBlob, PhotoLike, PhotoComment
 
 admin.site.register(Community)
 admin.site.register(CommunityMembership)
 admin.site.register(ChatMessage)
 admin.site.register(Profile)
 admin.site.register(UserPhoto)
+admin.site.register(MediaBlob)
 admin.site.register(PhotoLike)
 admin.site.register(PhotoComment)
 
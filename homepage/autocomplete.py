@@ -0,0 +1,202 @@
+"""
+In-process username autocomplete index.
+
+Each worker keeps every username in a sorted list of (key, user_id)
+pairs and answers prefix lookups with a binary search, without touching
+the database. Keys are the lowercased username plus every part of it
+after a separator ("anna_k" is found by "an" and by "k"); display names
+are the leading letters of the username, so they are covered too.
+
+The index is built from UserSearchDocument on first use. Changes made by
+this worker (UserSearchDocument.refresh, i.e. user creation, renames
+and profile saves) are applied once their transaction commits; changes
+made by other workers are picked up by a catch-up query on updated_at at
+most every AUTOCOMPLETE_SYNC_INTERVAL seconds, and the whole index is
+rebuilt every AUTOCOMPLETE_REBUILD_INTERVAL seconds to drop deleted
+users. Callers load the matched users from the database, so a user
+deleted since the last rebuild is never returned.
+
+Only one thread per worker builds or syncs at a time. The first build
+blocks lookups (there is nothing to answer from yet); later rebuilds run
+in a background thread while lookups keep using the previous index.
+
+Settings (all optional):
+    AUTOCOMPLETE_SYNC_INTERVAL      seconds between catch-up queries (5)
+    AUTOCOMPLETE_REBUILD_INTERVAL   seconds between full rebuilds (3600)
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Rows committed shortly before a catch-up query may carry an updated_at
+# older than the previous one; re-reading a window of them is harmless.
+SYNC_OVERLAP = timedelta(seconds=30)
+# Matches looked at per lookup before ranking (bounds very short prefixes)
+SCAN_LIMIT = 500
+
+SEPARATORS = re.compile(r'[\s_.\-]+')
+
+_lock = threading.Lock()
+_build_lock = threading.Lock()   # held by the one thread building or syncing
+_keys = []       # sorted (key, user_id)
+_by_user = {}    # user_id -> keys of that user in _keys
+_built_at = None     # time.monotonic() of the last full build
+_checked_at = 0.0    # time.monotonic() of the last catch-up query
+_synced_at = None    # DB time the next catch-up query starts from
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def keys_for(username):
+    """The index keys of ``username``: itself and every part after a separator, lowercased."""
+    username = username.lower()
+    keys = [username]
+    for match in SEPARATORS.finditer(username):
+        tail = username[match.end():]
+        if tail:
+            keys.append(tail)
+    return keys
+
+
+def _set(user_id, username):
+    """Add or replace one user; the caller holds _lock."""
+    for key in _by_user.pop(user_id, ()):
+        i = bisect.bisect_left(_keys, (key, user_id))
+        if i < len(_keys) and _keys[i] == (key, user_id):
+            del _keys[i]
+    keys = keys_for(username)
+    for key in keys:
+        bisect.insort(_keys, (key, user_id))
+    _by_user[user_id] = keys
+
+
+def rebuild():
+    """(Re)load the whole index from UserSearchDocument."""
+    from .models import UserSearchDocument
+
+    global _keys, _by_user, _built_at, _checked_at, _synced_at
+    started = timezone.now()
+    entries = []
+    by_user = {}
+    for user_id, username in UserSearchDocument.objects.values_list('user_id', 'username').iterator(chunk_size=5000):
+        keys = keys_for(username)
+        by_user[user_id] = keys
+        entries.extend((key, user_id) for key in keys)
+    entries.sort()
+    with _lock:
+        _keys, _by_user = entries, by_user
+        _built_at = _checked_at = time.monotonic()
+        _synced_at = started
+    return len(by_user)
+
+
+def sync():
+    """Apply the documents changed (by any worker) since the last sync."""
+    from .models import UserSearchDocument
+
+    global _checked_at, _synced_at
+    started = timezone.now()
+    changed = list(
+        UserSearchDocument.objects.filter(updated_at__gte=_synced_at - SYNC_OVERLAP)
+        .values_list('user_id', 'username')
+    )
+    with _lock:
+        for user_id, username in changed:
+            _set(user_id, username)
+        _checked_at = time.monotonic()
+        _synced_at = started
+    return len(changed)
+
+
+def _refresh_in_background():
+    """Rebuild in a thread; the caller holds _build_lock, released when done."""
+    def run():
+        close_old_connections()
+        try:
+            rebuild()
+        except Exception:
+            logger.exception('Autocomplete rebuild failed')
+        finally:
+            _build_lock.release()
+            close_old_connections()
+    threading.Thread(target=run, name='autocomplete-rebuild', daemon=True).start()
+
+
+def ensure_fresh():
+    """Build, rebuild or catch up the index as the intervals require."""
+    if _built_at is None:
+        with _build_lock:
+            if _built_at is None:
+                rebuild()
+        return
+    now = time.monotonic()
+    stale = now - _built_at >= _setting('AUTOCOMPLETE_REBUILD_INTERVAL', 3600)
+    behind = now - _checked_at >= _setting('AUTOCOMPLETE_SYNC_INTERVAL', 5)
+    if not (stale or behind) or not _build_lock.acquire(blocking=False):
+        return  # fresh enough, or another thread is on it
+    if stale:
+        _refresh_in_background()
+        return
+    try:
+        sync()
+    finally:
+        _build_lock.release()
+
+
+def update(user_id, username):
+    """Index ``username`` for ``user_id`` in this worker once the current transaction commits."""
+    def apply():
+        if _built_at is None:
+            return  # built from the database on first use
+        with _lock:
+            _set(user_id, username)
+    transaction.on_commit(apply)
+
+
+def complete(prefix, limit=10, boost=()):
+    """
+    Ids of up to ``limit`` users with a key starting with ``prefix``.
+    Users in ``boost`` come first, then username (rather than
+    name-part) matches, then alphabetical order.
+    """
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return []
+    ensure_fresh()
+    matches = {}
+
+    def add(key, user_id):
+        rank = (user_id not in boost, key != _by_user[user_id][0], key)
+        if user_id not in matches or rank < matches[user_id]:
+            matches[user_id] = rank
+
+    with _lock:
+        start = bisect.bisect_left(_keys, (prefix,))
+        end = bisect.bisect_left(_keys, (prefix + '\U0010ffff',), start)
+        for i in range(start, min(end, start + SCAN_LIMIT)):
+            add(*_keys[i])
+        # Boosted users past the scan window: walk whichever is shorter,
+        # the rest of the prefix range or the boost set
+        rest = end - start - SCAN_LIMIT
+        if 0 < rest <= len(boost):
+            for i in range(start + SCAN_LIMIT, end):
+                if _keys[i][1] in boost:
+                    add(*_keys[i])
+        elif rest > 0:
+            for user_id in boost:
+                if user_id not in matches:
+                    for key in _by_user.get(user_id, ()):
+                        if key.startswith(prefix):
+                            add(key, user_id)
+    return sorted(matches, key=matches.get)[:limit]
@@ -1,69 +1,185 @@
 """
 Message encryption utilities using Fernet symmetric encryption.
+
+Keys come from settings:
+    MESSAGE_ENCRYPTION_KEY       current key, used for all new encryption
+    MESSAGE_ENCRYPTION_OLD_KEYS  optional comma-separated retired keys that
+                                 are still accepted for decryption (rotation)
+
+The cipher is built once per process and rebuilt only when those settings
+change, instead of on every encrypt/decrypt call.
+
+Encryption never falls back to plaintext: without a usable key it raises
+ImproperlyConfigured, so nothing is stored unencrypted. Decryption failures
+are logged and the stored text is returned as-is.
 """
-from cryptography.fernet import Fernet
+import logging
+import threading
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+# Fernet tokens are base64 of a 0x80 version byte + timestamp, so they always start with this
+FERNET_PREFIX = 'gAAAAA'
+
+
+def _clean_key(key):
+    # Clean the key of whitespace and surrounding quotes
+    return key.strip().strip("'").strip('"') if key else ''
+
+
+def _raw_keys():
+    return (
+        getattr(settings, 'MESSAGE_ENCRYPTION_KEY', None),
+        getattr(settings, 'MESSAGE_ENCRYPTION_OLD_KEYS', None),
+    )
+
+
+def _parse_keys(raw):
+    primary, old = raw
+    old = old or ''
+    if isinstance(old, str):
+        old = old.split(',')
+    return [_clean_key(primary)] + [k for k in (_clean_key(k) for k in old) if k]
 
 
 class MessageEncryption:
     """Handles encryption and decryption of direct message text."""
-    
+
+    _cipher = None
+    _cipher_keys = None
+    _lock = threading.Lock()
+
     @staticmethod
-    def get_cipher():
-        """Get Fernet cipher instance using the encryption key from settings."""
-        key = settings.MESSAGE_ENCRYPTION_KEY
-        if key:
-            # Clean the key of whitespace and surrounding quotes
-            key = key.strip().strip("'").strip('"')
-            
-        if not key:
-            print("DEBUG: MESSAGE_ENCRYPTION_KEY is missing/empty")
-            raise ValueError("MESSAGE_ENCRYPTION_KEY not set in environment")
-            
-        try:
-            return Fernet(key.encode())
-        except Exception as e:
-            print(f"DEBUG: Encryption key error. Key length: {len(key)}. Error: {e}")
-            raise
-    
+    def is_encrypted(text):
+        """Fernet encrypted strings start with the 'gAAAAA' prefix."""
+        return bool(text) and text.startswith(FERNET_PREFIX)
+
+    @classmethod
+    def get_cipher(cls):
+        """
+        Get the process-wide cipher for the configured keys.
+
+        A plain Fernet for a single key, a MultiFernet (first key encrypts,
+        every key is tried when decrypting) while old keys are configured.
+        """
+        raw = _raw_keys()
+        if cls._cipher is not None and cls._cipher_keys == raw:
+            return cls._cipher
+
+        keys = _parse_keys(raw)
+        if not keys[0]:
+            raise ImproperlyConfigured("MESSAGE_ENCRYPTION_KEY not set in environment")
+
+        with cls._lock:
+            if cls._cipher is None or cls._cipher_keys != raw:
+                try:
+                    fernets = [Fernet(k.encode()) for k in keys]
+                except Exception as e:
+                    raise ImproperlyConfigured(f"Invalid message encryption key: {e}") from e
+                cls._cipher = fernets[0] if len(fernets) == 1 else MultiFernet(fernets)
+                cls._cipher_keys = raw
+            return cls._cipher
+
+    @staticmethod
+    def current_key():
+        """The cleaned MESSAGE_ENCRYPTION_KEY (the key new tokens are written with)."""
+        return _parse_keys(_raw_keys())[0]
+
+    @classmethod
+    def reset_cipher(cls):
+        """Forget the cached cipher (e.g. after changing keys at runtime)."""
+        with cls._lock:
+            cls._cipher = None
+            cls._cipher_keys = None
+
     @staticmethod
     def encrypt(plaintext):
         """
         Encrypt plaintext message.
-        
+
         Args:
             plaintext (str): The message text to encrypt
-            
+
         Returns:
             str: Base64-encoded encrypted text
+
+        Raises:
+            ImproperlyConfigured: MESSAGE_ENCRYPTION_KEY is missing or invalid
         """
         if not plaintext:
             return plaintext
-        try:
-            cipher = MessageEncryption.get_cipher()
-            return cipher.encrypt(plaintext.encode()).decode()
-        except Exception as e:
-            print(f"ENCRYPTION ERROR (Falling back to plaintext): {e}")
-            return plaintext
-    
+        cipher = MessageEncryption.get_cipher()
+        return cipher.encrypt(plaintext.encode()).decode()
+
     @staticmethod
     def decrypt(ciphertext):
         """
         Decrypt encrypted message.
-        
+
         Args:
             ciphertext (str): The encrypted message text
-            
+
         Returns:
             str: Decrypted plaintext message
         """
-        if not ciphertext:
+        if not MessageEncryption.is_encrypted(ciphertext):
             return ciphertext
         try:
             cipher = MessageEncryption.get_cipher()
             return cipher.decrypt(ciphertext.encode()).decode()
-        except Exception as e:
-            # If decryption fails (bad key, legacy text, missing env var), 
+        except (ImproperlyConfigured, InvalidToken) as e:
+            # If decryption fails (bad key, missing env var),
             # return as-is to prevent 500 crashes
-            print(f"DECRYPTION ERROR: {e}")
+            logger.warning("Could not decrypt a direct message: %s", type(e).__name__)
             return ciphertext
+
+    @staticmethod
+    def decrypt_many(ciphertexts):
+        """
+        Decrypt a batch of messages with a single cipher lookup.
+
+        Legacy plaintext (no Fernet prefix) is returned untouched without a
+        decryption attempt. Anything that fails to decrypt (bad key, missing
+        env var) is returned as-is to prevent 500 crashes.
+
+        Args:
+            ciphertexts (iterable of str): Stored message texts
+
+        Returns:
+            list of str: Plaintexts, in the same order
+        """
+        ciphertexts = list(ciphertexts)
+        if not any(MessageEncryption.is_encrypted(t) for t in ciphertexts):
+            return ciphertexts
+
+        try:
+            cipher = MessageEncryption.get_cipher()
+        except ImproperlyConfigured as e:
+            logger.warning("Cannot decrypt direct messages: %s", e)
+            return ciphertexts
+
+        result, failed = [], 0
+        for text in ciphertexts:
+            if not MessageEncryption.is_encrypted(text):
+                result.append(text)
+                continue
+            try:
+                result.append(cipher.decrypt(text.encode()).decode())
+            except (InvalidToken, ValueError):
+                failed += 1
+                result.append(text)
+        if failed:
+            logger.warning("Could not decrypt %d of %d direct messages", failed, len(ciphertexts))
+        return result
+
+    @staticmethod
+    def rotate(ciphertext):
+        """Re-encrypt a token under the current key (see MultiFernet.rotate)."""
+        cipher = MessageEncryption.get_cipher()
+        if not isinstance(cipher, MultiFernet):
+            cipher = MultiFernet([cipher])
+        return cipher.rotate(ciphertext.encode()).decode()
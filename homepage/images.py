@@ -0,0 +1,143 @@
+"""
+Resized variants of avatars and gallery photos.
+
+Every uploaded image gets thumbnail / medium / full renditions, each as
+WebP plus a JPEG fallback, so a 32px chat avatar no longer downloads the
+full-size original. Variants are re-encoded from the pixels only, which
+drops EXIF (camera, GPS) metadata; the orientation tag is applied first.
+
+Variants live next to the original under a ``variants/`` prefix and are
+recorded on the row as a manifest:
+
+    {"thumb": {"webp": "gallery/variants/abc_thumb.webp",
+               "jpeg": "gallery/variants/abc_thumb.jpg"}, ...}
+"""
+import os
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Longest side in pixels; images are never upscaled
+VARIANT_SIZES = {
+    'thumb': 96,     # chat bubbles, search results, member lists (32-48px at 2-3x)
+    'medium': 640,   # gallery grid
+    'full': 1600,    # lightbox
+}
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_key(original_key, variant, fmt):
+    folder, name = os.path.split(original_key)
+    stem = os.path.splitext(name)[0]
+    return f"{folder}/variants/{stem}_{variant}.{FORMATS[fmt][1]}"
+
+
+def _open(data):
+    image = Image.open(BytesIO(data))
+    # Bake in the EXIF orientation before the metadata is dropped
+    return ImageOps.exif_transpose(image)
+
+
+def _flatten(image):
+    """RGB for JPEG; transparent areas become white."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_variants(data, original_key):
+    """
+    Render every variant of the image in ``data``.
+
+    Returns (manifest, files): the manifest to store on the row and a
+    {storage key: bytes} dict to upload.
+    """
+    image = _open(data)
+    image.load()
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    base = image.convert('RGBA' if has_alpha else 'RGB')
+
+    manifest, files = {}, {}
+    for variant, size in VARIANT_SIZES.items():
+        resized = base.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        manifest[variant] = {}
+        for fmt, (pil_format, _, options) in FORMATS.items():
+            out = BytesIO()
+            (_flatten(resized) if pil_format == 'JPEG' else resized).save(out, format=pil_format, **options)
+            key = variant_key(original_key, variant, fmt)
+            manifest[variant][fmt] = key
+            files[key] = out.getvalue()
+    return manifest, files
+
+
+def is_image(data):
+    """True if Pillow recognises ``data`` as an intact image."""
+    try:
+        Image.open(BytesIO(data)).verify()
+        return True
+    except Exception:
+        return False
+
+
+# Bytes of a file sniff_type() needs to tell the formats apart
+SNIFF_BYTES = 16
+
+
+def sniff_type(head):
+    """
+    The content type announced by the magic number at the start of a
+    file (its first SNIFF_BYTES bytes), or None for anything but
+    JPEG/PNG/GIF/WebP.
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def strip_metadata(data):
+    """
+    Return ``data`` without EXIF. Images that carry none are returned
+    byte-for-byte; others are re-encoded in their own format.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        if not image.getexif():
+            return data
+        fmt = image.format
+        image = ImageOps.exif_transpose(image)
+        out = BytesIO()
+        options = {'quality': 95} if fmt in ('JPEG', 'WEBP') else {}
+        image.save(out, format=fmt, **options)
+        return out.getvalue()
+    except Exception:
+        # Not something Pillow can re-encode: keep the original bytes
+        return data
+
+
+def variant_urls(manifest, storage=None):
+    """{variant: {fmt: url}} for a stored manifest ({} when there are none)."""
+    storage = storage or default_storage
+    return {
+        variant: {fmt: storage.url(key) for fmt, key in formats.items()}
+        for variant, formats in (manifest or {}).items()
+    }
+
+
+def variant_url(manifest, variant, fmt='jpeg', storage=None):
+    """URL of one variant, or None if it has not been generated."""
+    key = (manifest or {}).get(variant, {}).get(fmt)
+    return (storage or default_storage).url(key) if key else None
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+
+from homepage import images, profile_cache, uploads
+from homepage.models import MediaBlob, Profile, UserPhoto
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill thumbnail/medium/full WebP+JPEG variants for existing "
+        "gallery photos and avatars, stripping EXIF from the originals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--model',
+            choices=['photos', 'avatars', 'all'],
+            default='all',
+            help='Which images to process (default: all).',
+        )
+        parser.add_argument('--force', action='store_true', help='Rebuild variants that already exist.')
+
+    def handle(self, *args, **options):
+        if options['model'] in ('photos', 'all'):
+            queryset = UserPhoto.objects.filter(upload_status=UserPhoto.UPLOAD_UPLOADED)
+            if not options['force']:
+                queryset = queryset.filter(variants={})
+            done, failed = self._walk(queryset, 'image', 'variants', options['batch_size'], extra=['blob_id'])
+            self.stdout.write(self.style.SUCCESS(f"UserPhoto: {done} built, {failed} failed"))
+
+        if options['model'] in ('avatars', 'all'):
+            queryset = Profile.objects.exclude(avatar='').exclude(avatar__isnull=True)
+            if not options['force']:
+                queryset = queryset.filter(avatar_variants={})
+            done, failed = self._walk(queryset, 'avatar', 'avatar_variants', options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Profile avatars: {done} built, {failed} failed"))
+
+    def _walk(self, queryset, file_field, manifest_field, batch_size, extra=()):
+        done = failed = 0
+        last_id = 0
+        while True:
+            # Keyset batches: rows that fail keep an empty manifest but are not retried in this run
+            batch = list(queryset.filter(id__gt=last_id).order_by('id').only('id', 'user_id', file_field, *extra)[:batch_size])
+            if not batch:
+                return done, failed
+            last_id = batch[-1].id
+
+            built = []
+            for row in batch:
+                manifest = self._build(getattr(row, file_field).name)
+                if manifest:
+                    setattr(row, manifest_field, manifest)
+                    built.append(row)
+                else:
+                    failed += 1
+            if built:
+                type(batch[0]).objects.bulk_update(built, [manifest_field])
+                # Photos of a shared blob: later uploads of the same image reuse these
+                for row in built:
+                    if getattr(row, 'blob_id', None):
+                        MediaBlob.objects.filter(pk=row.blob_id).update(variants=getattr(row, manifest_field))
+                profile_cache.invalidate(*{row.user_id for row in built})
+                done += len(built)
+
+    def _build(self, key):
+        try:
+            original = uploads.get_object(key)
+            manifest, files = images.build_variants(original, key)
+        except Exception as e:
+            self.stderr.write(f"{key}: {e}")
+            return None
+        stripped = images.strip_metadata(original)
+        if stripped != original:
+            files[key] = stripped
+        error = uploads.put_files(files)
+        if error is not None:
+            self.stderr.write(f"{key}: upload failed: {error}")
+            return None
+        return manifest
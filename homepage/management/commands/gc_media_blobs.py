@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from homepage import uploads
+from homepage.models import MediaBlob
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-count MediaBlob references from the photos that use them and "
+        "delete blobs (and their S3 objects) nothing points at any more, "
+        "e.g. after photos were removed along with their user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report without changing anything.')
+
+    def handle(self, *args, **options):
+        fixed = collected = 0
+        drifted = MediaBlob.objects.annotate(refs=Count('photos')).filter(Q(refs=0) | ~Q(ref_count=F('refs')))
+        for blob in drifted.iterator():
+            if blob.refs:
+                fixed += 1
+                if not options['dry_run']:
+                    MediaBlob.objects.filter(pk=blob.pk).update(ref_count=blob.refs)
+                continue
+
+            collected += 1
+            if options['dry_run']:
+                continue
+            with transaction.atomic():
+                locked = MediaBlob.objects.select_for_update().filter(pk=blob.pk).first()
+                if locked is None or locked.photos.exists():
+                    continue
+                keys = uploads.blob_keys(locked)
+                locked.delete()
+            uploads.delete_blob_objects(blob.sha256, keys)
+
+        verb = 'Would fix' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {fixed} reference counts, {collected} unreferenced blobs collected"
+        ))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from homepage import uploads
+from homepage.models import MediaBlob
+
+
+class Command(BaseCommand):
+    help = (
+        "Strip EXIF from and build the variants of gallery images uploaded "
+        "straight to storage (presigned uploads), then mark their photos "
+        "uploaded. Runs once, or with --watch as a worker outside the web "
+        "process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--watch', type=float, metavar='SECONDS',
+            help='Keep running, looking for new uploads every SECONDS.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            results = {}
+            for blob_id in MediaBlob.objects.filter(stored=True, uploaded=False).values_list('id', flat=True).iterator():
+                outcome = uploads.process_blob(blob_id)
+                if outcome:
+                    results[outcome] = results.get(outcome, 0) + 1
+            if results or not options['watch']:
+                summary = ', '.join(f"{n} {outcome}" for outcome, n in sorted(results.items())) or 'nothing to do'
+                self.stdout.write(self.style.SUCCESS(f"Direct uploads: {summary}"))
+            if not options['watch']:
+                return
+            time.sleep(options['watch'])
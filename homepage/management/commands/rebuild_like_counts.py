@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from homepage.models import PhotoLike, UserPhoto
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute UserPhoto.like_count from the PhotoLike rows (e.g. after "
+        "likes were removed by a user deletion cascade)."
+    )
+
+    def handle(self, *args, **options):
+        counts = (
+            PhotoLike.objects.filter(photo_id=OuterRef('pk')).order_by()
+            .values('photo_id').annotate(n=Count('id')).values('n')
+        )
+        actual = Coalesce(Subquery(counts), 0)
+        # One UPDATE, as in migration 0028, touching only the photos whose count drifted
+        changed = UserPhoto.objects.exclude(like_count=actual).update(like_count=actual)
+        self.stdout.write(self.style.SUCCESS(f"UserPhoto: {changed} like counts updated"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from homepage.models import Community, CommunityMembership
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Community.member_count from the CommunityMembership rows "
+        "(e.g. after memberships were added with bulk_create() or changed in raw SQL)."
+    )
+
+    def handle(self, *args, **options):
+        counts = (
+            CommunityMembership.objects.filter(community_id=OuterRef('pk')).order_by()
+            .values('community_id').annotate(n=Count('id')).values('n')
+        )
+        actual = Coalesce(Subquery(counts), 0)
+        # One UPDATE, touching only the communities whose count drifted
+        changed = Community.objects.exclude(member_count=actual).update(member_count=actual)
+        self.stdout.write(self.style.SUCCESS(f"Community: {changed} member counts updated"))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from homepage.models import ChatMessage, DirectMessage
+from homepage.reactions import build_summary, empty_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute ChatMessage/DirectMessage.reaction_summary from the "
+        "CommunityMessageReaction/MessageReaction rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--model',
+            choices=['chat', 'dm', 'all'],
+            default='all',
+            help='Which message table to rebuild (default: all).',
+        )
+
+    def handle(self, *args, **options):
+        models = {
+            'chat': [ChatMessage],
+            'dm': [DirectMessage],
+            'all': [ChatMessage, DirectMessage],
+        }[options['model']]
+
+        for model in models:
+            changed = self._rebuild(model, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: {changed} summaries updated"))
+
+    def _rebuild(self, model, batch_size):
+        changed = 0
+        last_id = 0
+        while True:
+            # Walk the table by primary key so every batch is an index range scan
+            batch = list(
+                model.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'reaction_summary')
+                .prefetch_related('reactions')[:batch_size]
+            )
+            if not batch:
+                return changed
+            last_id = batch[-1].id
+
+            stale = []
+            for message in batch:
+                summary = build_summary(message.reactions.all())
+                if summary != (message.reaction_summary or empty_summary()):
+                    message.reaction_summary = summary
+                    stale.append(message)
+
+            if stale:
+                model.objects.bulk_update(stale, ['reaction_summary'])
+                changed += len(stale)
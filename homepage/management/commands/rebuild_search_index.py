@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from homepage.models import UserSearchDocument
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the UserSearchDocument of every user, e.g. after profiles, "
+        "skills or usernames were changed with bulk updates that skip save()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ids = list(User.objects.order_by('id').values_list('id', flat=True))
+        size = options['batch_size']
+        total = 0
+        for start in range(0, len(ids), size):
+            total += UserSearchDocument.refresh(*ids[start:start + size])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} search documents.'))
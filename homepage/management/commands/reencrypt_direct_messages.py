@@ -0,0 +1,139 @@
+import json
+import time
+from pathlib import Path
+
+from cryptography.fernet import Fernet, InvalidToken
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from homepage.encryption import MessageEncryption
+from homepage.models import DirectMessage
+
+DEFAULT_CHECKPOINT = Path(settings.BASE_DIR) / '.reencrypt_direct_messages.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Encrypt legacy plaintext DirectMessage.text and re-encrypt rows written "
+        "under a key listed in MESSAGE_ENCRYPTION_OLD_KEYS with the current "
+        "MESSAGE_ENCRYPTION_KEY. Runs in small keyset batches, sleeps between "
+        "them and checkpoints the last processed id so it can be stopped and "
+        "resumed against a live database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--sleep', type=float, default=0.5,
+            help='Seconds to pause between batches (default: 0.5).',
+        )
+        parser.add_argument(
+            '--checkpoint', default=str(DEFAULT_CHECKPOINT),
+            help='File recording the last processed message id.',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore the checkpoint and start from the first message.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would change without writing anything.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            cipher = MessageEncryption.get_cipher()
+        except Exception as e:
+            raise CommandError(f"Cannot load encryption keys: {e}")
+        # The current key alone: a token it can read is already up to date
+        current = Fernet(MessageEncryption.current_key().encode())
+
+        checkpoint = Path(options['checkpoint'])
+        last_id = 0 if options['restart'] else self._load_checkpoint(checkpoint)
+        if last_id:
+            self.stdout.write(f"Resuming after message id {last_id}")
+
+        totals = {'encrypted': 0, 'rotated': 0, 'unreadable': 0}
+        while True:
+            batch_last_id, counts = self._process_batch(
+                cipher, current, last_id, options['batch_size'], options['dry_run']
+            )
+            if batch_last_id is None:
+                break
+            last_id = batch_last_id
+            for key, n in counts.items():
+                totals[key] += n
+            if not options['dry_run']:
+                self._save_checkpoint(checkpoint, last_id)
+            self.stdout.write(
+                f"up to id {last_id}: {counts['encrypted']} encrypted, "
+                f"{counts['rotated']} re-encrypted, {counts['unreadable']} unreadable"
+            )
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        verb = 'Would update' if options['dry_run'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {totals['encrypted'] + totals['rotated']} messages "
+            f"({totals['encrypted']} plaintext encrypted, {totals['rotated']} re-encrypted)"
+        ))
+        if totals['unreadable']:
+            self.stdout.write(self.style.WARNING(
+                f"{totals['unreadable']} messages could not be decrypted with any configured key "
+                f"and were left untouched"
+            ))
+
+    def _process_batch(self, cipher, current, last_id, batch_size, dry_run):
+        # One short transaction per batch. Only the rows of this batch are
+        # locked, so readers and new messages are never blocked for long.
+        with transaction.atomic():
+            batch = list(
+                DirectMessage.objects.select_for_update()
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'text')[:batch_size]
+            )
+            if not batch:
+                return None, None
+
+            counts = {'encrypted': 0, 'rotated': 0, 'unreadable': 0}
+            changed = []
+            for message in batch:
+                text = message.text
+                if not text:
+                    continue
+                if not MessageEncryption.is_encrypted(text):
+                    message.text = cipher.encrypt(text.encode()).decode()
+                    counts['encrypted'] += 1
+                    changed.append(message)
+                    continue
+                try:
+                    current.decrypt(text.encode())
+                    continue
+                except InvalidToken:
+                    pass
+                try:
+                    message.text = MessageEncryption.rotate(text)
+                except InvalidToken:
+                    counts['unreadable'] += 1
+                    continue
+                counts['rotated'] += 1
+                changed.append(message)
+
+            if changed and not dry_run:
+                DirectMessage.objects.bulk_update(changed, ['text'])
+            return batch[-1].id, counts
+
+    def _load_checkpoint(self, path):
+        try:
+            return int(json.loads(path.read_text())['last_id'])
+        except FileNotFoundError:
+            return 0
+        except (ValueError, KeyError, TypeError) as e:
+            raise CommandError(f"Unreadable checkpoint {path}: {e!r} (use --restart)")
+
+    def _save_checkpoint(self, path, last_id):
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'last_id': last_id}))
+        tmp.replace(path)
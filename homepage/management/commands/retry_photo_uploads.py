@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from homepage import uploads
+from homepage.models import UserPhoto
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-run the S3 upload for gallery photos still pending (e.g. after a "
+        "restart interrupted the background queue) and, with --failed, for "
+        "photos whose upload gave up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed', action='store_true', help='Also retry failed uploads.')
+
+    def handle(self, *args, **options):
+        statuses = [UserPhoto.UPLOAD_PENDING]
+        if options['failed']:
+            statuses.append(UserPhoto.UPLOAD_FAILED)
+
+        results = {}
+        for photo_id in UserPhoto.objects.filter(upload_status__in=statuses).values_list('id', flat=True).iterator():
+            # Runs in the foreground: this command is the worker here
+            outcome = uploads.upload(photo_id)
+            results[outcome] = results.get(outcome, 0) + 1
+
+        summary = ', '.join(f"{n} {outcome}" for outcome, n in sorted(results.items())) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f"Photo uploads: {summary}"))
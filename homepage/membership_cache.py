@@ -0,0 +1,90 @@
+"""
+Cache of community roles, for the permission checks of the community
+endpoints and the chat WebSocket.
+
+``role(community_id, user_id)`` is the user's CommunityMembership.role,
+or '' when they are not a member (cached too, so outsiders polling a
+room do not reach the database either).
+
+Every membership save and delete (post_save / post_delete signals, so
+queryset deletes, admin bulk actions and the cascade from a deleted
+community or user are covered too) writes the new role into the cache
+once its transaction commits, while lookups only fill the cache if the
+key is absent (cache.add). A lookup that read the row just before a
+removal therefore cannot put the old role back after the removal wrote
+'', and whichever order the two land in, the removal wins. Only role
+changes made with queryset.update() go unseen; they expire after
+COMMUNITY_ROLE_TIMEOUT seconds.
+
+A removal is only written to the cache of the process that made it. With
+a shared backend (Redis) that is every process; with a per-process one
+(LocMemCache, the default without REDIS_URL) other workers would keep
+the old role, so there roles are only trusted for
+COMMUNITY_ROLE_LOCAL_TIMEOUT seconds. That still takes most of the
+permission queries off a room polled every few seconds, while a removal
+reaches every process within those seconds.
+
+Settings (optional):
+    COMMUNITY_ROLE_CACHE          cache roles (True unless the backend is DummyCache)
+    COMMUNITY_ROLE_TIMEOUT        seconds a cached role is trusted (300)
+    COMMUNITY_ROLE_LOCAL_TIMEOUT  the same with a per-process backend (5)
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_KEY = 'community-role:{}:{}'
+NOT_MEMBER = ''
+# Backends whose entries live in one process only
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _shared():
+    return settings.CACHES['default']['BACKEND'] not in PER_PROCESS_BACKENDS
+
+
+def timeout():
+    seconds = getattr(settings, 'COMMUNITY_ROLE_TIMEOUT', 300)
+    if not _shared():
+        seconds = min(seconds, getattr(settings, 'COMMUNITY_ROLE_LOCAL_TIMEOUT', 5))
+    return seconds
+
+
+def enabled():
+    """True if roles are cached (see the module docstring)."""
+    configured = getattr(settings, 'COMMUNITY_ROLE_CACHE', None)
+    if configured is not None:
+        return configured
+    return settings.CACHES['default']['BACKEND'] != 'django.core.cache.backends.dummy.DummyCache'
+
+
+def _query(community_id, user_id):
+    from .models import CommunityMembership
+
+    return (
+        CommunityMembership.objects.filter(community_id=community_id, user_id=user_id)
+        .values_list('role', flat=True).first()
+    ) or NOT_MEMBER
+
+
+def role(community_id, user_id):
+    """The role of ``user_id`` in ``community_id``, or '' for non-members."""
+    if not enabled():
+        return _query(community_id, user_id)
+    key = CACHE_KEY.format(community_id, user_id)
+    value = cache.get(key)
+    if value is None:
+        value = _query(community_id, user_id)
+        cache.add(key, value, timeout=timeout())
+    return value
+
+
+def store(community_id, user_id, value):
+    """Record ``value`` as the role of ``user_id`` once the current transaction commits."""
+    if not enabled():
+        return
+    key = CACHE_KEY.format(community_id, user_id)
+    transaction.on_commit(lambda: cache.set(key, value, timeout=timeout()))
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+# Frozen copy of homepage.reactions.build_summary as of this migration,
+# so later changes to the live summary format do not alter it
+RECENT_REACTORS_LIMIT = 10
+
+
+def build_summary(reactions):
+    """Compute a summary from reaction rows ordered oldest first."""
+    counts, recent = {}, {}
+    for reaction in reactions:
+        counts[reaction.emoji] = counts.get(reaction.emoji, 0) + 1
+        reactors = [r for r in recent.get(reaction.emoji, []) if r['user_id'] != reaction.user_id]
+        reactors.insert(0, {'user_id': reaction.user_id, 'username': reaction.user.username})
+        recent[reaction.emoji] = reactors[:RECENT_REACTORS_LIMIT]
+    return {'counts': counts, 'recent': recent}
+
+
+def backfill_reaction_summaries(apps, schema_editor):
+    for model_name in ('ChatMessage', 'DirectMessage'):
+        Message = apps.get_model('homepage', model_name)
+        messages = (
+            Message.objects.filter(reactions__isnull=False)
+            .distinct()
+            .prefetch_related('reactions__user')
+        )
+        batch = []
+        for message in messages.iterator(chunk_size=500):
+            reactions = sorted(message.reactions.all(), key=lambda r: (r.created_at, r.id))
+            message.reaction_summary = build_summary(reactions)
+            batch.append(message)
+            if len(batch) >= 500:
+                Message.objects.bulk_update(batch, ['reaction_summary'])
+                batch = []
+        if batch:
+            Message.objects.bulk_update(batch, ['reaction_summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0018_message_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='reaction_summary',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='directmessage',
+            name='reaction_summary',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(backfill_reaction_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Greatest
+
+
+def backfill_dm_pairs(apps, schema_editor):
+    """
+    Give every existing 2-participant conversation its (low, high) pair key.
+
+    If a pair already has several conversations, the most recently updated
+    one becomes canonical (the one the old lookup returned); the others are
+    merged into it by merge_duplicate_dms.
+    """
+    Conversation = apps.get_model('homepage', 'Conversation')
+    Participant = Conversation.participants.through
+
+    members = {}
+    for conversation_id, user_id in Participant.objects.values_list('conversation_id', 'user_id').iterator():
+        members.setdefault(conversation_id, []).append(user_id)
+
+    claimed = set()
+    batch = []
+    for convo in Conversation.objects.order_by('-updated_at', '-id').only('id').iterator():
+        users = members.get(convo.id, [])
+        if len(users) != 2 or users[0] == users[1]:
+            continue
+        pair = tuple(sorted(users))
+        if pair in claimed:
+            continue
+        claimed.add(pair)
+        convo.dm_user_low_id, convo.dm_user_high_id = pair
+        batch.append(convo)
+        if len(batch) >= 500:
+            Conversation.objects.bulk_update(batch, ['dm_user_low', 'dm_user_high'])
+            batch = []
+    if batch:
+        Conversation.objects.bulk_update(batch, ['dm_user_low', 'dm_user_high'])
+
+
+def merge_duplicate_dms(apps, schema_editor):
+    """
+    Fold the duplicate 1:1 conversations backfill_dm_pairs left unkeyed into
+    the canonical (keyed) conversation of their pair, before 0021 makes the
+    pair unique, so the inbox (which only lists keyed DMs) shows all of their
+    messages. Messages keep their ids and is_read flags (0022 derives the
+    read markers from those) and move over; the emptied duplicate is deleted.
+    """
+    Conversation = apps.get_model('homepage', 'Conversation')
+    DirectMessage = apps.get_model('homepage', 'DirectMessage')
+    Participant = Conversation.participants.through
+
+    canonical = {
+        (low, high): convo_id
+        for convo_id, low, high in Conversation.objects.filter(
+            dm_user_low__isnull=False, dm_user_high__isnull=False
+        ).values_list('id', 'dm_user_low_id', 'dm_user_high_id')
+    }
+    members = {}
+    unkeyed = Participant.objects.filter(
+        conversation__dm_user_low__isnull=True, conversation__dm_user_high__isnull=True
+    ).order_by('conversation_id')
+    for conversation_id, user_id in unkeyed.values_list('conversation_id', 'user_id').iterator():
+        members.setdefault(conversation_id, []).append(user_id)
+
+    for duplicate_id, users in members.items():
+        target_id = canonical.get(tuple(sorted(users)))
+        if len(users) != 2 or target_id is None:
+            continue
+        DirectMessage.objects.filter(conversation_id=duplicate_id).update(conversation_id=target_id)
+        updated_at = Conversation.objects.filter(pk=duplicate_id).values('updated_at')
+        Conversation.objects.filter(pk=target_id).update(
+            updated_at=Greatest(models.F('updated_at'), models.Subquery(updated_at))
+        )
+        Conversation.objects.filter(pk=duplicate_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0019_message_reaction_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='dm_user_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='dm_user_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_dm_pairs, migrations.RunPython.noop),
+        migrations.RunPython(merge_duplicate_dms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Kept apart from 0020 so the backfill commits before the index is built
+    # (PostgreSQL refuses ALTER TABLE with pending FK trigger events).
+
+    dependencies = [
+        ('homepage', '0020_conversation_dm_pair'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('dm_user_low', 'dm_user_high'), name='unique_dm_pair'),
+        ),
+    ]
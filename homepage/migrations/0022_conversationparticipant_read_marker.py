@@ -0,0 +1,89 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_read_markers(apps, schema_editor):
+    """
+    Derive each participant's last_read_message_id from the is_read flags.
+
+    The marker is set just below the participant's oldest unread message
+    from someone else, or to the newest message when nothing is unread, so
+    unread counts come out the same as before.
+    """
+    DirectMessage = apps.get_model('homepage', 'DirectMessage')
+    ConversationParticipant = apps.get_model('homepage', 'ConversationParticipant')
+
+    newest = dict(
+        DirectMessage.objects.order_by().values('conversation_id')
+        .annotate(m=models.Max('id')).values_list('conversation_id', 'm')
+    )
+    oldest_unread = {}  # conversation_id -> {sender_id: oldest unread id}
+    for conversation_id, sender_id, first in (
+        DirectMessage.objects.filter(is_read=False).order_by()
+        .values('conversation_id', 'sender_id')
+        .annotate(m=models.Min('id')).values_list('conversation_id', 'sender_id', 'm')
+    ):
+        oldest_unread.setdefault(conversation_id, {})[sender_id] = first
+
+    batch = []
+    for member in ConversationParticipant.objects.only('id', 'conversation_id', 'user_id').iterator():
+        unread = [
+            first for sender_id, first in oldest_unread.get(member.conversation_id, {}).items()
+            if sender_id != member.user_id
+        ]
+        marker = min(unread) - 1 if unread else newest.get(member.conversation_id, 0)
+        if not marker:
+            continue
+        member.last_read_message_id = marker
+        batch.append(member)
+        if len(batch) >= 500:
+            ConversationParticipant.objects.bulk_update(batch, ['last_read_message_id'])
+            batch = []
+    if batch:
+        ConversationParticipant.objects.bulk_update(batch, ['last_read_message_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0021_conversation_unique_dm_pair'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Adopt the existing auto-created M2M table as an explicit model;
+        # nothing changes in the database for this step.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ConversationParticipant',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='homepage.conversation')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'homepage_conversation_participants',
+                        'unique_together': {('conversation', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='conversations', through='homepage.ConversationParticipant', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_read_markers, migrations.RunPython.noop),
+    ]
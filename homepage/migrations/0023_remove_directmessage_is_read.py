@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Separate from 0022 so the column is dropped after the backfill has committed
+
+    dependencies = [
+        ('homepage', '0022_conversationparticipant_read_marker'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='directmessage',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0025_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userphoto',
+            name='content_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='userphoto',
+            name='size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
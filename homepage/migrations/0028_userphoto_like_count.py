@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_counts(apps, schema_editor):
+    """Count the existing PhotoLike rows of every photo in one UPDATE."""
+    UserPhoto = apps.get_model('homepage', 'UserPhoto')
+    PhotoLike = apps.get_model('homepage', 'PhotoLike')
+
+    counts = (
+        PhotoLike.objects.filter(photo_id=models.OuterRef('pk')).order_by()
+        .values('photo_id').annotate(n=models.Count('id')).values('n')
+    )
+    UserPhoto.objects.update(like_count=Coalesce(models.Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0027_mediablob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userphoto',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_counts, migrations.RunPython.noop),
+    ]
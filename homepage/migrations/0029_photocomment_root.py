@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_roots(apps, schema_editor):
+    """Point every reply at the top-level comment of its thread."""
+    PhotoComment = apps.get_model('homepage', 'PhotoComment')
+
+    parents = dict(PhotoComment.objects.filter(parent__isnull=False).values_list('id', 'parent_id'))
+    batch = []
+    for comment_id in parents:
+        root = parents[comment_id]
+        while root in parents:
+            root = parents[root]
+        batch.append(PhotoComment(id=comment_id, root_id=root))
+    PhotoComment.objects.bulk_update(batch, ['root'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0028_userphoto_like_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photocomment',
+            name='root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread', to='homepage.photocomment'),
+        ),
+        migrations.AddIndex(
+            model_name='photocomment',
+            index=models.Index(fields=['photo', 'parent', 'id'], name='photocomment_toplevel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photocomment',
+            index=models.Index(fields=['root', 'id'], name='photocomment_thread_idx'),
+        ),
+        migrations.RunPython(backfill_roots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:08
+
+import django.db.models.deletion
+from django.conf import settings
+import re
+
+from django.db import migrations, models
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE homepage_usersearch_fts USING fts5("
+    "document, tokenize='trigram', content='homepage_usersearchdocument', content_rowid='user_id')",
+    "CREATE TRIGGER homepage_usersearch_ai AFTER INSERT ON homepage_usersearchdocument BEGIN "
+    "INSERT INTO homepage_usersearch_fts(rowid, document) VALUES (new.user_id, new.document); END",
+    "CREATE TRIGGER homepage_usersearch_ad AFTER DELETE ON homepage_usersearchdocument BEGIN "
+    "INSERT INTO homepage_usersearch_fts(homepage_usersearch_fts, rowid, document) "
+    "VALUES ('delete', old.user_id, old.document); END",
+    "CREATE TRIGGER homepage_usersearch_au AFTER UPDATE ON homepage_usersearchdocument BEGIN "
+    "INSERT INTO homepage_usersearch_fts(homepage_usersearch_fts, rowid, document) "
+    "VALUES ('delete', old.user_id, old.document); "
+    "INSERT INTO homepage_usersearch_fts(rowid, document) VALUES (new.user_id, new.document); END",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS homepage_usersearch_au",
+    "DROP TRIGGER IF EXISTS homepage_usersearch_ad",
+    "DROP TRIGGER IF EXISTS homepage_usersearch_ai",
+    "DROP TABLE IF EXISTS homepage_usersearch_fts",
+]
+POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS usersearch_document_trgm "
+    "ON homepage_usersearchdocument USING gin (document gin_trgm_ops)",
+]
+POSTGRES_TRGM_DROP = [
+    "DROP INDEX IF EXISTS usersearch_document_trgm",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def create_text_index(apps, schema_editor):
+    """Substring index on document: pg_trgm on PostgreSQL, FTS5 trigram on SQLite."""
+    _run(schema_editor, {'postgresql': POSTGRES_TRGM, 'sqlite': SQLITE_FTS})
+
+
+def drop_text_index(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRES_TRGM_DROP, 'sqlite': SQLITE_FTS_DROP})
+
+
+def backfill_documents(apps, schema_editor):
+    """Build a search document for every existing user (mirrors UserSearchDocument.refresh)."""
+    User = apps.get_model('auth', 'User')
+    Profile = apps.get_model('homepage', 'Profile')
+    Skill = apps.get_model('homepage', 'Skill')
+    UserSearchDocument = apps.get_model('homepage', 'UserSearchDocument')
+
+    titles = dict(Profile.objects.values_list('user_id', 'title'))
+    skills = {}
+    for user_id, name in Skill.objects.values_list('user_id', 'name'):
+        skills.setdefault(user_id, []).append(name)
+
+    rows = []
+    for user_id, username in User.objects.values_list('id', 'username').iterator():
+        match = re.match(r"([a-zA-Z]+)", username)
+        display_name = match.group(1).capitalize() if match else username
+        parts = [username, display_name, titles.get(user_id, ''), *skills.get(user_id, [])]
+        rows.append(UserSearchDocument(
+            user_id=user_id,
+            username=username.lower(),
+            document=' '.join(part for part in parts if part).lower(),
+        ))
+    UserSearchDocument.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('homepage', '0029_photocomment_root'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchDocument',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('username', models.CharField(max_length=150)),
+                ('document', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['username'], name='usersearch_username_idx', opclasses=['varchar_pattern_ops'])],
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_member_counts(apps, schema_editor):
+    """Count the existing memberships of every community in one UPDATE."""
+    Community = apps.get_model('homepage', 'Community')
+    CommunityMembership = apps.get_model('homepage', 'CommunityMembership')
+
+    counts = (
+        CommunityMembership.objects.filter(community_id=models.OuterRef('pk')).order_by()
+        .values('community_id').annotate(n=models.Count('id')).values('n')
+    )
+    Community.objects.update(member_count=Coalesce(models.Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0031_usersearchdocument_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='community',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_member_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0033_slugcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='stored',
+            field=models.BooleanField(default=False),
+        ),
+    ]
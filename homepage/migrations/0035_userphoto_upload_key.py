@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+def backfill_upload_keys(apps, schema_editor):
+    """Record the key of direct uploads still waiting to be ingested (the first photo per key)."""
+    UserPhoto = apps.get_model('homepage', 'UserPhoto')
+
+    seen = set()
+    for photo in UserPhoto.objects.filter(image__startswith='gallery/incoming/').order_by('id').only('id', 'image'):
+        if photo.image.name not in seen:
+            seen.add(photo.image.name)
+            UserPhoto.objects.filter(pk=photo.pk).update(upload_key=photo.image.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0034_mediablob_stored'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userphoto',
+            name='upload_key',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_upload_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations, models
+from django.db.models.functions import Greatest
+
+
+def merge_duplicate_dms(apps, schema_editor):
+    """
+    The merge of 0020, for databases that were migrated past it before it
+    merged duplicate 1:1 conversations (and so already have read markers).
+
+    Messages keep their ids and move into the canonical conversation; the
+    emptied duplicate is deleted. Read markers are message ids of one
+    thread and mean nothing in another, so a participant's marker on the
+    duplicate is translated through its time: the canonical thread counts
+    as read up to its last message sent by then (never moving the
+    participant's own marker back).
+    """
+    Conversation = apps.get_model('homepage', 'Conversation')
+    Participant = apps.get_model('homepage', 'ConversationParticipant')
+    DirectMessage = apps.get_model('homepage', 'DirectMessage')
+
+    canonical = {
+        (low, high): convo_id
+        for convo_id, low, high in Conversation.objects.filter(
+            dm_user_low__isnull=False, dm_user_high__isnull=False
+        ).values_list('id', 'dm_user_low_id', 'dm_user_high_id')
+    }
+    members = {}
+    unkeyed = Participant.objects.filter(
+        conversation__dm_user_low__isnull=True, conversation__dm_user_high__isnull=True
+    ).order_by('conversation_id')
+    for row in unkeyed.values('conversation_id', 'user_id', 'last_read_at').iterator():
+        members.setdefault(row['conversation_id'], []).append(row)
+
+    for duplicate_id, rows in members.items():
+        target_id = canonical.get(tuple(sorted(row['user_id'] for row in rows)))
+        if len(rows) != 2 or target_id is None:
+            continue
+        for row in rows:
+            if row['last_read_at'] is None:
+                continue
+            read_up_to = (
+                DirectMessage.objects.filter(conversation_id=target_id, created_at__lte=row['last_read_at'])
+                .order_by('-id').values_list('id', flat=True).first()
+            )
+            if read_up_to:
+                Participant.objects.filter(
+                    conversation_id=target_id, user_id=row['user_id'], last_read_message_id__lt=read_up_to,
+                ).update(last_read_message_id=read_up_to, last_read_at=row['last_read_at'])
+        DirectMessage.objects.filter(conversation_id=duplicate_id).update(conversation_id=target_id)
+        updated_at = Conversation.objects.filter(pk=duplicate_id).values('updated_at')
+        Conversation.objects.filter(pk=target_id).update(
+            updated_at=Greatest(models.F('updated_at'), models.Subquery(updated_at))
+        )
+        Conversation.objects.filter(pk=duplicate_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0035_userphoto_upload_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_dms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+def split_slug(slug):
+    # Frozen copy of homepage.models.split_slug
+    base, _, suffix = slug.rpartition('-')
+    if base and suffix.isdigit():
+        return base, int(suffix)
+    return slug, 0
+
+
+def seed_slug_counters(apps, schema_editor):
+    """
+    Give every slug base in use a SlugCounter at its highest suffix, so new
+    slugs never have to look at the existing ones (one pass over the slugs,
+    here instead of in every first create of a base).
+    """
+    Community = apps.get_model('homepage', 'Community')
+    SlugCounter = apps.get_model('homepage', 'SlugCounter')
+
+    highest = {}
+    for slug in Community.objects.exclude(slug='').values_list('slug', flat=True).iterator():
+        base, suffix = split_slug(slug)
+        highest[base] = max(highest.get(base, 0), suffix)
+
+    existing = set(SlugCounter.objects.values_list('base', flat=True)) & set(highest)
+    for base in existing:
+        SlugCounter.objects.filter(base=base).update(last=Greatest(F('last'), highest[base]))
+    SlugCounter.objects.bulk_create(
+        [SlugCounter(base=base, last=last) for base, last in highest.items() if base not in existing],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0036_merge_duplicate_dms'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_slug_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+def recent_to_user_ids(apps, schema_editor):
+    """
+    Summaries listed recent reactors as {"user_id", "username"}; keep the
+    ids only (usernames are looked up when rendering, see homepage/reactions.py).
+    """
+    for model_name in ('ChatMessage', 'DirectMessage'):
+        Message = apps.get_model('homepage', model_name)
+        last_id = 0
+        while True:
+            batch = list(
+                Message.objects.filter(id__gt=last_id).order_by('id').only('id', 'reaction_summary')[:500]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            stale = []
+            for message in batch:
+                recent = (message.reaction_summary or {}).get('recent') or {}
+                if not any(isinstance(r, dict) for reactors in recent.values() for r in reactors):
+                    continue
+                message.reaction_summary['recent'] = {
+                    emoji: [r['user_id'] if isinstance(r, dict) else r for r in reactors]
+                    for emoji, reactors in recent.items()
+                }
+                stale.append(message)
+            if stale:
+                Message.objects.bulk_update(stale, ['reaction_summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0037_seed_slugcounters'),
+    ]
+
+    operations = [
+        migrations.RunPython(recent_to_user_ids, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,48 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.db.models import UniqueConstraint
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.db.models.functions import Greatest
+from django.utils.crypto import get_random_string
 from django.utils.text import slugify
 from django.utils import timezone
 import random
 
+from . import autocomplete, membership_cache, profile_cache
+
+
+class ProfileBundleMember:
+    """
+    Mixin for models shown on the public profile: saving or deleting a row
+    drops its owner's cached profile bundle (see homepage/profile_cache.py).
+    """
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        profile_cache.invalidate(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        profile_cache.invalidate(self.user_id)
+        return result
+
+
+class UserSearchMember:
+    """
+    Mixin for models whose text is searchable: saving or deleting a row
+    rebuilds its owner's UserSearchDocument.
+    """
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        UserSearchDocument.refresh(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        UserSearchDocument.refresh(self.user_id)
+        return result
+
 class EmailOTP(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='otp')
     otp = models.CharField(max_length=6)
@@ -18,11 +56,13 @@ class EmailOTP(models.Model):
         return f"OTP for {self.user.username}"
 
 
-class Profile(models.Model):
+class Profile(ProfileBundleMember, UserSearchMember, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     title = models.CharField(max_length=100, blank=True)
     description = models.TextField(blank=True, default="This is my personal corner of the internet.")
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Resized renditions of the avatar (see homepage/images.py)
+    avatar_variants = models.JSONField(default=dict, blank=True)
     
     # Social Links
     def validate_instagram(value):
@@ -61,6 +101,13 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+    def avatar_url(self, variant='thumb'):
+        """URL of an avatar variant (JPEG), falling back to the original upload."""
+        from .images import variant_url
+        if not self.avatar:
+            return None
+        return variant_url(self.avatar_variants, variant) or self.avatar.url
+
     @property
     def display_name(self):
         import re
@@ -79,7 +126,7 @@ class Profile(models.Model):
         }
         return PRONOUN_MAP.get(self.gender, '')
 
-class Education(models.Model):
+class Education(ProfileBundleMember, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='education')
     organization = models.CharField(max_length=200)
     location = models.CharField(max_length=200, blank=True)
@@ -95,7 +142,7 @@ class Education(models.Model):
         end = self.end_year if self.end_year else "Present"
         return f"{self.user.username} - {self.organization} ({self.start_year}-{end})"
 
-class Experience(models.Model):
+class Experience(ProfileBundleMember, models.Model):
     EMPLOYMENT_TYPES = [
         ('FULL_TIME', 'Full-time'),
         ('PART_TIME', 'Part-time'),
@@ -124,7 +171,7 @@ class Experience(models.Model):
         start = self.start_date.strftime('%Y-%m')
         return f"{self.user.username} - {self.title} at {self.company} ({start} - {end})"
 
-class Skill(models.Model):
+class Skill(ProfileBundleMember, UserSearchMember, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='skills')
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -136,11 +183,178 @@ class Skill(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.name}"
 
-class UserPhoto(models.Model):
+class UserSearchDocument(models.Model):
+    """
+    Everything user search matches on (username, display name, profile
+    title, skills) as one lowercased text per user, indexed for substring
+    search: a pg_trgm GIN index on PostgreSQL, an FTS5 trigram table on
+    SQLite (see migration 0030 and api/search.py).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    username = models.CharField(max_length=150)
+    document = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Prefix matches for short queries (LIKE 'ab%' on PostgreSQL)
+            models.Index(fields=['username'], opclasses=['varchar_pattern_ops'], name='usersearch_username_idx'),
+            # Catch-up queries of the autocomplete index (homepage/autocomplete.py)
+            models.Index(fields=['updated_at'], name='usersearch_updated_idx'),
+        ]
+
+    @staticmethod
+    def build_text(username, display_name, title, skills):
+        return ' '.join(part for part in [username, display_name, title, *skills] if part).lower()
+
+    @classmethod
+    def refresh(cls, *user_ids):
+        """Rebuild the documents of ``user_ids`` (one upsert)."""
+        users = (
+            User.objects.filter(id__in=user_ids)
+            .select_related('profile')
+            .prefetch_related(models.Prefetch('skills', queryset=Skill.objects.only('user_id', 'name')))
+        )
+        now = timezone.now()
+        rows = []
+        for user in users:
+            profile = getattr(user, 'profile', None)
+            rows.append(cls(
+                user=user,
+                username=user.username.lower(),
+                document=cls.build_text(
+                    user.username,
+                    profile.display_name if profile else '',
+                    profile.title if profile else '',
+                    [skill.name for skill in user.skills.all()],
+                ),
+                updated_at=now,
+            ))
+        cls.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['user'], update_fields=['username', 'document', 'updated_at']
+        )
+        for row in rows:
+            autocomplete.update(row.user_id, row.username)
+        return len(rows)
+
+    def __str__(self):
+        return self.document[:50]
+
+
+@receiver(post_save, sender=User, dispatch_uid='user_search_document')
+def refresh_user_search_document(sender, instance, created, update_fields=None, **kwargs):
+    """Reindex users on creation and rename (saves of other fields, like last_login, are skipped)."""
+    if created or update_fields is None or 'username' in update_fields:
+        UserSearchDocument.refresh(instance.pk)
+
+class MediaBlob(models.Model):
+    """
+    One stored gallery image, addressed by the SHA-256 of its bytes.
+
+    Identical uploads share a blob (and a single S3 object under
+    ``gallery/<sha256>.<ext>``); ``ref_count`` counts the photos pointing
+    at it and the objects are deleted once it drops to zero.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    key = models.CharField(max_length=255)
+    size = models.PositiveIntegerField(null=True, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    # Original copied into the bucket by a direct upload, variants not built yet
+    stored = models.BooleanField(default=False)
+    uploaded = models.BooleanField(default=False)
+    variants = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def acquire(cls, sha256, key, size=None):
+        """
+        Take a reference on the blob for ``sha256``, creating it (stored
+        under ``key``) if needed. Returns (blob, created).
+
+        The row is locked before it is counted, so a concurrent release()
+        either waits for this reference or has already deleted the blob,
+        which is then created afresh.
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(sha256=sha256).first()
+            if blob is not None:
+                cls.objects.filter(pk=blob.pk).update(ref_count=models.F('ref_count') + 1)
+                blob.ref_count += 1
+                return blob, False
+            try:
+                with transaction.atomic():
+                    return cls.objects.create(sha256=sha256, key=key, size=size, ref_count=1), True
+            except IntegrityError:
+                pass
+        # Created concurrently: take a reference on that row
+        return cls.acquire(sha256, key, size)
+
+    @classmethod
+    def release(cls, blob_id):
+        """
+        Drop a reference. Returns the (now deleted) blob when that was the
+        last one, so its objects can be garbage-collected; otherwise None.
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(pk=blob_id).first()
+            if blob is None:
+                return None
+            if blob.ref_count > 1:
+                cls.objects.filter(pk=blob_id).update(ref_count=models.F('ref_count') - 1)
+                return None
+            if blob.photos.exists():
+                # Count drifted (e.g. photos removed by a cascade): trust the rows
+                cls.objects.filter(pk=blob_id).update(ref_count=blob.photos.count())
+                return None
+            blob.delete()
+            return blob
+
+    def __str__(self):
+        return f"{self.key} ({self.ref_count} refs)"
+
+class UserPhoto(ProfileBundleMember, models.Model):
+    # Gallery uploads reach S3 in the background (see homepage/uploads.py)
+    UPLOAD_PENDING = 'pending'
+    UPLOAD_UPLOADED = 'uploaded'
+    UPLOAD_FAILED = 'failed'
+    UPLOAD_STATUS_CHOICES = [
+        (UPLOAD_PENDING, 'Pending'),
+        (UPLOAD_UPLOADED, 'Uploaded'),
+        (UPLOAD_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='photos')
     image = models.ImageField(upload_to='gallery/')
     caption = models.CharField(max_length=200, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    upload_status = models.CharField(max_length=10, choices=UPLOAD_STATUS_CHOICES, default=UPLOAD_UPLOADED)
+    upload_attempts = models.PositiveSmallIntegerField(default=0)
+    upload_error = models.CharField(max_length=500, blank=True)
+    # SHA-256 and size of the uploaded bytes, recorded while they stream in
+    content_sha256 = models.CharField(max_length=64, blank=True)
+    size = models.PositiveIntegerField(null=True, blank=True)
+    # Resized renditions of the image (see homepage/images.py)
+    variants = models.JSONField(default=dict, blank=True)
+    # Shared content-addressed storage; null for photos uploaded before dedup
+    blob = models.ForeignKey(MediaBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='photos')
+    # Presigned key the photo was completed from; unique, so one upload makes one photo
+    upload_key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    # Denormalized count of PhotoLike rows, kept in step by toggle_like
+    # (reconciled by manage.py rebuild_like_counts)
+    like_count = models.PositiveIntegerField(default=0)
+
+    def image_url(self, variant='full', fmt='jpeg'):
+        """URL of a resized variant, falling back to the original upload."""
+        from .images import variant_url
+        return variant_url(self.variants, variant, fmt) or self.image.url
+
+    @property
+    def medium_url(self):
+        return self.image_url('medium')
+
+    @property
+    def full_url(self):
+        return self.image_url('full')
 
     def __str__(self):
         return f"Photo by {self.user.username} at {self.created_at}"
@@ -163,8 +377,22 @@ class PhotoComment(models.Model):
     photo = models.ForeignKey(UserPhoto, on_delete=models.CASCADE, related_name='comments')
     text = models.TextField()
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
+    # Top-level comment of the thread (null for top-level comments), so a
+    # whole thread is one indexed lookup instead of a walk down ``replies``
+    root = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='thread')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['photo', 'parent', 'id'], name='photocomment_toplevel_idx'),
+            models.Index(fields=['root', 'id'], name='photocomment_thread_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.parent_id and not self.root_id:
+            self.root_id = self.parent.root_id or self.parent_id
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username} on {self.photo.id}: {self.text[:20]}"
 
@@ -174,22 +402,96 @@ class Community(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='communities_created')
     is_private = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized count of memberships, kept by CommunityMembership.save and
+    # the post_delete receiver (manage.py rebuild_member_counts reconciles it)
+    member_count = models.PositiveIntegerField(default=0)
+
+    # Counter suffixes tried before falling back to a random one (see SlugCounter)
+    SLUG_ATTEMPTS = 5
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base = slugify(self.name)[:110] or 'community'
-            slug = base
-            i = 1
-            while Community.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base}-{i}"
-                i += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+        if self.slug:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                SlugCounter.claim(self.slug)
+            return
+        base = slugify(self.name)[:110] or 'community'
+        for attempt in range(self.SLUG_ATTEMPTS + 1):
+            if attempt < self.SLUG_ATTEMPTS:
+                suffix = SlugCounter.next_suffix(base)
+                self.slug = f"{base}-{suffix}" if suffix else base
+            else:
+                # The counter kept colliding (slugs changed behind its back)
+                self.slug = f"{base}-{get_random_string(8, SLUG_RANDOM_CHARS)}"
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # Taken by a slug set by hand; anything else is not ours to retry
+                if attempt == self.SLUG_ATTEMPTS or not Community.objects.filter(slug=self.slug).exists():
+                    self.slug = ''
+                    raise
 
     def __str__(self):
         return self.name
 
 
+# Random slug suffixes are never all digits, so they cannot be counter suffixes
+SLUG_RANDOM_CHARS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def split_slug(slug):
+    """(base, suffix) of a community slug: 'study-group-7' -> ('study-group', 7), 'study-group' -> ('study-group', 0)."""
+    base, _, suffix = slug.rpartition('-')
+    if base and suffix.isdigit():
+        return base, int(suffix)
+    return slug, 0
+
+
+class SlugCounter(models.Model):
+    """
+    Last suffix handed out per community slug base ("study-group" -> 7
+    means study-group-7 is taken), so a new slug costs one row update
+    however many communities share the name. The row lock taken by that
+    update also serializes concurrent creates with the same base.
+
+    Slugs set by hand are claimed too, so the counter never trails an
+    existing slug; a base without a row has never been used (migration
+    0037 seeded the rows for slugs made before the counters).
+    """
+    base = models.SlugField(max_length=120, unique=True)
+    last = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def next_suffix(cls, base):
+        """The next suffix for ``base``; 0 means the bare base."""
+        with transaction.atomic():
+            if cls.objects.filter(base=base).update(last=models.F('last') + 1):
+                return cls.objects.filter(base=base).values_list('last', flat=True).get()
+        try:
+            with transaction.atomic():
+                return cls.objects.create(base=base, last=0).last
+        except IntegrityError:
+            # Created concurrently: take the next suffix from that row
+            return cls.next_suffix(base)
+
+    @classmethod
+    def claim(cls, slug):
+        """Record ``slug`` as taken, moving its base's counter up to it if needed."""
+        base, suffix = split_slug(slug)
+        with transaction.atomic():
+            if cls.objects.filter(base=base).update(last=Greatest(models.F('last'), suffix)):
+                return
+        try:
+            with transaction.atomic():
+                cls.objects.create(base=base, last=suffix)
+        except IntegrityError:
+            cls.claim(slug)
+
+    def __str__(self):
+        return f"{self.base} ({self.last})"
+
+
 class CommunityMembership(models.Model):
     ROLE_ADMIN = 'admin'
     ROLE_MEMBER = 'member'
@@ -215,6 +517,43 @@ class CommunityMembership(models.Model):
             UniqueConstraint(fields=['community', 'user'], name='unique_community_user_membership'),
         ]
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Community.objects.filter(pk=self.community_id).update(member_count=models.F('member_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            if self.pk is not None and not type(self).objects.select_for_update().filter(pk=self.pk).exists():
+                # Already gone (deleted twice, or concurrently): not counted again
+                return 0, {}
+            return super().delete(*args, **kwargs)
+
+
+@receiver(post_delete, sender=CommunityMembership, dispatch_uid='community_member_count')
+def decrement_member_count(sender, instance, **kwargs):
+    """Count every removal, including queryset deletes and cascades from a deleted user."""
+    Community.objects.filter(pk=instance.community_id).update(member_count=Greatest(models.F('member_count') - 1, 0))
+
+
+@receiver(post_save, sender=CommunityMembership, dispatch_uid='community_role_saved')
+def cache_community_role(sender, instance, **kwargs):
+    membership_cache.store(instance.community_id, instance.user_id, instance.role)
+
+
+@receiver(post_delete, sender=CommunityMembership, dispatch_uid='community_role_deleted')
+def forget_community_role(sender, instance, **kwargs):
+    """
+    Every removal, including queryset deletes, admin bulk actions and the
+    cascade from a deleted community or user, clears the cached role and
+    closes the member's open chat sockets.
+    """
+    membership_cache.store(instance.community_id, instance.user_id, membership_cache.NOT_MEMBER)
+    from api import realtime
+    realtime.disconnect_member(instance.community_id, instance.user_id)
+
     def __str__(self):
         return f"{self.user.username} in {self.community.slug} ({self.role})"
 
@@ -224,6 +563,14 @@ class ChatMessage(models.Model):
     community = models.ForeignKey(Community, on_delete=models.CASCADE, null=True, blank=True, related_name='messages')
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized reaction counts + recent reactors (see homepage/reactions.py)
+    reaction_summary = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination: "messages in room X after/before id N"
+            models.Index(fields=['community', 'id'], name='chat_community_id_idx'),
+        ]
 
     def __str__(self):
         scope = self.community.slug if self.community_id else 'global'
@@ -239,37 +586,109 @@ class Conversation(models.Model):
       - homepage_directmessage
 
     For 1:1 messaging we treat conversations with exactly 2 participants as DMs.
+    A DM also records its pair as (dm_user_low, dm_user_high), ordered by
+    user id, so "the DM between A and B" is one unique index lookup.
     """
 
-    participants = models.ManyToManyField(User, related_name='conversations')
+    participants = models.ManyToManyField(User, related_name='conversations', through='ConversationParticipant')
+    dm_user_low = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    dm_user_high = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['dm_user_low', 'dm_user_high'], name='unique_dm_pair'),
+        ]
+
+    @classmethod
+    def get_or_create_dm(cls, user_a, user_b):
+        """
+        Return (conversation, created) for the 1:1 thread between two users.
+
+        Safe under concurrency: the unique pair constraint makes a racing
+        second create fail, and get_or_create then returns the winner's row.
+        """
+        low, high = sorted([user_a.pk, user_b.pk])
+        with transaction.atomic():
+            convo, created = cls.objects.get_or_create(dm_user_low_id=low, dm_user_high_id=high)
+            if created:
+                convo.participants.add(user_a, user_b)
+        return convo, created
+
     def other_user(self, me):
         # For 1:1 conversations, return the other participant.
         if not me:
             return None
+        if self.dm_user_low_id and self.dm_user_high_id:
+            other_id = self.dm_user_high_id if self.dm_user_low_id == me.pk else self.dm_user_low_id
+            return User.objects.filter(pk=other_id).first()
         qs = self.participants.exclude(pk=me.pk)
         return qs.first()
 
+    def mark_read(self, user, message_id):
+        """
+        Move ``user``'s read marker up to ``message_id``.
+
+        A single-row UPDATE, and a no-op when the marker is already there.
+        """
+        return ConversationParticipant.objects.filter(
+            conversation=self, user=user, last_read_message_id__lt=message_id
+        ).update(last_read_message_id=message_id, last_read_at=timezone.now())
+
+    def count_unread(self, user, last_read_message_id=0):
+        """Messages from others after ``user``'s read marker (a range scan on (conversation, id))."""
+        return self.messages.filter(id__gt=last_read_message_id).exclude(sender=user).count()
+
     def __str__(self):
         return f"Conversation {self.pk}"
 
 
+class ConversationParticipant(models.Model):
+    """
+    A user's membership in a Conversation (the rows of Conversation.participants).
+
+    last_read_message_id is a high-water mark: every message in the
+    conversation with an id up to it has been read by this user. Marking a
+    thread read moves the marker instead of flagging each message, and the
+    other side's marker doubles as a read receipt.
+    """
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    last_read_message_id = models.BigIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # The table Django created for the original auto-generated M2M
+        db_table = 'homepage_conversation_participants'
+        unique_together = [('conversation', 'user')]
+
+    def __str__(self):
+        return f"{self.user_id} in conversation {self.conversation_id} (read up to {self.last_read_message_id})"
+
+
 class DirectMessage(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dm_messages_sent')
     text = models.TextField()  # Stores encrypted data
     created_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
+    # Denormalized reaction counts + recent reactors (see homepage/reactions.py)
+    reaction_summary = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination: "messages in thread X after/before id N"
+            models.Index(fields=['conversation', 'id'], name='dm_conversation_id_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """Override save to encrypt message text before storing."""
         # Encrypt message if not already encrypted
-        # if self.text and not self._is_encrypted(self.text):
-        #     from .encryption import MessageEncryption
-        #     self.text = MessageEncryption.encrypt(self.text)
-        
+        if self.text and not self._is_encrypted(self.text):
+            from .encryption import MessageEncryption
+            self.text = MessageEncryption.encrypt(self.text)
+
         super().save(*args, **kwargs)
         
         # Keep conversation ordering fresh for inbox sorting
@@ -280,7 +699,8 @@ class DirectMessage(models.Model):
         Check if text is already encrypted.
         Fernet encrypted strings start with 'gAAAAA' prefix.
         """
-        return text.startswith('gAAAAA')
+        from .encryption import MessageEncryption
+        return MessageEncryption.is_encrypted(text)
     
     def get_decrypted_text(self):
         """Get the decrypted message text."""
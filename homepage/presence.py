@@ -0,0 +1,128 @@
+"""
+Online presence tracking.
+
+Heartbeats are written to the cache (shared between workers when a Redis
+cache is configured) instead of the database. Each worker also remembers
+the heartbeats it has seen and flushes them to Profile.last_activity in
+one UPDATE every PRESENCE_FLUSH_INTERVAL seconds, so the column stays a
+reasonable "last seen" for cold caches and for anything reading the DB.
+
+Settings (all optional):
+    PRESENCE_ONLINE_WINDOW     seconds a heartbeat counts as online (300)
+    PRESENCE_HEARTBEAT_EVERY   min seconds between cache writes per user (30)
+    PRESENCE_FLUSH_INTERVAL    seconds between DB flushes per worker (60)
+"""
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+CACHE_KEY = 'presence:{}'
+
+_lock = threading.Lock()
+_pending = {}        # user_id -> epoch seconds, waiting to be flushed to the DB
+_last_written = {}   # user_id -> epoch seconds of the last cache write by this worker
+_last_flush = time.monotonic()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def online_window():
+    return timedelta(seconds=_setting('PRESENCE_ONLINE_WINDOW', 300))
+
+
+def record_heartbeat(user_id, now=None):
+    """Note that ``user_id`` is active. Cheap enough to call on every request."""
+    now = now or time.time()
+    with _lock:
+        _pending[user_id] = now
+        last = _last_written.get(user_id, 0)
+        if now - last < _setting('PRESENCE_HEARTBEAT_EVERY', 30):
+            return
+        _last_written[user_id] = now
+    cache.set(CACHE_KEY.format(user_id), now, timeout=int(online_window().total_seconds()) * 2)
+
+
+def last_seen_many(user_ids):
+    """{user_id: aware datetime} for users with a heartbeat in the cache (one round-trip)."""
+    user_ids = [uid for uid in set(user_ids) if uid]
+    if not user_ids:
+        return {}
+    found = cache.get_many([CACHE_KEY.format(uid) for uid in user_ids])
+    result = {}
+    for uid in user_ids:
+        ts = found.get(CACHE_KEY.format(uid))
+        if ts is not None:
+            result[uid] = datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+    return result
+
+
+def is_online(last_seen, fallback=None):
+    """True if the newer of ``last_seen`` (cache) and ``fallback`` (DB column) is recent."""
+    seen = max((t for t in (last_seen, fallback) if t), default=None)
+    return bool(seen) and timezone.now() - seen < online_window()
+
+
+def flush():
+    """Write pending heartbeats to Profile.last_activity in a single UPDATE."""
+    from .models import Profile
+
+    global _last_flush
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+        # Forget throttle entries that can no longer suppress a write
+        cutoff = time.time() - _setting('PRESENCE_HEARTBEAT_EVERY', 30)
+        for uid in [uid for uid, ts in _last_written.items() if ts < cutoff]:
+            del _last_written[uid]
+    if not pending:
+        return 0
+
+    whens = [
+        When(user_id=uid, then=Value(datetime.fromtimestamp(ts, tz=dt_timezone.utc)))
+        for uid, ts in pending.items()
+    ]
+    updated = Profile.objects.filter(user_id__in=pending).update(
+        last_activity=Case(*whens, output_field=DateTimeField())
+    )
+    if updated < len(pending):
+        # Self-heal users without a profile (the old middleware did get_or_create)
+        from django.contrib.auth.models import User
+
+        missing = User.objects.filter(id__in=pending, profile__isnull=True).values_list('id', flat=True)
+        Profile.objects.bulk_create([Profile(user_id=uid) for uid in missing], ignore_conflicts=True)
+    return len(pending)
+
+
+def maybe_flush():
+    """Flush if this worker has not flushed for PRESENCE_FLUSH_INTERVAL seconds."""
+    if time.monotonic() - _last_flush < _setting('PRESENCE_FLUSH_INTERVAL', 60):
+        return 0
+    return flush()
+
+
+def reset():
+    """Drop all in-process and cached presence state (for tests)."""
+    with _lock:
+        user_ids = set(_pending) | set(_last_written)
+        _pending.clear()
+        _last_written.clear()
+    cache.delete_many([CACHE_KEY.format(uid) for uid in user_ids])
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,55 @@
+"""
+Cache of public profile bundles (GET /api/profiles/<username>/bundle/).
+
+A bundle holds everything /u/<username>/ renders. It is dropped whenever
+one of its sections changes: Profile, Education, Experience, Skill and
+UserPhoto invalidate on save/delete (see ProfileBundleMember in
+homepage/models.py), and the upload pipeline invalidates when a photo
+becomes visible.
+
+Bundles are stored under a per-user version that invalidation replaces
+(after the transaction commits), rather than deleted: a request that
+read the old rows just before a change can only write its bundle under
+the old version, where nobody will look for it again.
+
+Settings (optional):
+    PROFILE_BUNDLE_TIMEOUT   seconds a bundle may be served from cache (600)
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_KEY = 'profile-bundle:{}:{}'
+VERSION_KEY = 'profile-bundle-version:{}'
+
+
+def timeout():
+    return getattr(settings, 'PROFILE_BUNDLE_TIMEOUT', 600)
+
+
+def _version(user_id):
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_or_build(user_id, build):
+    """The cached bundle of ``user_id``, calling ``build()`` (and caching the result) on a miss."""
+    key = CACHE_KEY.format(user_id, _version(user_id))
+    bundle = cache.get(key)
+    if bundle is None:
+        bundle = build()
+        cache.set(key, bundle, timeout=timeout())
+    return bundle
+
+
+def invalidate(*user_ids):
+    """Retire the cached bundles of ``user_ids`` once the current transaction commits."""
+    keys = [VERSION_KEY.format(uid) for uid in set(user_ids) if uid]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many({key: time.time_ns() for key in keys}, timeout=None))
@@ -0,0 +1,147 @@
+"""
+Denormalized emoji reaction summaries.
+
+Every ChatMessage / DirectMessage carries a ``reaction_summary`` JSON column
+so a message list can render its reactions without touching the reaction
+tables:
+
+    {
+        "counts": {"👍": 3, "❤️": 1},
+        "recent": {"👍": [7, 12, 3], ...}
+    }
+
+``recent`` keeps the user ids of the newest RECENT_REACTORS_LIMIT
+reactors per emoji, newest first (by the reaction's created_at, then id,
+in every path that writes it). Usernames are not stored, so renames
+cannot leave them stale: ``reactor_usernames`` looks them up for a whole
+page of messages at read time.
+
+The reaction rows (MessageReaction / CommunityMessageReaction) stay the
+source of truth; ``manage.py rebuild_reaction_summaries`` recomputes the
+summaries from them (with ``build_summary``).
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+RECENT_REACTORS_LIMIT = 10
+# Newest reactors first: the one order used for ``recent``
+RECENT_ORDER = ('-created_at', '-id')
+
+
+def empty_summary():
+    return {'counts': {}, 'recent': {}}
+
+
+def build_summary(reactions):
+    """Compute a summary from a message's reaction rows (in any order)."""
+    summary = empty_summary()
+    for reaction in sorted(reactions, key=lambda r: (r.created_at, r.id), reverse=True):
+        counts, recent = summary['counts'], summary['recent']
+        counts[reaction.emoji] = counts.get(reaction.emoji, 0) + 1
+        reactors = recent.setdefault(reaction.emoji, [])
+        if len(reactors) < RECENT_REACTORS_LIMIT:
+            reactors.append(reaction.user_id)
+    return summary
+
+
+def _refresh(summary, reaction_model, message_id, emoji, delta):
+    """Apply a count change to ``emoji`` and reread its recent reactors from the rows."""
+    counts = summary.setdefault('counts', {})
+    recent = summary.setdefault('recent', {})
+    remaining = counts.get(emoji, 0) + delta
+    if remaining > 0:
+        counts[emoji] = remaining
+        recent[emoji] = list(
+            reaction_model.objects.filter(message_id=message_id, emoji=emoji)
+            .order_by(*RECENT_ORDER).values_list('user_id', flat=True)[:RECENT_REACTORS_LIMIT]
+        )
+    else:
+        counts.pop(emoji, None)
+        recent.pop(emoji, None)
+
+
+def _locked(message):
+    # Serialize concurrent toggles on the same message so the summary
+    # read-modify-write cannot lose an update.
+    return type(message).objects.select_for_update().only('id', 'reaction_summary').get(pk=message.pk)
+
+
+def set_reaction(reaction_model, message, user, emoji):
+    """
+    Set ``user``'s reaction on ``message`` to ``emoji`` (one per user) and
+    update the message summary in the same transaction.
+    """
+    with transaction.atomic():
+        locked = _locked(message)
+        summary = locked.reaction_summary or empty_summary()
+
+        reaction = reaction_model.objects.filter(message_id=message.pk, user=user).first()
+        if reaction and reaction.emoji == emoji:
+            return reaction
+        if reaction:
+            # A changed reaction counts as a new one: it moves to the front
+            previous = reaction.emoji
+            reaction.emoji = emoji
+            reaction.created_at = timezone.now()
+            reaction.save(update_fields=['emoji', 'created_at'])
+            _refresh(summary, reaction_model, message.pk, previous, -1)
+        else:
+            reaction = reaction_model.objects.create(message_id=message.pk, user=user, emoji=emoji)
+        _refresh(summary, reaction_model, message.pk, emoji, +1)
+
+        type(message).objects.filter(pk=message.pk).update(reaction_summary=summary)
+        message.reaction_summary = summary
+        return reaction
+
+
+def remove_reaction(reaction_model, message, user, emoji):
+    """Remove ``user``'s ``emoji`` reaction. Returns True if one was removed."""
+    with transaction.atomic():
+        locked = _locked(message)
+        deleted = reaction_model.objects.filter(message_id=message.pk, user=user, emoji=emoji).delete()[0]
+        if not deleted:
+            return False
+
+        summary = locked.reaction_summary or empty_summary()
+        _refresh(summary, reaction_model, message.pk, emoji, -1)
+        type(message).objects.filter(pk=message.pk).update(reaction_summary=summary)
+        message.reaction_summary = summary
+        return True
+
+
+def reactor_usernames(summaries):
+    """{user_id: username} for every recent reactor in ``summaries`` (one query)."""
+    ids = {
+        user_id
+        for summary in summaries
+        for reactors in (summary or {}).get('recent', {}).values()
+        for user_id in reactors
+    }
+    if not ids:
+        return {}
+    return dict(User.objects.filter(id__in=ids).values_list('id', 'username'))
+
+
+def summary_to_groups(summary, usernames, me_id=None, my_emoji=None, my_username=None):
+    """
+    Turn a stored summary into the API shape:
+        [{"emoji": "👍", "count": 3, "users": [{"username": "bob", "is_me": False}, ...]}]
+
+    ``usernames`` maps the reactors' ids to their current usernames (see
+    reactor_usernames). ``my_emoji`` is the current user's reaction (looked
+    up separately) so ``is_me`` is right even when they are not among the
+    recent reactors.
+    """
+    summary = summary or empty_summary()
+    recent = summary.get('recent', {})
+    groups = []
+    for emoji, count in summary.get('counts', {}).items():
+        users = [
+            {'username': usernames[user_id], 'is_me': bool(me_id) and user_id == me_id}
+            for user_id in recent.get(emoji, []) if user_id in usernames
+        ]
+        if my_emoji == emoji and not any(u['is_me'] for u in users):
+            users.insert(0, {'username': my_username, 'is_me': True})
+        groups.append({'emoji': emoji, 'count': count, 'users': users})
+    return groups
@@ -0,0 +1,772 @@
+"""
+Background upload pipeline for gallery photos.
+
+The request only stages the image bytes on local disk and creates the
+UserPhoto row with upload_status=pending; a small thread pool then pushes
+the file and its resized variants (homepage/images.py) to S3 (Supabase
+storage) with retries and exponential backoff and marks the row uploaded
+or failed. Gunicorn workers are no longer blocked on the S3 round-trip.
+Avatar variants are built and uploaded by the same pool.
+
+Multipart uploads are streamed to the staging dir by StagingUploadHandler
+(hashed as they arrive, with a size cap) instead of being buffered in
+memory.
+
+Gallery images are content-addressed: each photo points at a MediaBlob
+keyed by the SHA-256 of its bytes and stored once under
+``gallery/<sha256>.<ext>``. Re-uploading a picture someone already has
+adds a reference instead of another transfer, and the S3 objects are
+deleted only when the last photo using them is.
+
+Clients can also skip the app server entirely: presign_upload() hands out
+short-lived presigned PUT/POST targets under ``gallery/incoming/<user id>/``
+with the SHA-256 the client declared signed in (x-amz-checksum-sha256), so
+storage rejects any other bytes and records the checksum. Once the browser
+has uploaded, the completion endpoint creates the pending row and ingest()
+adopts the object without downloading it: checksum and size come from
+HeadObject, the type from a ranged GET of its first bytes, and a
+server-side CopyObject moves it to its content-addressed key. Stripping
+EXIF and building the variants of such blobs happens outside the web
+process, in ``manage.py process_direct_uploads`` (run it as a worker with
+--watch, or from cron); until then the photo stays pending. The bucket
+needs a CORS rule allowing PUT/POST from the site (including the checksum
+headers), and a lifecycle rule expiring ``gallery/incoming/`` catches
+uploads that are never completed.
+
+One boto3 client per region is built lazily and shared by every upload
+(boto3 clients are thread-safe and keep a connection pool), instead of a
+new client per request. Rows left pending by a restart can be re-queued
+with ``manage.py retry_photo_uploads``.
+
+Settings (all optional):
+    PHOTO_UPLOAD_STAGING_DIR    where staged bytes wait (<tmp>/ai-counsellor-uploads)
+    PHOTO_UPLOAD_WORKERS        upload threads per process (4)
+    PHOTO_UPLOAD_MAX_ATTEMPTS   tries before a photo is marked failed (5)
+    PHOTO_UPLOAD_BACKOFF        base delay in seconds, doubled per retry (1.0)
+    PHOTO_UPLOAD_REGIONS        regions to try in order ([AWS_S3_REGION_NAME, 'us-east-1'])
+    PHOTO_UPLOAD_MAX_BYTES      largest accepted image (10 MB)
+    PHOTO_UPLOAD_URL_EXPIRES    lifetime of presigned upload URLs in seconds (300)
+"""
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from django.db import close_old_connections, transaction
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+from . import images, profile_cache
+
+logger = logging.getLogger(__name__)
+
+INCOMING_PREFIX = 'gallery/incoming/'
+# Content types accepted for direct uploads, with the extension their key gets
+IMAGE_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+
+_lock = threading.Lock()
+_clients = {}      # region -> boto3 S3 client
+_executor = None
+_futures = set()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def staging_dir():
+    path = Path(_setting('PHOTO_UPLOAD_STAGING_DIR', None) or Path(tempfile.gettempdir()) / 'ai-counsellor-uploads')
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def staged_path(key):
+    # Keys look like "gallery/<name>"; keep the staging dir flat
+    return staging_dir() / key.replace('/', '__')
+
+
+def regions():
+    configured = _setting('PHOTO_UPLOAD_REGIONS', None)
+    if configured:
+        return list(configured)
+    # Supabase's S3 endpoint has accepted either region depending on the project
+    return list(dict.fromkeys([settings.AWS_S3_REGION_NAME, 'us-east-1']))
+
+
+def get_s3_client(region):
+    """The shared S3 client for ``region`` (built on first use)."""
+    client = _clients.get(region)
+    if client is not None:
+        return client
+    with _lock:
+        if region not in _clients:
+            import boto3
+            from botocore.config import Config
+
+            key_id = settings.AWS_ACCESS_KEY_ID
+            secret = settings.AWS_SECRET_ACCESS_KEY
+            _clients[region] = boto3.client(
+                's3',
+                endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+                region_name=region,
+                aws_access_key_id=key_id.strip() if key_id else None,
+                aws_secret_access_key=secret.strip() if secret else None,
+                config=Config(
+                    signature_version='s3v4',
+                    s3={'addressing_style': getattr(settings, 'AWS_S3_ADDRESSING_STYLE', None) or 'auto'},
+                    max_pool_connections=max(10, _setting('PHOTO_UPLOAD_WORKERS', 4)),
+                    # Retries are handled by the pipeline (with region fallback)
+                    retries={'max_attempts': 1, 'mode': 'standard'},
+                ),
+            )
+        return _clients[region]
+
+
+def reset():
+    """Drop cached clients and wait for queued uploads (for tests and settings changes)."""
+    wait()
+    with _lock:
+        _clients.clear()
+
+
+def stage(photo, data):
+    """Write the bytes for ``photo.image.name`` to the staging dir."""
+    return stage_bytes(photo.image.name, data)
+
+
+def stage_bytes(key, data):
+    path = staged_path(key)
+    tmp = path.with_name(path.name + '.part')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return path
+
+
+class StagedUploadedFile(UploadedFile):
+    """A request file that already sits in the staging dir under ``staged_key``."""
+
+    def __init__(self, path, staged_key, name, content_type, size, charset, sha256):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset)
+        self.staged_key = staged_key
+        self.sha256 = sha256
+        self._path = path
+
+    def temporary_file_path(self):
+        # Lets ImageField validation open the file from disk instead of
+        # reading it into memory
+        return str(self._path)
+
+    def discard(self):
+        self.close()
+        Path(self._path).unlink(missing_ok=True)
+
+
+class StagingUploadHandler(FileUploadHandler):
+    """
+    Stream multipart files straight into the staging dir.
+
+    Chunks are written to disk and hashed (SHA-256) as they arrive, so
+    the worker never holds more than one chunk of an upload in memory.
+    Files over ``max_bytes`` stop the upload and set ``too_large``.
+    """
+
+    def __init__(self, request=None, prefix='gallery', max_bytes=None):
+        super().__init__(request)
+        self.prefix = prefix
+        self.max_bytes = max_bytes or max_upload_bytes()
+        self.too_large = False
+        self._tmp = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Refuse early when the whole body is already bigger than allowed
+        # (a little slack for the multipart framing and other fields)
+        if content_length and content_length > self.max_bytes + 64 * 1024:
+            self.too_large = True
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        ext = os.path.splitext(file_name)[1].lower()[:10] or '.jpg'
+        self.key = f"{self.prefix}/{uuid.uuid4().hex}{ext}"
+        self.path = staged_path(self.key)
+        self._tmp = open(self.path.with_name(self.path.name + '.part'), 'wb')
+        self._hash = hashlib.sha256()
+        self._size = 0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._size += len(raw_data)
+        if self._size > self.max_bytes:
+            self.too_large = True
+            self._abort()
+            # Drain (without storing) the rest of the body so the 413 reaches the client
+            raise StopUpload(connection_reset=False)
+        self._hash.update(raw_data)
+        self._tmp.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        tmp_path = self._tmp.name
+        self._tmp.close()
+        self._tmp = None
+        os.replace(tmp_path, self.path)
+        return StagedUploadedFile(
+            self.path, self.key, self.file_name, self.content_type, file_size,
+            self.charset, self._hash.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        self._abort()
+
+    def _abort(self):
+        if self._tmp is not None:
+            self._tmp.close()
+            Path(self._tmp.name).unlink(missing_ok=True)
+            self._tmp = None
+
+
+def content_key(sha256, ext, prefix='gallery'):
+    return f"{prefix}/{sha256}{ext}"
+
+
+def attach_blob(photo, sha256, size, ext, staged=None, data=None):
+    """
+    Point ``photo`` at the blob holding its content (creating it if this
+    content is new) and set its key, status and variants accordingly.
+
+    The bytes come either from an already ``staged`` file (moved into
+    place, or dropped when the blob has them already) or from ``data``.
+    Call inside the transaction that saves the photo. Returns (blob, created).
+    """
+    from .models import MediaBlob, UserPhoto
+
+    blob, created = MediaBlob.acquire(sha256, content_key(sha256, ext), size)
+    photo.blob = blob
+    photo.image.name = blob.key
+    photo.content_sha256 = sha256
+    photo.size = size
+
+    target = staged_path(blob.key)
+    if blob.uploaded:
+        # Already on S3: nothing to transfer
+        photo.upload_status = UserPhoto.UPLOAD_UPLOADED
+        photo.variants = blob.variants
+        if staged is not None:
+            staged.discard()
+    elif target.exists():
+        # Another upload of the same bytes is still queued
+        photo.upload_status = UserPhoto.UPLOAD_PENDING
+        if staged is not None:
+            staged.discard()
+    else:
+        photo.upload_status = UserPhoto.UPLOAD_PENDING
+        if staged is not None:
+            staged.close()
+            os.replace(staged.temporary_file_path(), target)
+        else:
+            stage_bytes(blob.key, data)
+    return blob, created
+
+
+def presign_upload(user_id, content_type, sha256):
+    """
+    Presigned targets for uploading one image straight to the bucket.
+
+    The key is fresh and scoped to the user (see is_incoming_key). Both
+    targets sign in the content type and ``sha256`` (hex) of the bytes the
+    client will send, as the x-amz-checksum-sha256 storage verifies and
+    keeps; the POST policy also enforces PHOTO_UPLOAD_MAX_BYTES.
+    """
+    ext = IMAGE_TYPES[content_type]
+    key = f"{INCOMING_PREFIX}{user_id}/{uuid.uuid4().hex}{ext}"
+    checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+    expires = _setting('PHOTO_UPLOAD_URL_EXPIRES', 300)
+    client = get_s3_client(regions()[0])
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    put_url = client.generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': bucket, 'Key': key, 'ContentType': content_type,
+            'ChecksumAlgorithm': 'SHA256', 'ChecksumSHA256': checksum,
+        },
+        ExpiresIn=expires,
+    )
+    checksum_fields = {'x-amz-checksum-algorithm': 'SHA256', 'x-amz-checksum-sha256': checksum}
+    post = client.generate_presigned_post(
+        bucket, key,
+        Fields={'Content-Type': content_type, **checksum_fields},
+        Conditions=[
+            {'Content-Type': content_type},
+            *({name: value} for name, value in checksum_fields.items()),
+            ['content-length-range', 1, max_upload_bytes()],
+        ],
+        ExpiresIn=expires,
+    )
+    return {
+        'key': key,
+        'expires_in': expires,
+        'put': {
+            'url': put_url,
+            'headers': {
+                'Content-Type': content_type,
+                'x-amz-checksum-sha256': checksum,
+                'x-amz-sdk-checksum-algorithm': 'SHA256',
+            },
+        },
+        'post': post,
+    }
+
+
+def is_incoming_key(key, user_id):
+    """True for a key presign_upload() could have issued to ``user_id``."""
+    exts = '|'.join(re.escape(ext[1:]) for ext in IMAGE_TYPES.values())
+    pattern = rf"{re.escape(INCOMING_PREFIX)}{int(user_id)}/[0-9a-f]{{32}}\.(?:{exts})"
+    return bool(key) and re.fullmatch(pattern, key) is not None
+
+
+def discard_staged(key):
+    """Drop the not-yet-uploaded bytes of a deleted photo (local or incoming)."""
+    staged_path(key).unlink(missing_ok=True)
+    if key.startswith(INCOMING_PREFIX):
+        transaction.on_commit(lambda: _submit(delete_keys, [key]))
+
+
+def release_blob(blob_id):
+    """
+    Drop a photo's reference to ``blob_id`` (after deleting the photo) and,
+    if it was the last one, delete the stored objects once the transaction
+    commits.
+    """
+    from .models import MediaBlob
+
+    blob = MediaBlob.release(blob_id)
+    if blob is not None:
+        keys = blob_keys(blob)
+        transaction.on_commit(lambda: _submit(delete_blob_objects, blob.sha256, keys))
+    return blob
+
+
+def blob_keys(blob):
+    """Storage keys of a blob: the original first, then its variants."""
+    return [blob.key] + [key for formats in blob.variants.values() for key in formats.values()]
+
+
+def max_upload_bytes():
+    return _setting('PHOTO_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+
+
+def enqueue(photo_id):
+    """Upload ``photo_id`` in the background once the current transaction commits."""
+    transaction.on_commit(lambda: _submit(upload, photo_id))
+
+
+def enqueue_avatar_variants(profile_id, key):
+    """Build and upload the variants of the avatar staged under ``key`` after commit."""
+    transaction.on_commit(lambda: _submit(build_avatar_variants, profile_id, key))
+
+
+def _submit(job, *args):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_setting('PHOTO_UPLOAD_WORKERS', 4), thread_name_prefix='photo-upload'
+            )
+        future = _executor.submit(_run, job, *args)
+        _futures.add(future)
+    future.add_done_callback(_futures.discard)
+    return future
+
+
+def wait(timeout=None):
+    """Block until every queued upload has finished."""
+    for future in list(_futures):
+        future.result(timeout=timeout)
+
+
+def _run(job, *args):
+    close_old_connections()
+    try:
+        job(*args)
+    except Exception:
+        logger.exception("Upload job %s%r crashed", job.__name__, args)
+    finally:
+        close_old_connections()
+
+
+def _put(key, body):
+    """One attempt: try each region in turn. Returns None or the last error."""
+    last_error = None
+    for region in regions():
+        try:
+            get_s3_client(region).put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, Body=body)
+            return None
+        except Exception as e:
+            logger.warning("Photo upload of %s failed in region %s: %s", key, region, e)
+            last_error = e
+    return last_error
+
+
+def put_files(files, on_attempt=None):
+    """
+    Upload {key: bytes}, retrying what failed with exponential backoff.
+    Returns None on success or the last error once attempts run out.
+    """
+    attempts = _setting('PHOTO_UPLOAD_MAX_ATTEMPTS', 5)
+    backoff = _setting('PHOTO_UPLOAD_BACKOFF', 1.0)
+    remaining = dict(files)
+    error = None
+    for attempt in range(1, attempts + 1):
+        error = None
+        for key, body in list(remaining.items()):
+            failure = _put(key, body)
+            if failure is None:
+                del remaining[key]
+            else:
+                error = failure
+        if on_attempt:
+            on_attempt(attempt)
+        if not remaining:
+            return None
+        if attempt < attempts:
+            time.sleep(backoff * 2 ** (attempt - 1))
+    return error
+
+
+def get_object(key):
+    """Download ``key`` (used to backfill variants of existing media)."""
+    last_error = None
+    for region in regions():
+        try:
+            return get_s3_client(region).get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)['Body'].read()
+        except Exception as e:
+            last_error = e
+    raise last_error
+
+
+def head_object(key, checksum=False):
+    """
+    The HeadObject response for ``key``, or None if it does not exist.
+    With ``checksum`` it includes the stored ChecksumSHA256 (base64).
+    """
+    from botocore.exceptions import ClientError
+
+    extra = {'ChecksumMode': 'ENABLED'} if checksum else {}
+    last_error = None
+    for region in regions():
+        try:
+            return get_s3_client(region).head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, **extra)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            last_error = e
+        except Exception as e:
+            last_error = e
+    raise last_error
+
+
+def read_head(key, length):
+    """The first ``length`` bytes of ``key`` (a ranged GET)."""
+    last_error = None
+    for region in regions():
+        try:
+            response = get_s3_client(region).get_object(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, Range=f"bytes=0-{length - 1}"
+            )
+            return response['Body'].read()
+        except Exception as e:
+            last_error = e
+    raise last_error
+
+
+def copy_key(source, key, content_type):
+    """Server-side copy of ``source`` to ``key``. Returns None or the last error."""
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    last_error = None
+    for region in regions():
+        try:
+            get_s3_client(region).copy_object(
+                Bucket=bucket, Key=key, CopySource={'Bucket': bucket, 'Key': source},
+                ContentType=content_type, MetadataDirective='REPLACE',
+            )
+            return None
+        except Exception as e:
+            logger.warning("Copy of %s to %s failed in region %s: %s", source, key, region, e)
+            last_error = e
+    return last_error
+
+
+def _sha256_hex(checksum):
+    """Hex form of a base64 ChecksumSHA256, or None (absent, or a multipart composite)."""
+    try:
+        digest = base64.b64decode(checksum or '', validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return digest.hex() if len(digest) == 32 else None
+
+
+def delete_keys(keys):
+    """Delete ``keys`` from the bucket in one request. Returns True on success."""
+    last_error = None
+    for region in regions():
+        try:
+            get_s3_client(region).delete_objects(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+            )
+            return True
+        except Exception as e:
+            last_error = e
+    logger.warning("Could not delete %s: %s", keys, last_error)
+    return False
+
+
+def _render_variants(body, key):
+    try:
+        return images.build_variants(body, key)
+    except Exception as e:
+        # An image Pillow cannot read still gets its original uploaded
+        logger.warning("Could not build variants of %s: %s", key, e)
+        return {}, {}
+
+
+def upload(photo_id):
+    """
+    Push the staged file of ``photo_id`` and its resized variants to S3,
+    retrying with exponential backoff, and record the outcome on the row.
+    Returns the final status.
+    """
+    from .models import MediaBlob, UserPhoto
+
+    photo = (
+        UserPhoto.objects.filter(pk=photo_id)
+        .select_related('blob')
+        .only('id', 'user_id', 'image', 'upload_status', 'content_sha256', 'blob')
+        .first()
+    )
+    if photo is None or photo.upload_status == UserPhoto.UPLOAD_UPLOADED:
+        return photo and photo.upload_status
+    blob = photo.blob
+    if blob is not None and blob.uploaded:
+        return _finish_blob(blob)
+    if blob is not None and blob.stored:
+        # In the bucket already; process_direct_uploads finishes it
+        return UserPhoto.UPLOAD_PENDING
+    if blob is None and photo.image.name.startswith(INCOMING_PREFIX):
+        return ingest(photo)
+
+    key = photo.image.name
+    path = staged_path(key)
+    try:
+        body = path.read_bytes()
+    except FileNotFoundError:
+        if blob is not None:
+            # A job for another photo of the same content may have just finished
+            blob.refresh_from_db()
+            if blob.uploaded:
+                return _finish_blob(blob)
+        UserPhoto.objects.filter(pk=photo_id).update(
+            upload_status=UserPhoto.UPLOAD_FAILED, upload_error='Staged file is missing'
+        )
+        return UserPhoto.UPLOAD_FAILED
+    if photo.content_sha256 and hashlib.sha256(body).hexdigest() != photo.content_sha256:
+        UserPhoto.objects.filter(pk=photo_id).update(
+            upload_status=UserPhoto.UPLOAD_FAILED, upload_error='Staged file does not match its hash'
+        )
+        return UserPhoto.UPLOAD_FAILED
+
+    # The original is public too: drop its EXIF (GPS, camera) before it leaves
+    body = images.strip_metadata(body)
+    manifest, files = _render_variants(body, key)
+    files[key] = body
+
+    error = put_files(
+        files, on_attempt=lambda n: UserPhoto.objects.filter(pk=photo_id).update(upload_attempts=n)
+    )
+    if error is not None:
+        UserPhoto.objects.filter(pk=photo_id).update(
+            upload_status=UserPhoto.UPLOAD_FAILED, upload_error=str(error)[:500]
+        )
+        return UserPhoto.UPLOAD_FAILED
+
+    if blob is not None:
+        MediaBlob.objects.filter(pk=blob.pk).update(uploaded=True, variants=manifest)
+        blob.variants = manifest
+        _finish_blob(blob)
+    else:
+        UserPhoto.objects.filter(pk=photo_id).update(
+            upload_status=UserPhoto.UPLOAD_UPLOADED, upload_error='', variants=manifest
+        )
+        profile_cache.invalidate(photo.user_id)
+    path.unlink(missing_ok=True)
+    return UserPhoto.UPLOAD_UPLOADED
+
+
+def ingest(photo):
+    """
+    Adopt a presigned upload without downloading it: check the object the
+    browser put under ``gallery/incoming/`` (SHA-256 checksum and size
+    from HeadObject, image type from its first bytes), copy it to its
+    content-addressed key inside the bucket and attach the photo to that
+    blob. The photo stays pending until process_blob() has built the
+    variants, unless the content was uploaded before. The incoming object
+    is deleted either way.
+    """
+    from .models import MediaBlob, UserPhoto
+
+    key = photo.image.name
+
+    def fail(reason):
+        UserPhoto.objects.filter(pk=photo.pk).update(upload_status=UserPhoto.UPLOAD_FAILED, upload_error=reason[:500])
+        return UserPhoto.UPLOAD_FAILED
+
+    try:
+        head = head_object(key, checksum=True)
+        sha256 = _sha256_hex(head and head.get('ChecksumSHA256'))
+        content_type = None
+        if sha256 and 0 < head['ContentLength'] <= max_upload_bytes():
+            content_type = images.sniff_type(read_head(key, images.SNIFF_BYTES))
+    except Exception as e:
+        return fail(f"Uploaded object could not be checked: {e}")
+    if head is None:
+        return fail('Uploaded object is missing')
+    if content_type not in IMAGE_TYPES:
+        delete_keys([key])
+        return fail('Uploaded object is not an image within the size limit with a SHA-256 checksum')
+    size = head['ContentLength']
+
+    existing = MediaBlob.objects.filter(sha256=sha256).first()
+    target = existing.key if existing else content_key(sha256, IMAGE_TYPES[content_type])
+    copy = existing is None or not (existing.uploaded or existing.stored)
+    if copy:
+        error = copy_key(key, target, content_type)
+        if error is not None:
+            # The incoming object is kept: retry_photo_uploads tries again
+            return fail(f"Uploaded object could not be stored: {error}")
+
+    with transaction.atomic():
+        photo = UserPhoto.objects.select_for_update().filter(pk=photo.pk, blob__isnull=True).first()
+        if photo is not None:
+            blob, _ = MediaBlob.acquire(sha256, target, size)
+            if copy and blob.key == target and not blob.uploaded:
+                MediaBlob.objects.filter(pk=blob.pk).update(stored=True)
+            photo.blob = blob
+            photo.image.name = blob.key
+            photo.content_sha256 = sha256
+            photo.size = size
+            photo.save(update_fields=['blob', 'image', 'content_sha256', 'size'])
+    delete_keys([key])
+    if copy and (photo is None or blob.key != target) and not MediaBlob.objects.filter(key=target).exists():
+        # Deleted meanwhile, or the content went to another key: drop the copy
+        delete_keys([target])
+    if photo is None:
+        # Deleted (or already adopted) meanwhile
+        return None
+    if blob.uploaded:
+        return _finish_blob(blob)
+    return UserPhoto.UPLOAD_PENDING
+
+
+def process_blob(blob_id):
+    """
+    Finish a blob ingest() copied into the bucket: strip the original's
+    EXIF, build its variants, upload both and mark its photos uploaded.
+    Runs in ``manage.py process_direct_uploads``, not in the web process.
+    Returns the final status, or None if there was nothing to do.
+    """
+    from .models import MediaBlob, UserPhoto
+
+    blob = MediaBlob.objects.filter(pk=blob_id, stored=True, uploaded=False).first()
+    if blob is None:
+        return None
+    waiting = UserPhoto.objects.filter(blob_id=blob.pk).exclude(upload_status=UserPhoto.UPLOAD_UPLOADED)
+    try:
+        body = get_object(blob.key)
+    except Exception as e:
+        waiting.update(upload_status=UserPhoto.UPLOAD_FAILED, upload_error=f"Stored object could not be read: {e}"[:500])
+        return UserPhoto.UPLOAD_FAILED
+    if not images.is_image(body):
+        # Only the magic number looked right: never publish it
+        MediaBlob.objects.filter(pk=blob.pk).update(stored=False)
+        waiting.update(upload_status=UserPhoto.UPLOAD_FAILED, upload_error='Uploaded object is not a valid image')
+        delete_keys([blob.key])
+        return UserPhoto.UPLOAD_FAILED
+
+    # The original is public too: drop its EXIF (GPS, camera)
+    body = images.strip_metadata(body)
+    manifest, files = _render_variants(body, blob.key)
+    files[blob.key] = body
+    error = put_files(files)
+    if error is not None:
+        waiting.update(upload_status=UserPhoto.UPLOAD_FAILED, upload_error=str(error)[:500])
+        return UserPhoto.UPLOAD_FAILED
+    MediaBlob.objects.filter(pk=blob.pk).update(uploaded=True, variants=manifest)
+    blob.variants = manifest
+    return _finish_blob(blob)
+
+
+def _finish_blob(blob):
+    """Mark every photo of an uploaded blob as uploaded."""
+    from .models import UserPhoto
+
+    waiting = UserPhoto.objects.filter(blob_id=blob.pk).exclude(upload_status=UserPhoto.UPLOAD_UPLOADED)
+    user_ids = set(waiting.values_list('user_id', flat=True))
+    waiting.update(upload_status=UserPhoto.UPLOAD_UPLOADED, upload_error='', variants=blob.variants)
+    # The photos are visible now
+    profile_cache.invalidate(*user_ids)
+    return UserPhoto.UPLOAD_UPLOADED
+
+
+def delete_blob_objects(sha256, keys):
+    """
+    Delete the S3 objects (original and variants) of a garbage-collected
+    blob, unless the same content has been uploaded again meanwhile.
+    """
+    from .models import MediaBlob
+
+    if MediaBlob.objects.filter(sha256=sha256).exists():
+        return False
+    staged_path(keys[0]).unlink(missing_ok=True)
+    return delete_keys(keys)
+
+
+def build_avatar_variants(profile_id, key, body=None):
+    """
+    Upload the variants of avatar ``key`` (staged bytes unless ``body`` is
+    given) and store the manifest, unless the avatar changed meanwhile.
+    """
+    from .models import Profile
+
+    path = staged_path(key)
+    try:
+        if body is None:
+            body = path.read_bytes()
+        manifest, files = _render_variants(body, key)
+        if not files:
+            return {}
+        error = put_files(files)
+        if error is not None:
+            logger.warning("Avatar variants of %s not uploaded: %s", key, error)
+            return {}
+        if Profile.objects.filter(pk=profile_id, avatar=key).update(avatar_variants=manifest):
+            profile_cache.invalidate(*Profile.objects.filter(pk=profile_id).values_list('user_id', flat=True))
+        return manifest
+    finally:
+        path.unlink(missing_ok=True)
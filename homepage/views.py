@@ -1,5 +1,6 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.models import User
+from .models import UserPhoto
 
 # -------------------------------------------------------------
 # LANDING PAGE — ROOT URL "/"
@@ -13,7 +14,9 @@ def landing_page(request):
 def public_profile(request, username):
     user = get_object_or_404(User, username=username)
     return render(request, "homepage/public_profile.html", {
-        "user_obj": user
+        "user_obj": user,
+        # Photos still on their way to S3 (or failed) have no image to show yet
+        "photos": user.photos.filter(upload_status=UserPhoto.UPLOAD_UPLOADED),
     })
 
 # -------------------------------------------------------------